@@ -1,8 +1,95 @@
 from django.conf import settings
-from django.contrib.auth.models import Group
+from django.contrib.auth.models import Group, User
+from django.db import transaction
 
 from allauth.socialaccount.adapter import DefaultSocialAccountAdapter
 
+from functools import lru_cache
+
+
+def username_from_email(email):
+	"""Return the username of a user with the given school email"""
+	return email[:-(len(settings.EMAIL_DOMAIN)+1)]
+
+
+def default_group_name(username):
+	"""Return the name of the group a new user with `username` belongs to"""
+	if settings.IS_STUDENT_USERNAME(username):
+		return "Studenti"
+	return "Učitelé"
+
+
+@lru_cache(maxsize=None)
+def group_pk(name):
+	"""
+	Return the pk of the group with the given name.
+	The groups are created by a migration and never change, so the lookup
+	is cached for the lifetime of the process.
+	"""
+	return Group.objects.values_list("pk", flat=True).get(name=name)
+
+
+@transaction.atomic
+def sync_roster(rows):
+	"""
+	Create or update users and their group memberships in bulk.
+
+	Every row is a dictionary with the keys `email`, `first_name`, `last_name`
+	and optionally `group` (defaults to `default_group_name`). Existing users
+	(matched by username) get their names and email updated, new users are
+	created without a usable password, so they can only log in through Google.
+	Users are only ever added to groups, never removed.
+
+	Return a tuple `(created, updated, errors)` where errors is a list
+	of `(row number, message)` pairs for the skipped rows.
+	"""
+	entries = {}
+	errors = []
+	for number, row in enumerate(rows, start=1):
+		email = str(row.get("email") or "").strip().lower()
+		if not email.endswith("@" + settings.EMAIL_DOMAIN):
+			errors.append((number, f"email {email} is not in the domain {settings.EMAIL_DOMAIN}"))
+			continue
+
+		username = username_from_email(email)
+		group = str(row.get("group") or "").strip() or default_group_name(username)
+		try:
+			group_pk(group)
+		except Group.DoesNotExist:
+			errors.append((number, f"group {group} does not exist"))
+			continue
+
+		entries[username] = User(
+			username=username,
+			email=email,
+			first_name=str(row.get("first_name") or "").strip(),
+			last_name=str(row.get("last_name") or "").strip(),
+		), group
+
+	existing = User.objects.in_bulk(entries.keys(), field_name="username")
+	to_create = []
+	to_update = []
+	for username, (user, _) in entries.items():
+		current = existing.get(username)
+		if current is None:
+			user.set_unusable_password()
+			to_create.append(user)
+		elif (current.email, current.first_name, current.last_name) != (user.email, user.first_name, user.last_name):
+			current.email, current.first_name, current.last_name = user.email, user.first_name, user.last_name
+			to_update.append(current)
+
+	User.objects.bulk_create(to_create, batch_size=500)
+	User.objects.bulk_update(to_update, ["email", "first_name", "last_name"], batch_size=500)
+
+	pks = dict(User.objects.filter(username__in=entries.keys()).values_list("username", "pk"))
+	Membership = User.groups.through
+	Membership.objects.bulk_create([
+		Membership(user_id=pks[username], group_id=group_pk(group))
+		for username, (_, group) in entries.items()
+	], batch_size=500, ignore_conflicts=True)
+
+	return len(to_create), len(to_update), errors
+
 
 class SubmissionAccountAdapter(DefaultSocialAccountAdapter):
 	"""
@@ -13,21 +100,35 @@ class SubmissionAccountAdapter(DefaultSocialAccountAdapter):
 	def is_open_for_signup(self, request, socialaccount):
 		if not socialaccount.email_addresses:
 			return False
-		return socialaccount.email_addresses[0].email.endswith("@" + settings.EMAIL_DOMAIN)
+		return socialaccount.email_addresses[0].email.lower().endswith("@" + settings.EMAIL_DOMAIN)
+
+	def pre_social_login(self, request, sociallogin):
+		"""
+		Link the social account on the first login of a pre-provisioned user with the same verified email.
+		Never to the accounts of the staff or already linked ones, these are linked by hand in the admin.
+		"""
+		if sociallogin.is_existing or not self.is_open_for_signup(request, sociallogin):
+			return
+
+		address = sociallogin.email_addresses[0]
+		if not address.verified:
+			return
+		email = address.email.lower()
+		user = User.objects.filter(
+			username=username_from_email(email), email=email,
+			is_staff=False, is_superuser=False, socialaccount__isnull=True,
+		).first()
+		if user is not None:
+			sociallogin.connect(request, user)
 
 	def populate_user(self, request, sociallogin, data):
 		user = super().populate_user(request, sociallogin, data)
-		user.username = user.email[:-(len(settings.EMAIL_DOMAIN)+1)]
-		
+		user.email = user.email.lower()  # as in sync_roster
+		user.username = username_from_email(user.email)
+
 		return user
 
 	def save_user(self, request, sociallogin, form):
-		super().save_user(request, sociallogin, form)
-
-		if settings.IS_STUDENT_USERNAME(sociallogin.account.user.username):
-			group = Group.objects.get(name="Studenti")
-		else:
-			group = Group.objects.get(name="Učitelé")
-		group.user_set.add(sociallogin.account.user)
-		group.save()
-		sociallogin.account.user.save()
+		user = super().save_user(request, sociallogin, form)
+		user.groups.add(group_pk(default_group_name(user.username)))
+		return user
@@ -0,0 +1,267 @@
+"""
+Request metrics exposed in the Prometheus text format.
+
+Every process aggregates its metrics in memory. When `settings.METRICS_DIR`
+is set, each process periodically writes a snapshot of its metrics into
+its own file in that directory and the `/metrics` endpoint sums
+the snapshots of all processes, so the numbers are correct even with
+several gunicorn workers. The snapshots of processes which are not
+running anymore are folded into an aggregate file when collecting,
+so the counters do not drop when a worker is recycled. The processes
+are told apart by their PIDs, so the directory must not be shared by
+processes of other hosts or containers. Without `METRICS_DIR` only
+the metrics of the current process are reported.
+"""
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.db import connection
+from django.http import HttpResponse
+
+from bisect import bisect_left
+from collections import defaultdict
+from pathlib import Path
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+DESCRIPTIONS = {
+	"acceptor_requests_total": ("counter", "Number of handled requests"),
+	"acceptor_request_duration_seconds": ("histogram", "Request latency"),
+	"acceptor_db_queries_total": ("counter", "Number of database queries"),
+	"acceptor_db_query_duration_seconds_total": ("counter", "Time spent in database queries"),
+	"acceptor_template_render_seconds": ("histogram", "Template rendering time"),
+	"acceptor_cache_requests_total": ("counter", "Number of cache lookups by result"),
+}
+
+
+class Metrics:
+	"""Thread safe counters and histograms of the current process"""
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.counters = defaultdict(float)
+		self.histograms = {}
+		self.last_flush = 0
+		self.pid = None
+
+	@property
+	def filename(self):
+		# Named by the current process, a forked worker does not overwrite the file of its parent
+		if self.pid != os.getpid():
+			self.pid = os.getpid()
+			self.token = uuid.uuid4().hex[:8]
+		return f"metrics-{self.pid}-{self.token}.json"
+
+	@staticmethod
+	def key(name, labels):
+		return name, tuple(sorted(labels.items()))
+
+	def inc(self, name, value=1, **labels):
+		with self.lock:
+			self.counters[self.key(name, labels)] += value
+
+	def observe(self, name, value, **labels):
+		with self.lock:
+			# One count per bucket, one for +Inf and the sum
+			hist = self.histograms.setdefault(self.key(name, labels), [0] * (len(BUCKETS) + 1) + [0.0])
+			hist[bisect_left(BUCKETS, value)] += 1
+			hist[-1] += value
+
+	def snapshot(self):
+		with self.lock:
+			return {
+				"counters": [[name, labels, value] for (name, labels), value in self.counters.items()],
+				"histograms": [[name, labels, hist[:]] for (name, labels), hist in self.histograms.items()],
+			}
+
+	def flush(self, force=False):
+		"""Write the snapshot of this process into `settings.METRICS_DIR` at most every `METRICS_FLUSH_INTERVAL` seconds"""
+		if not settings.METRICS_DIR:
+			return
+		now = time.monotonic()
+		if not force and now - self.last_flush < settings.METRICS_FLUSH_INTERVAL:
+			return
+		self.last_flush = now
+
+		directory = Path(settings.METRICS_DIR)
+		directory.mkdir(parents=True, exist_ok=True)
+		tmp = directory / f".{self.filename}.tmp"
+		tmp.write_text(json.dumps(self.snapshot()))
+		os.replace(tmp, directory / self.filename)
+
+	def collect(self):
+		"""Return the snapshots of all processes, running and exited, summed together"""
+		if not settings.METRICS_DIR:
+			return merge([self.snapshot()])
+
+		self.flush(force=True)
+		directory = Path(settings.METRICS_DIR)
+		fold_exited(directory)
+		paths = [directory / AGGREGATE, *directory.glob("metrics-*.json")]
+		return merge(snapshot for snapshot in map(read_snapshot, paths) if snapshot is not None)
+
+
+# The summed snapshots of all exited processes, so that the counters never decrease
+AGGREGATE = "aggregate.json"
+
+
+def read_snapshot(path):
+	try:
+		return json.loads(path.read_text())
+	except (OSError, ValueError):
+		return None
+
+
+def merge(snapshots):
+	"""Return the counters and histograms of `snapshots` summed together"""
+	counters = defaultdict(float)
+	histograms = {}
+	for snapshot in snapshots:
+		for name, labels, value in snapshot["counters"]:
+			counters[name, tuple(map(tuple, labels))] += value
+		for name, labels, hist in snapshot["histograms"]:
+			total = histograms.setdefault((name, tuple(map(tuple, labels))), [0] * len(hist))
+			for i, value in enumerate(hist):
+				total[i] += value
+	return counters, histograms
+
+
+def process_exists(pid):
+	try:
+		os.kill(pid, 0)
+	except ProcessLookupError:
+		return False
+	except PermissionError:
+		pass  # a process of another user
+	return True
+
+
+def fold_exited(directory):
+	"""
+		Add the snapshots of the exited processes to the aggregate and remove them,
+		like the multiprocess mode of prometheus_client does with counters and histograms
+		(there are no gauges, which would be dropped instead).
+	"""
+	with open(directory / ".aggregate.lock", "a") as lock:
+		fcntl.flock(lock, fcntl.LOCK_EX)  # released by closing, another process may be folding too
+		exited = [path for path in directory.glob("metrics-*.json") if not process_exists(int(path.name.split("-")[1]))]
+		if not exited:
+			return
+
+		snapshots = map(read_snapshot, [directory / AGGREGATE, *exited])
+		counters, histograms = merge(snapshot for snapshot in snapshots if snapshot is not None)
+		tmp = directory / f".{AGGREGATE}.tmp"
+		tmp.write_text(json.dumps({
+			"counters": [[name, labels, value] for (name, labels), value in counters.items()],
+			"histograms": [[name, labels, hist] for (name, labels), hist in histograms.items()],
+		}))
+		os.replace(tmp, directory / AGGREGATE)
+		for path in exited:
+			path.unlink(missing_ok=True)
+
+
+registry = Metrics()
+atexit.register(registry.flush, force=True)  # the last counts of the process end up in the aggregate
+
+
+def record_cache(cache, hit):
+	"""Record a cache lookup of the cache (or a part of the application) named `cache`"""
+	registry.inc("acceptor_cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+
+def escape_label(value):
+	return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels, **extra):
+	pairs = list(labels) + list(extra.items())
+	if not pairs:
+		return ""
+	return "{" + ",".join(f'{k}="{escape_label(v)}"' for k, v in pairs) + "}"
+
+
+def render(counters, histograms):
+	"""Render the metrics in the Prometheus text exposition format"""
+	lines = []
+	for name, (kind, description) in DESCRIPTIONS.items():
+		lines.append(f"# HELP {name} {description}")
+		lines.append(f"# TYPE {name} {kind}")
+		if kind == "counter":
+			for (metric, labels), value in sorted(counters.items()):
+				if metric == name:
+					lines.append(f"{name}{format_labels(labels)} {value:g}")
+		else:
+			for (metric, labels), hist in sorted(histograms.items()):
+				if metric != name:
+					continue
+				cumulative = 0
+				for le, count in zip(list(map(str, BUCKETS)) + ["+Inf"], hist[:-1]):
+					cumulative += count
+					lines.append(f"{name}_bucket{format_labels(labels, le=le)} {cumulative:g}")
+				lines.append(f"{name}_sum{format_labels(labels)} {hist[-1]:g}")
+				lines.append(f"{name}_count{format_labels(labels)} {cumulative:g}")
+	return "\n".join(lines) + "\n"
+
+
+def view_name(request):
+	"""Return the URL name of the view handling `request`"""
+	match = getattr(request, "resolver_match", None)
+	return (match.view_name if match else None) or "<unresolved>"
+
+
+def metrics_view(request):
+	"""The metrics of all processes in the Prometheus text format, only for staff"""
+	if not request.user.is_staff:
+		raise PermissionDenied
+	return HttpResponse(render(*registry.collect()), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class MetricsMiddleware:
+	"""
+	Record the latency, database queries, template rendering time
+	and the response status of every request, labelled by the URL name.
+	"""
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+
+	def __call__(self, request):
+		queries = [0, 0.0]
+
+		def count_queries(execute, sql, params, many, context):
+			start = time.perf_counter()
+			try:
+				return execute(sql, params, many, context)
+			finally:
+				queries[0] += 1
+				queries[1] += time.perf_counter() - start
+
+		start = time.perf_counter()
+		with connection.execute_wrapper(count_queries):
+			response = self.get_response(request)
+		duration = time.perf_counter() - start
+
+		view = view_name(request)
+		registry.inc("acceptor_requests_total", view=view, method=request.method, status=str(response.status_code))
+		registry.observe("acceptor_request_duration_seconds", duration, view=view)
+		registry.inc("acceptor_db_queries_total", queries[0], view=view)
+		registry.inc("acceptor_db_query_duration_seconds_total", queries[1], view=view)
+		registry.flush()
+
+		return response
+
+	def process_template_response(self, request, response):
+		start = time.perf_counter()
+
+		def rendered(response):
+			registry.observe("acceptor_template_render_seconds", time.perf_counter() - start, view=view_name(request))
+
+		response.add_post_render_callback(rendered)
+		return response
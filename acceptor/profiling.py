@@ -0,0 +1,94 @@
+"""
+On-demand profiling of single requests.
+
+A staff member can profile any request by adding `?profile=1` to its URL
+or sending the `X-Profile: 1` header. The request then runs under cProfile
+and the profile is saved into `settings.PROFILE_DIR`, where it can be
+browsed as sorted statistics in the admin (`/admin/profiles/`) or downloaded
+for a flame graph viewer such as snakeviz. Other requests only pay for
+a single dictionary lookup.
+"""
+from django.conf import settings
+from django.http import FileResponse, Http404
+from django.shortcuts import render
+from django.utils import timezone
+
+from pathlib import Path
+import cProfile
+import io
+import pstats
+import re
+import uuid
+
+
+SORT_KEYS = ["cumulative", "tottime", "ncalls"]
+NAME_RE = re.compile(r"^[\w.-]+\.prof$")
+
+
+def profile_dir():
+	return Path(settings.PROFILE_DIR)
+
+
+class ProfilingMiddleware:
+	"""Profile the request when asked to by a staff member, must be placed after AuthenticationMiddleware"""
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+
+	def __call__(self, request):
+		if not (request.GET.get("profile") or request.headers.get("X-Profile")) or not request.user.is_staff:
+			return self.get_response(request)
+
+		profiler = cProfile.Profile()
+		profiler.enable()
+		try:
+			response = self.get_response(request)
+		finally:
+			profiler.disable()
+
+		match = request.resolver_match
+		view = re.sub(r"[^\w-]", "_", match.view_name if match else "unresolved")
+		name = f"{timezone.now():%Y%m%d-%H%M%S}-{view}-{uuid.uuid4().hex[:8]}.prof"
+		profile_dir().mkdir(parents=True, exist_ok=True)
+		profiler.dump_stats(profile_dir() / name)
+
+		response["X-Profile-Id"] = name
+		return response
+
+
+def profile_list(request):
+	"""A list of the saved profiles, only accessible through the admin site"""
+	profiles = sorted(profile_dir().glob("*.prof"), reverse=True) if profile_dir().exists() else []
+	return render(request, "admin/profiles.html", {
+		"title": "Profily požadavků",
+		"profiles": [p.name for p in profiles],
+	})
+
+
+def profile_detail(request, name):
+	"""Sorted statistics of a single profile, or the raw profile with `?download=1`"""
+	path = profile_dir() / name
+	if not NAME_RE.match(name) or not path.exists():
+		raise Http404
+
+	if request.GET.get("download"):
+		return FileResponse(open(path, "rb"), as_attachment=True, filename=name)
+
+	sort = request.GET.get("sort")
+	if sort not in SORT_KEYS:
+		sort = SORT_KEYS[0]
+
+	limit = request.GET.get("limit", "")
+	limit = int(limit) if limit.isdigit() else 100
+
+	out = io.StringIO()
+	stats = pstats.Stats(str(path), stream=out)
+	stats.strip_dirs().sort_stats(sort).print_stats(limit)
+
+	return render(request, "admin/profile_detail.html", {
+		"title": name,
+		"name": name,
+		"sort": sort,
+		"sort_keys": SORT_KEYS,
+		"stats": out.getvalue(),
+	})
@@ -0,0 +1,28 @@
+"""
+Named django-q task queues.
+
+Every queue of `settings.TASK_QUEUES` is served by its own cluster
+(`TASK_QUEUE=<name> manage.py qcluster`) with its own number of workers,
+timeout and retry policy, so that slow document processing or nightly
+maintenance never delays emails. Tasks are routed into a queue by the
+`queue` argument of `tracing.async_task`, scheduled tasks by the
+`cluster` of their schedule (see the `setschedule` command).
+"""
+from django.conf import settings
+from django_q.brokers import get_broker
+
+from functools import lru_cache
+
+
+DEFAULT = "default"
+EMAIL = "email"
+DOCUMENTS = "documents"
+MAINTENANCE = "maintenance"
+
+
+@lru_cache(maxsize=None)
+def broker(name):
+	"""Return the broker enqueueing tasks into the queue `name`"""
+	if name not in settings.TASK_QUEUES:
+		raise ValueError(f"Unknown task queue {name}.")
+	return get_broker(name)
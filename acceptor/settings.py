@@ -60,11 +60,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'acceptor.tracing.TracingMiddleware',
+    'acceptor.metrics.MetricsMiddleware',
+    'acceptor.slowqueries.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'acceptor.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -112,15 +116,27 @@ else:
         }
     }
 
-# Task queue
-# used for running scheduled tasks
+# Task queues
+# every queue is served by its own cluster, started by `TASK_QUEUE=<name> manage.py qcluster` (see acceptor.queues)
+
+TASK_QUEUES = {
+    # everything not routed elsewhere
+    "default": {"workers": 2, "timeout": 60, "retry": 90, "max_attempts": 2},
+    # short tasks sending emails, retried a few times when the SMTP server fails
+    "email": {"workers": 2, "timeout": 30, "retry": 60, "max_attempts": 5},
+    # rendering and processing of documents, slow but not urgent
+    "documents": {"workers": 1, "timeout": 600, "retry": 900, "max_attempts": 2},
+    # periodic batch jobs over the whole database
+    "maintenance": {"workers": 1, "timeout": 3600, "retry": 4000, "max_attempts": 1},
+}
+
+TASK_QUEUE = os.environ.get("TASK_QUEUE", "default")
 
 Q_CLUSTER = {
-    "name": "default",
+    "name": TASK_QUEUE,
     "orm": "default",
     "label": "Úlohy ve frontě",
-    "timeout": 60,
-    "max_attempts": 2,
+    **TASK_QUEUES[TASK_QUEUE],
 }
 
 
@@ -225,7 +241,57 @@ EMAIL_DOMAIN = "gjk.cz"
 IS_STUDENT_USERNAME = lambda username: username.startswith("x") and username[-1].isdigit()
 USE_UNACCENT = False
 
+AUTOCOMPLETE_CACHE_TIMEOUT = 60
+
+# Read-only JSON API (see submissions.api)
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+API_CACHE_MAX_AGE = 60
+
+# OAI-PMH provider of the public archive (see submissions.oai)
+OAI_REPOSITORY_NAME = "Archiv maturitních prací"
+OAI_PAGE_SIZE = 100
+
+# Text extraction of file attachments for the full-text search (see submissions.extraction),
+# larger files are skipped, slower extractions are killed, longer texts are cut off
+EXTRACTION_MAX_SIZE = 50 * 1024 * 1024
+EXTRACTION_TIMEOUT = 120
+EXTRACTION_MAX_LENGTH = 1_000_000
+
+# Near-duplicate detection (see submissions.similarity): theses of the past years with
+# an estimated similarity of at least SIMILARITY_THRESHOLD are reported, the most similar first
+SIMILARITY_THRESHOLD = 0.3
+SIMILARITY_RESULTS = 5
+SIMILARITY_MAX_CANDIDATES = 500
+
+# Directory shared by all worker processes for the snapshots of their metrics,
+# when not set, /metrics only reports the metrics of the process serving it
+METRICS_DIR = os.environ.get("METRICS_DIR")
+METRICS_FLUSH_INTERVAL = 5
+
+# Queries slower than this are logged (see acceptor.slowqueries), None turns the log off
+SLOW_QUERY_THRESHOLD_MS = float(os.environ["SLOW_QUERY_THRESHOLD_MS"]) if os.environ.get("SLOW_QUERY_THRESHOLD_MS") else None
+SLOW_QUERY_EXPLAIN_RATE = 0.1
+
+# Profiles of requests made with ?profile=1 by staff (see acceptor.profiling)
+PROFILE_DIR = BASE_DIR / "profiles/"
+
+# Exported traces (see acceptor.tracing), tracing is disabled when neither is set
+TRACE_FILE = os.environ.get("TRACE_FILE")
+TRACE_ENDPOINT = os.environ.get("TRACE_ENDPOINT")
+TRACE_SERVICE_NAME = "acceptor"
+
+# Static copies of the public archive served by nginx (see submissions.publish), None turns publishing off
+PUBLISH_ROOT = os.environ.get("PUBLISH_ROOT")
+
 CONSULTATION_EMAIL_DAYS_LEFT = 7
 CONSULTATION_EMAIL_SUBJECT = f"{EMAIL_SUBJECT_PREFIX}Povinné konzultace"
 
+# Notifications about state changes and opinions are collected and sent in digests this often
+NOTIFICATION_DIGEST_MINUTES = 60
+NOTIFICATION_EMAIL_SUBJECT = f"{EMAIL_SUBJECT_PREFIX}Změny vašich prací"
+
 ADMINS = [("Lukáš Veškrna", "lukas.veskrna@gmail.com")]
+
+# The contact published by the OAI-PMH provider
+OAI_ADMIN_EMAIL = os.environ.get("OAI_ADMIN_EMAIL", ADMINS[0][1])
@@ -0,0 +1,136 @@
+"""
+Opt-in log of slow database queries.
+
+Queries of requests and tasks (see `tracing.run_traced`) slower than
+`settings.SLOW_QUERY_THRESHOLD_MS` are stored as
+`submissions.models.SlowQuery` together with the view or task and the
+line of the application which executed them. Only the parameterized
+SQL is stored, never the values of the parameters, which may contain
+personal data. For a `SLOW_QUERY_EXPLAIN_RATE`
+fraction of them the query plan is captured as well, using
+`EXPLAIN (ANALYZE, BUFFERS)` on PostgreSQL and `EXPLAIN QUERY PLAN`
+on SQLite. The log is viewable in the admin.
+"""
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connection, transaction
+
+from contextlib import contextmanager
+from pathlib import Path
+import random
+import time
+import traceback
+
+
+EXPLAIN_PREFIXES = {
+	"postgresql": "EXPLAIN (ANALYZE, BUFFERS) ",
+	"sqlite": "EXPLAIN QUERY PLAN ",
+}
+
+
+# Modules with execute wrappers, which are never the origin of a query
+INSTRUMENTATION_MODULES = {"acceptor/metrics.py", "acceptor/slowqueries.py", "acceptor/tracing.py"}
+
+
+def call_site():
+	"""Return the innermost frame of the application code (outside of the instrumentation and libraries)"""
+	base = str(settings.BASE_DIR)
+	for frame in reversed(traceback.extract_stack()):
+		if not frame.filename.startswith(base) or "site-packages" in frame.filename:
+			continue
+		path = Path(frame.filename).relative_to(base).as_posix()
+		if path not in INSTRUMENTATION_MODULES:
+			return f"{path}:{frame.lineno} ({frame.name})"
+	return "<unknown>"
+
+
+class SlowQueryRecorder:
+	"""An execute wrapper collecting the slow queries of one connection"""
+
+	def __init__(self, view, threshold, explain_rate):
+		self.view = view
+		self.threshold = threshold
+		self.explain_rate = explain_rate
+		self.records = []
+		self.explaining = False
+
+	def __call__(self, execute, sql, params, many, context):
+		if self.explaining:
+			return execute(sql, params, many, context)
+
+		start = time.perf_counter()
+		result = execute(sql, params, many, context)
+		duration = (time.perf_counter() - start) * 1000
+
+		if duration >= self.threshold:
+			plan = ""
+			if not many and sql.lstrip()[:6].upper() == "SELECT" and random.random() < self.explain_rate:
+				plan = self.explain(context["connection"], sql, params)
+			self.records.append(dict(
+				view=self.view[:255],
+				call_site=call_site()[:255],
+				sql=sql,
+				duration=duration,
+				plan=plan,
+			))
+		return result
+
+	def explain(self, conn, sql, params):
+		prefix = EXPLAIN_PREFIXES.get(conn.vendor)
+		if prefix is None:
+			return ""
+
+		self.explaining = True
+		try:
+			# A savepoint, so that a failed EXPLAIN does not break the current transaction
+			with transaction.atomic(using=conn.alias), conn.cursor() as cursor:
+				cursor.execute(prefix + sql, params)
+				return "\n".join(" ".join(map(str, row)) for row in cursor.fetchall())
+		except DatabaseError as e:
+			return f"EXPLAIN failed: {e}"
+		finally:
+			self.explaining = False
+
+	def save(self):
+		from submissions.models import SlowQuery
+
+		if self.records:
+			SlowQuery.objects.bulk_create([SlowQuery(**record) for record in self.records])
+			self.records = []
+
+
+@contextmanager
+def record_slow_queries(view):
+	"""Log the slow queries executed inside the block, usable also outside of requests (e.g. in tasks)"""
+	if settings.SLOW_QUERY_THRESHOLD_MS is None:
+		yield
+		return
+
+	recorder = SlowQueryRecorder(view, settings.SLOW_QUERY_THRESHOLD_MS, settings.SLOW_QUERY_EXPLAIN_RATE)
+	try:
+		with connection.execute_wrapper(recorder):
+			yield
+	finally:
+		recorder.save()
+
+
+class SlowQueryMiddleware:
+	"""Log the slow queries of every request, removed when `SLOW_QUERY_THRESHOLD_MS` is not set"""
+
+	def __init__(self, get_response):
+		if settings.SLOW_QUERY_THRESHOLD_MS is None:
+			raise MiddlewareNotUsed
+		self.get_response = get_response
+
+	def __call__(self, request):
+		recorder = SlowQueryRecorder(request.path, settings.SLOW_QUERY_THRESHOLD_MS, settings.SLOW_QUERY_EXPLAIN_RATE)
+		with connection.execute_wrapper(recorder):
+			response = self.get_response(request)
+
+		match = getattr(request, "resolver_match", None)
+		if match:
+			for record in recorder.records:
+				record["view"] = match.view_name[:255]
+		recorder.save()
+
+		return response
@@ -0,0 +1,247 @@
+"""
+Lightweight request tracing.
+
+Stages of a request (the view, database queries, template rendering,
+HTML sanitization, sending emails) are wrapped in spans. The trace id
+of a request is passed to the django-q tasks it enqueues using
+`tracing.async_task`, so the spans of a task belong to the trace of the
+request that started it. Tasks enqueued outside of a trace start their own.
+Incoming W3C `traceparent` headers are respected.
+
+Finished traces are exported in the OTLP/JSON format by a background thread,
+one export request per line into `settings.TRACE_FILE` and/or POSTed to
+an OTLP/HTTP collector at `settings.TRACE_ENDPOINT`. When neither
+is set, tracing is disabled and spans cost a single settings lookup.
+"""
+from django.conf import settings
+from django.db import connection
+from django_q.tasks import async_task as q_async_task
+
+from . import queues
+from .slowqueries import record_slow_queries
+
+from contextlib import contextmanager
+from importlib import import_module
+import contextvars
+import json
+import logging
+import queue
+import re
+import secrets
+import threading
+import time
+import urllib.request
+
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+_current = contextvars.ContextVar("tracing_span", default=None)
+
+
+def enabled():
+	return bool(settings.TRACE_FILE or settings.TRACE_ENDPOINT)
+
+
+class Span:
+	def __init__(self, name, trace_id, parent_id, trace, attributes, is_local_root):
+		self.name = name
+		self.trace_id = trace_id
+		self.span_id = secrets.token_hex(8)
+		self.parent_id = parent_id
+		self.trace = trace  # finished spans of the trace, shared by all its local spans
+		self.attributes = attributes
+		self.is_local_root = is_local_root  # the trace is exported when it ends
+		self.start = time.time_ns()
+		self.end = None
+		self.error = None
+
+	def to_otlp(self):
+		span = {
+			"traceId": self.trace_id,
+			"spanId": self.span_id,
+			"name": self.name,
+			"kind": 1,
+			"startTimeUnixNano": str(self.start),
+			"endTimeUnixNano": str(self.end),
+			"attributes": [{"key": k, "value": {"stringValue": str(v)}} for k, v in self.attributes.items()],
+			"status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+		}
+		if self.parent_id:
+			span["parentSpanId"] = self.parent_id
+		return span
+
+
+def current_context():
+	"""Return the `(trace id, span id)` of the current span or None"""
+	span = _current.get()
+	if span is None:
+		return None
+	return span.trace_id, span.span_id
+
+
+def start_span(name, context=None, **attributes):
+	"""
+	Start a span as a child of the current span, or of the remote span `context`
+	(a `(trace id, span id)` pair), or as the root of a new trace.
+	Return a handle for `end_span` or None when tracing is disabled.
+	"""
+	if not enabled():
+		return None
+
+	parent = _current.get()
+	if context is not None:
+		new = Span(name, context[0], context[1], [], attributes, True)
+	elif parent is not None:
+		new = Span(name, parent.trace_id, parent.span_id, parent.trace, attributes, False)
+	else:
+		new = Span(name, secrets.token_hex(16), None, [], attributes, True)
+	return new, _current.set(new)
+
+
+def end_span(handle, error=None):
+	if handle is None:
+		return
+	span, token = handle
+	span.end = time.time_ns()
+	span.error = error
+	span.trace.append(span)
+	try:
+		_current.reset(token)
+	except ValueError:
+		_current.set(None)  # ended in a different context (e.g. a template render callback)
+	if span.is_local_root:
+		exporter.submit(span.trace)
+
+
+@contextmanager
+def span(name, **attributes):
+	"""Wrap a block of code in a span"""
+	handle = start_span(name, **attributes)
+	try:
+		yield
+	except Exception as e:
+		end_span(handle, error=repr(e))
+		raise
+	else:
+		end_span(handle)
+
+
+class Exporter:
+	"""Exports finished traces from a background thread"""
+
+	def __init__(self):
+		self.queue = queue.Queue()
+		self.thread = None
+		self.lock = threading.Lock()
+
+	def submit(self, spans):
+		with self.lock:
+			if self.thread is None or not self.thread.is_alive():
+				self.thread = threading.Thread(target=self.run, name="trace-exporter", daemon=True)
+				self.thread.start()
+		self.queue.put(spans)
+
+	def flush(self):
+		"""Wait until all submitted traces are exported"""
+		self.queue.join()
+
+	def run(self):
+		while True:
+			spans = self.queue.get()
+			try:
+				self.export(spans)
+			except Exception:
+				logger.exception("Could not export a trace")
+			finally:
+				self.queue.task_done()
+
+	def export(self, spans):
+		payload = json.dumps({"resourceSpans": [{
+			"resource": {"attributes": [{"key": "service.name", "value": {"stringValue": settings.TRACE_SERVICE_NAME}}]},
+			"scopeSpans": [{"scope": {"name": "acceptor.tracing"}, "spans": [s.to_otlp() for s in spans]}],
+		}]})
+
+		if settings.TRACE_FILE:
+			with open(settings.TRACE_FILE, "a") as f:
+				f.write(payload + "\n")
+		if settings.TRACE_ENDPOINT:
+			request = urllib.request.Request(
+				settings.TRACE_ENDPOINT, data=payload.encode(),
+				headers={"Content-Type": "application/json"}, method="POST",
+			)
+			with urllib.request.urlopen(request, timeout=5) as res:
+				res.read()
+
+
+exporter = Exporter()
+
+
+def async_task(func, *args, queue=None, **kwargs):
+	"""
+		`django_q.tasks.async_task`, which runs the task in the trace of the current span,
+		in the task queue `queue` (see `acceptor.queues`, the default one when not given)
+	"""
+	if queue is not None:
+		kwargs["broker"] = queues.broker(queue)
+	return q_async_task("acceptor.tracing.run_traced", current_context(), func, *args, **kwargs)
+
+
+def run_traced(context, func, *args, **kwargs):
+	"""
+		Run the task `func` (a dotted path) in a span continuing the trace `context`
+		(a new trace when None), logging its slow queries (see `acceptor.slowqueries`)
+	"""
+	module, name = func.rsplit(".", 1)
+	with (
+		span(f"task {func}", context=tuple(context) if context else None),
+		connection.execute_wrapper(trace_query),
+		record_slow_queries(f"task {func}"),
+	):
+		return getattr(import_module(module), name)(*args, **kwargs)
+
+
+def trace_query(execute, sql, params, many, context):
+	with span("db", **{"db.statement": sql[:1000], "db.system": connection.vendor}):
+		return execute(sql, params, many, context)
+
+
+class TracingMiddleware:
+	"""Wrap the request, its queries and template rendering in spans"""
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+
+	def __call__(self, request):
+		if not enabled():
+			return self.get_response(request)
+
+		context = None
+		match = TRACEPARENT_RE.match(request.headers.get("traceparent", ""))
+		if match:
+			context = match.groups()
+
+		handle = start_span(f"{request.method} {request.path}", context=context, **{"http.method": request.method, "http.target": request.path})
+		try:
+			with connection.execute_wrapper(trace_query):
+				response = self.get_response(request)
+		except Exception as e:
+			end_span(handle, error=repr(e))
+			raise
+
+		span = handle[0]
+		if request.resolver_match:
+			span.attributes["view"] = request.resolver_match.view_name
+		span.attributes["http.status_code"] = response.status_code
+		response["traceparent"] = f"00-{span.trace_id}-{span.span_id}-01"
+		end_span(handle)
+		return response
+
+	def process_template_response(self, request, response):
+		if not enabled():
+			return response
+
+		handle = start_span("template.render", template=response.template_name)
+		response.add_post_render_callback(lambda response: end_span(handle))
+		return response
@@ -16,8 +16,13 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from . import metrics, profiling
+
 urlpatterns = [
+    path('admin/profiles/', admin.site.admin_view(profiling.profile_list), name="profile-list"),
+    path('admin/profiles/<str:name>', admin.site.admin_view(profiling.profile_detail), name="profile-detail"),
     path('admin/', admin.site.urls),
+    path('metrics', metrics.metrics_view, name="metrics"),
 
     path('auth/', include('django.contrib.auth.urls')),
     path('auth/', include('allauth.urls'), name="socialaccount_signup"),
@@ -1,5 +1,12 @@
 from django.contrib import admin
+from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.db.models import Q
+from django.forms.models import BaseInlineFormSet
+from django.urls import reverse
+from django.utils.html import format_html
+
 from . import models
+from .utils import normalize, prefix_filter
 
 
 class ConsultationPeriodInline(admin.TabularInline):
@@ -10,12 +17,48 @@ class ConsultationPeriodInline(admin.TabularInline):
 class SubjectAdmin(admin.ModelAdmin):
     model = models.Subject
 
+    # Prefixes only, answered by the index of UPPER(title) (see migration 0016)
+    search_fields = ("^title",)
+    ordering = ("title",)
     inlines = [ConsultationPeriodInline]
 
 
+class UserAdmin(BaseUserAdmin):
+    # Prefixes only, answered by the indexes of UPPER(username) and UPPER(last_name)
+    # (see migration 0016), also for the autocomplete of authors, supervisors and opponents
+    search_fields = ("^username", "^last_name")
+
+
+class KeywordAdmin(admin.ModelAdmin):
+    model = models.Keyword
+
+    search_fields = ("title",)
+    ordering = ("title",)
+
+    def get_search_results(self, request, queryset, search_term):
+        # A prefix match on the normalized title, which can use its index
+        return queryset.filter(prefix_filter("normalized", normalize(search_term.strip()))), False
+
+
+LOG_ENTRY_INLINE_LIMIT = 20
+
+
+class LatestLogEntryFormSet(BaseInlineFormSet):
+    """Only the latest `LOG_ENTRY_INLINE_LIMIT` entries, the whole history is linked from the thesis"""
+
+    def get_queryset(self):
+        if not hasattr(self, "_queryset"):
+            qs = super().get_queryset()
+            latest = list(qs.order_by("-timestamp").values_list("pk", flat=True)[:LOG_ENTRY_INLINE_LIMIT])
+            self._queryset = qs.filter(pk__in=latest)
+        return self._queryset
+
+
 class LogEntryInline(admin.TabularInline):
     model = models.LogEntry
+    formset = LatestLogEntryFormSet
     readonly_fields = ("timestamp",)
+    autocomplete_fields = ("user",)
     ordering = ("timestamp",)
     extra = 0
 
@@ -28,13 +71,112 @@ class ConsultationInline(admin.TabularInline):
 class ThesisAdmin(admin.ModelAdmin):
     model = models.Thesis
 
-    readonly_fields = ("state",)
-    filter_horizontal = ("keywords",)
+    list_display = ("title", "author", "supervisor", "year", "subject_title", "current_state")
+    list_select_related = ("author", "supervisor", "subject", "current_state")
+    list_filter = ("year", "current_state", ("subject", admin.RelatedOnlyFieldListFilter))
+    search_fields = ("title",)
+    ordering = ("-year", "title")
+    show_full_result_count = False
+
+    readonly_fields = ("state", "history")
+    autocomplete_fields = ("author", "supervisor", "opponent", "subject", "keywords")
 
     inlines = [ConsultationInline, LogEntryInline]
 
+    def get_search_results(self, request, queryset, search_term):
+        # A prefix of the title (using the index of the normalized title) or an exact username
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        return queryset.filter(
+            prefix_filter("normalized_title", normalize(term))
+            | Q(author__username=term)
+            | Q(supervisor__username=term)
+            | Q(opponent__username=term)
+        ), False
+
+    @admin.display(description="Předmět", ordering="subject__title")
+    def subject_title(self, obj):
+        return obj.subject.title
+
+    @admin.display(description="Historie stavů")
+    def history(self, obj):
+        if obj.pk is None:
+            return "-"
+        url = reverse("admin:submissions_logentry_changelist") + f"?thesis__id__exact={obj.pk}"
+        return format_html('<a href="{}">Všechny záznamy ({})</a>', url, obj.log_entries.count())
+
+
+class LogEntryAdmin(admin.ModelAdmin):
+    model = models.LogEntry
+
+    list_display = ("timestamp", "thesis", "state", "user")
+    list_select_related = ("thesis__author", "state", "user")
+    list_filter = ("state",)
+    ordering = ("-timestamp",)
+    autocomplete_fields = ("thesis", "user")
+    show_full_result_count = False
+
+
+class SlowQueryAdmin(admin.ModelAdmin):
+    model = models.SlowQuery
+
+    list_display = ("timestamp", "view", "duration", "call_site")
+    list_filter = ("view",)
+    search_fields = ("sql", "call_site")
+    ordering = ("-timestamp",)
+    readonly_fields = ("timestamp", "view", "call_site", "sql", "duration", "plan")
+
+    def has_add_permission(self, request):
+        return False
+
+
+class ArchivedLogEntryAdmin(admin.ModelAdmin):
+    model = models.ArchivedLogEntry
+
+    list_display = ("thesis", "state", "user", "timestamp", "archived")
+    list_filter = ("state",)
+    ordering = ("-timestamp",)
+    readonly_fields = ("thesis", "state", "user", "timestamp", "archived")
+
+    def has_add_permission(self, request):
+        return False
+
+
+class ChangeEventAdmin(admin.ModelAdmin):
+    model = models.ChangeEvent
+
+    list_display = ("timestamp", "sequence", "thesis_id", "kind", "state", "fields")
+    list_filter = ("kind",)
+    search_fields = ("=thesis_id",)
+    ordering = ("-timestamp", "-id")
+    readonly_fields = ("timestamp", "sequence", "thesis_id", "kind", "state", "fields")
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+
+class FileTextAdmin(admin.ModelAdmin):
+    model = models.FileText
+
+    list_display = ("file", "status", "extracted")
+    list_filter = ("status",)
+    ordering = ("-extracted",)
+    readonly_fields = ("file", "digest", "status", "text", "extracted")
+
+    def has_add_permission(self, request):
+        return False
+
 
+admin.site.unregister(models.User)
+admin.site.register(models.User, UserAdmin)
 admin.site.register(models.State)
 admin.site.register(models.Thesis, ThesisAdmin)
 admin.site.register(models.Subject, SubjectAdmin)
-admin.site.register(models.Keyword)
+admin.site.register(models.Keyword, KeywordAdmin)
+admin.site.register(models.LogEntry, LogEntryAdmin)
+admin.site.register(models.SlowQuery, SlowQueryAdmin)
+admin.site.register(models.ArchivedLogEntry, ArchivedLogEntryAdmin)
+admin.site.register(models.ChangeEvent, ChangeEventAdmin)
+admin.site.register(models.FileText, FileTextAdmin)
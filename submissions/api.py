@@ -0,0 +1,201 @@
+"""
+Read-only JSON API over the public archive, version 1.
+
+Every list is paginated by keyset (`?after=<id of the last item>`,
+`?limit=`), the `next` link of a page points to the following one.
+Theses return only the fields selected by `?fields=a,b,c` (all by
+default) and only the columns and relations needed by them are loaded,
+so a page costs a constant number of queries. Every response carries
+an ETag of its content, conditional requests are answered by 304.
+"""
+from django.conf import settings
+from django.core.exceptions import BadRequest, PermissionDenied, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_GET
+
+from . import feed
+from .models import Thesis, Keyword, Subject
+
+from collections import namedtuple
+from functools import wraps
+import hashlib
+import json
+
+
+def api_view(public=True):
+	"""
+		Serialize the data returned by the view as JSON with an ETag, errors are returned as JSON too.
+		Responses of views which are not `public` are not cached by shared caches.
+	"""
+	def decorator(view):
+		@require_GET
+		@wraps(view)
+		def wrapper(request, *args, **kwargs):
+			try:
+				data = view(request, *args, **kwargs)
+			except BadRequest as e:
+				return JsonResponse({"error": str(e)}, status=400)
+			except PermissionDenied:
+				return JsonResponse({"error": "Permission denied."}, status=403)
+			except Http404:
+				return JsonResponse({"error": "Not found."}, status=404)
+			return json_response(request, data, public)
+		return wrapper
+	return decorator
+
+
+def json_response(request, data, public=True):
+	content = json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False).encode()
+	etag = f'"{hashlib.md5(content).hexdigest()}"'
+
+	response = get_conditional_response(request, etag=etag)
+	if response is None:
+		response = HttpResponse(content, content_type="application/json")
+	response["ETag"] = etag
+	if public:
+		patch_cache_control(response, public=True, max_age=settings.API_CACHE_MAX_AGE)
+	else:
+		patch_cache_control(response, private=True, no_cache=True)
+	return response
+
+
+def page(request, queryset, serialize, parse_pk=str):
+	"""Return a page of `queryset` ordered by the primary key with the link to the next one"""
+	try:
+		limit = min(int(request.GET.get("limit", settings.API_PAGE_SIZE)), settings.API_MAX_PAGE_SIZE)
+	except ValueError:
+		raise BadRequest("Invalid limit.")
+	if limit < 1:
+		raise BadRequest("Invalid limit.")
+
+	after = request.GET.get("after")
+	if after:
+		try:
+			queryset = queryset.filter(pk__gt=parse_pk(after))
+		except (ValueError, ValidationError):
+			raise BadRequest("Invalid cursor.")
+
+	items = list(queryset.order_by("pk")[:limit + 1])
+	next_url = None
+	if len(items) > limit:
+		items = items[:limit]
+		params = request.GET.copy()
+		params["after"] = str(items[-1].pk)
+		next_url = request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+
+	return {"results": [serialize(item) for item in items], "next": next_url}
+
+
+# columns: loaded columns of the thesis, related: select_related, prefetch: prefetch_related
+Field = namedtuple("Field", ["columns", "related", "prefetch", "value"])
+
+
+def person(user):
+	return user.get_full_name() if user else None
+
+
+THESIS_FIELDS = {
+	"id": Field([], [], [], lambda thesis: str(thesis.pk)),
+	"url": Field([], [], [], lambda thesis: thesis.get_absolute_url()),
+	"title": Field(["title"], [], [], lambda thesis: thesis.title),
+	"abstract": Field(["abstract"], [], [], lambda thesis: thesis.abstract),
+	"year": Field(["year"], [], [], lambda thesis: thesis.year),
+	"subject": Field(["subject"], [], [], lambda thesis: thesis.subject_id),
+	"state": Field(["current_state"], [], [], lambda thesis: thesis.current_state_id),
+	"author": Field(["author"], ["author"], [], lambda thesis: person(thesis.author)),
+	"supervisor": Field(["supervisor"], ["supervisor"], [], lambda thesis: person(thesis.supervisor)),
+	"opponent": Field(["opponent"], ["opponent"], [], lambda thesis: person(thesis.opponent)),
+	"keywords": Field([], [], [Prefetch("keywords", Keyword.objects.only("title"))], lambda thesis: [keyword.title for keyword in thesis.keywords.all()]),
+	"supervisor_opinion": Field(["supervisor_opinion"], [], [], lambda thesis: thesis.supervisor_opinion),
+	"opponent_opinion": Field(["opponent_opinion"], [], [], lambda thesis: thesis.opponent_opinion),
+}
+
+
+def selected_fields(request):
+	"""Return the names of the thesis fields selected by `?fields=`"""
+	names = request.GET.get("fields")
+	if not names:
+		return list(THESIS_FIELDS)
+
+	names = [name.strip() for name in names.split(",") if name.strip()]
+	unknown = [name for name in names if name not in THESIS_FIELDS]
+	if unknown:
+		raise BadRequest(f"Unknown fields: {', '.join(unknown)}.")
+	return names
+
+
+def theses_queryset(names):
+	"""Public theses loading only what is needed by the fields `names`"""
+	fields = [THESIS_FIELDS[name] for name in names]
+	return (Thesis.public
+		.only("pk", *(column for field in fields for column in field.columns))
+		.select_related(*(related for field in fields for related in field.related))
+		.prefetch_related(*(prefetch for field in fields for prefetch in field.prefetch)))
+
+
+def thesis_serializer(names):
+	fields = [(name, THESIS_FIELDS[name].value) for name in names]
+	return lambda thesis: {name: value(thesis) for name, value in fields}
+
+
+@api_view()
+def thesis_list(request):
+	"""Public theses, filtered by `?year=` and `?subject=` (including its descendants)"""
+	names = selected_fields(request)
+	theses = theses_queryset(names)
+
+	year = request.GET.get("year")
+	if year:
+		if not year.isdigit():
+			raise BadRequest("Invalid year.")
+		theses = theses.filter(year=int(year))
+
+	subject = request.GET.get("subject")
+	if subject:
+		if not subject.isdigit() or int(subject) not in Subject.labels():
+			raise BadRequest("Invalid subject.")
+		theses = theses.filter(subject__in=Subject(pk=int(subject)).subtree())
+
+	return page(request, theses, thesis_serializer(names))
+
+
+@api_view()
+def thesis_detail(request, pk):
+	names = selected_fields(request)
+	return thesis_serializer(names)(get_object_or_404(theses_queryset(names), pk=pk))
+
+
+@api_view()
+def subject_list(request):
+	"""All subjects, served from the cached subject tree"""
+	tree = Subject.tree()
+	parents = {pk: parent for parent, pks in tree["children"].items() for pk in pks}
+	return {"results": [
+		{"id": pk, "title": tree["titles"][pk], "label": label, "parent": parents.get(pk)}
+		for pk, label in sorted(tree["labels"].items())
+	]}
+
+
+@api_view()
+def keyword_list(request):
+	return page(request, Keyword.objects.only("title"), lambda keyword: {"id": keyword.pk, "title": keyword.title}, parse_pk=int)
+
+
+@api_view(public=False)
+def change_feed(request):
+	"""Changes of all theses after `?after=` (see `submissions.feed`), for users allowed to view them"""
+	if not request.user.has_perm("submissions.view_changeevent"):
+		raise PermissionDenied
+	try:
+		limit = min(int(request.GET.get("limit", settings.API_PAGE_SIZE)), settings.API_MAX_PAGE_SIZE)
+		events = feed.changes(request.GET.get("after"), max(limit, 1))
+	except ValueError:
+		raise BadRequest("Invalid cursor or limit.")
+	return {
+		"results": [feed.serialize(event) for event in events],
+		"cursor": feed.encode_cursor(events[-1]) if events else request.GET.get("after"),
+	}
@@ -5,3 +5,8 @@ class SubmissionsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'submissions'
     verbose_name = "Odevzdávací systém"
+
+    def ready(self):
+        from . import publish  # noqa: F401, connects the signals updating the published archive
+        from . import extraction  # noqa: F401, connects the signals extracting the text of files
+        from . import similarity  # noqa: F401, connects the signals updating the similarity index
@@ -0,0 +1,116 @@
+"""
+Text of the PDF attachments for the full-text search of the archive.
+
+Whenever a file attachment is saved, `extract_text` is queued on the
+documents queue. It runs `pdftotext` (poppler-utils) on the file in a
+subprocess killed after `settings.EXTRACTION_TIMEOUT` seconds, files
+larger than `settings.EXTRACTION_MAX_SIZE` bytes are skipped. The text
+is stored normalized (see `utils.normalize`) in a `FileText` with the
+SHA-256 digest of the file, so a file whose digest has not changed is
+never processed again. A new text updates the similarity signature of
+the thesis (see `submissions.similarity`). `extracttext` queues all not
+extracted files.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from acceptor import queues, tracing
+
+from . import similarity
+from .models import File, FileText
+from .utils import normalize
+
+from pathlib import Path
+import hashlib
+import subprocess
+
+
+PDF_MAGIC = b"%PDF-"
+
+
+def file_digest(path):
+	"""Return the SHA-256 digest of the file at `path`, read in chunks"""
+	digest = hashlib.sha256()
+	with open(path, "rb") as f:
+		for chunk in iter(lambda: f.read(1 << 16), b""):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+
+def is_pdf(path):
+	with open(path, "rb") as f:
+		return f.read(len(PDF_MAGIC)) == PDF_MAGIC
+
+
+def pdftotext(path):
+	"""Return the text of the PDF at `path`, raise `subprocess.TimeoutExpired` when it takes too long"""
+	result = subprocess.run(
+		["pdftotext", "-q", "-enc", "UTF-8", str(path), "-"],
+		capture_output=True, check=True, timeout=settings.EXTRACTION_TIMEOUT,
+	)
+	return result.stdout.decode("utf-8", errors="replace")
+
+
+def normalize_text(text):
+	"""Return the searchable form of an extracted text: normalized, with collapsed whitespace and limited length"""
+	return " ".join(normalize(text).split())[:settings.EXTRACTION_MAX_LENGTH]
+
+
+def extract(path):
+	"""Return the status and the normalized text of the file at `path`"""
+	if path.stat().st_size > settings.EXTRACTION_MAX_SIZE:
+		return FileText.TOO_LARGE, ""
+	if not is_pdf(path):
+		return FileText.UNSUPPORTED, ""
+	try:
+		with tracing.span("extraction.pdftotext"):
+			return FileText.EXTRACTED, normalize_text(pdftotext(path))
+	except subprocess.TimeoutExpired:
+		return FileText.TIMEOUT, ""
+	except (subprocess.CalledProcessError, OSError):
+		return FileText.FAILED, ""
+
+
+def extract_text(pk):
+	"""Extract the text of the file attachment `pk` unless the file is unchanged since the last time, return the status"""
+	file = File.objects.filter(pk=pk).first()
+	if file is None or not file.upload:
+		return None  # deleted in the meantime
+	path = Path(file.upload.path)
+	if not path.exists():
+		return None
+
+	size = path.stat().st_size
+	if size > settings.EXTRACTION_MAX_SIZE:
+		# Not read at all, the size stands in for the digest
+		digest = f"size:{size}"
+	else:
+		digest = file_digest(path)
+	current = FileText.objects.filter(file=file).only("digest", "status").first()
+	if current is not None and current.digest == digest:
+		return current.status
+
+	status, text = extract(path)
+	FileText.objects.update_or_create(file=file, defaults={"digest": digest, "status": status, "text": text})
+	similarity.index_thesis(file.thesis_id)
+	return status
+
+
+def schedule(pk):
+	"""Extract the text of a file attachment after the current transaction commits"""
+	transaction.on_commit(lambda: tracing.async_task("submissions.extraction.extract_text", pk, queue=queues.DOCUMENTS))
+
+
+def schedule_all():
+	"""Queue the extraction of all files without an extracted text, return their number"""
+	pks = list(File.objects.filter(text__isnull=True).values_list("pk", flat=True))
+	for pk in pks:
+		tracing.async_task("submissions.extraction.extract_text", pk, queue=queues.DOCUMENTS)
+	return len(pks)
+
+
+@receiver(post_save, sender=File)
+def file_saved(sender, instance, **kwargs):
+	schedule(instance.pk)
@@ -0,0 +1,67 @@
+"""
+Incremental feed of thesis changes.
+
+Consumers keep the cursor of the last event they have seen and ask
+for the events after it. The cursor is the `sequence` of an event,
+which is not known when the event is written: it is assigned only to
+committed events by `assign_sequence`, under a lock, after all events
+numbered before. So an event of a long transaction, though written
+with an older timestamp and id, comes after the events the consumers
+have already seen and is never skipped.
+"""
+from django.db import connection, transaction
+from django.db.models import F, Max
+
+from .models import ChangeEvent
+
+
+# The key of the PostgreSQL advisory lock serializing `assign_sequence`
+SEQUENCE_LOCK = 0x6665656421
+
+
+def encode_cursor(event):
+	return str(event.sequence)
+
+
+def decode_cursor(cursor):
+	"""Return the sequence number encoded in `cursor`, raise ValueError when it is invalid"""
+	return int(cursor)
+
+
+def assign_sequence():
+	"""Number the committed events without a sequence number after all numbered ones, in the order of their ids"""
+	with transaction.atomic():
+		if connection.vendor == "postgresql":
+			# SQLite serializes the writing transactions itself
+			with connection.cursor() as cursor:
+				cursor.execute("SELECT pg_advisory_xact_lock(%s)", [SEQUENCE_LOCK])
+		first = ChangeEvent.objects.filter(sequence__isnull=True).order_by("pk").values_list("pk", flat=True).first()
+		if first is None:
+			return
+		last = ChangeEvent.objects.aggregate(last=Max("sequence"))["last"] or 0
+		# Events committed in the meantime with a lower id wait for the next call
+		ChangeEvent.objects.filter(sequence__isnull=True, pk__gte=first).update(sequence=F("pk") - first + last + 1)
+
+
+def changes(after=None, limit=1000):
+	"""Return up to `limit` events after the cursor `after` (from the beginning by default)"""
+	sequence = decode_cursor(after) if after else None
+	assign_sequence()
+	events = ChangeEvent.objects.filter(sequence__isnull=False)
+	if sequence is not None:
+		events = events.filter(sequence__gt=sequence)
+	return list(events.order_by("sequence")[:limit])
+
+
+def serialize(event):
+	data = {
+		"cursor": encode_cursor(event),
+		"thesis": str(event.thesis_id),
+		"kind": event.kind,
+		"timestamp": event.timestamp.isoformat(),
+	}
+	if event.kind == ChangeEvent.STATE:
+		data["state"] = event.state
+	elif event.kind == ChangeEvent.EDIT:
+		data["fields"] = event.fields
+	return data
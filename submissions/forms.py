@@ -1,11 +1,13 @@
 from django import forms
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Q, Count, Exists, OuterRef
+from django.urls import reverse_lazy
 
-from . import models
+from . import models, publish
 from .models import Thesis, Keyword
-from .utils import split_person_name
+from .utils import normalize, split_person_name
 
 from datetime import date
 
@@ -32,6 +34,16 @@ class ConsultationForm(forms.ModelForm):
 
 class KeywordWidget(forms.TextInput):
 	"""A widget for KeywordUpdateField and KeywordField"""
+	def __init__(self, attrs=None):
+		super().__init__({
+			"data-autocomplete": reverse_lazy("autocomplete", kwargs={"kind": "keywords"}),
+			"data-autocomplete-separator": ",",
+			**(attrs or {}),
+		})
+
+	class Media:
+		js = ["js/autocomplete.js"]
+
 	def format_value(self, value):
 		if value is None:
 			return ""
@@ -42,6 +54,11 @@ class KeywordWidget(forms.TextInput):
 			return [x.strip() for x in data.get(name).split(",")]
 
 
+def unique_titles(value):
+	"""Return the non-empty keyword titles in `value` without duplicates"""
+	return list(dict.fromkeys(title for title in value if title))
+
+
 class KeywordUpdateField(forms.Field):
 	"""A form field used for updating the keywords of a thesis"""
 	widget = KeywordWidget
@@ -50,11 +67,12 @@ class KeywordUpdateField(forms.Field):
 		if not value:
 			return []
 
-		res = []
-		for title in value:
-			k = Keyword.objects.get_or_create(title=title)[0]
-			res.append(k)
-		return res
+		titles = unique_titles(value)
+		existing = set(Keyword.objects.filter(title__in=titles).values_list("title", flat=True))
+		Keyword.objects.bulk_create([Keyword(title=title) for title in titles if title not in existing])
+
+		keywords = {k.title: k for k in Keyword.objects.filter(title__in=titles)}
+		return [keywords[title] for title in titles]
 
 
 class KeywordField(forms.Field):
@@ -65,14 +83,12 @@ class KeywordField(forms.Field):
 		if not value:
 			return []
 
-		res = []
-		for title in value:
-			try:
-				k = Keyword.objects.get(title=title)
-				res.append(k)
-			except Keyword.DoesNotExist:
+		titles = unique_titles(value)
+		keywords = {k.title: k for k in Keyword.objects.filter(title__in=titles)}
+		for title in titles:
+			if title not in keywords:
 				raise ValidationError(f"klíčové slovo {title} není v databázi")
-		return res
+		return [keywords[title] for title in titles]
 
 
 class ThesisKeywordUpdateForm(forms.ModelForm):
@@ -91,13 +107,125 @@ class ThesisEvaluationForm(forms.ModelForm):
 		fields = ["mark"]
 
 
-class SortedModelChoiceIterator(forms.models.ModelChoiceIterator):
-	def __iter__(self):
-		yield from sorted(super().__iter__(), key=lambda x: "" if not x[0] else x[1])
+def closed_state_choices():
+	return [("", "---------")] + [
+		(code, state.name) for code, state in models.State.registry().items() if state.is_closed
+	]
+
+
+class BulkEvaluationForm(forms.ModelForm):
+	"""The mark and the closing state of one thesis in `BulkEvaluationFormSet`"""
+	state = forms.ChoiceField(label="Stav", required=False, choices=closed_state_choices)
+
+	class Meta:
+		model = Thesis
+		fields = ["mark"]
+
+
+class FormSetObjectField(forms.ModelChoiceField):
+	"""The hidden primary key of a model formset form, looked up among the objects the formset has already fetched"""
+
+	def __init__(self, formset, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.formset = formset
+
+	def to_python(self, value):
+		if value in self.empty_values:
+			return None
+		try:
+			obj = self.formset._existing_object(self.queryset.model._meta.pk.to_python(value))
+		except ValidationError:
+			obj = None
+		if obj is None:
+			raise ValidationError(self.error_messages["invalid_choice"], code="invalid_choice")
+		return obj
+
+
+class BaseBulkEvaluationFormSet(forms.BaseModelFormSet):
+	CLOSED_MESSAGE = "Některé práce byly mezitím uzavřeny, nic nebylo uloženo."
+	FORGED_MESSAGE = "Formulář neodpovídá pracím na stránce, nic nebylo uloženo."
+
+	def add_fields(self, form, index):
+		super().add_fields(form, index)
+		# Unlike the default field, this does not cost a query per form
+		field = form.fields[self._pk_field.name]
+		form.fields[self._pk_field.name] = FormSetObjectField(
+			self, field.queryset, initial=field.initial, required=False, widget=field.widget
+		)
+
+	def clean(self):
+		super().clean()
+		# Every form must be one of the listed theses: no new ones (extra forms), none without a key
+		name = self._pk_field.name
+		if self.total_form_count() != self.initial_form_count() or any(form[name].value() in (None, "") for form in self.forms):
+			raise ValidationError(self.FORGED_MESSAGE)
+		# A thesis closed since the page was loaded is not in the queryset anymore
+		if any(name in form.errors for form in self.forms):
+			raise ValidationError(self.CLOSED_MESSAGE)
+		theses = [form.cleaned_data[name] for form in self.forms]
+		if len(set(theses)) != len(theses):
+			raise ValidationError(self.FORGED_MESSAGE)
+
+	@transaction.atomic
+	def save(self, user):
+		"""
+			Save the marks and move the theses with a chosen state into it,
+			using a constant number of queries per state. Raise `ValidationError`
+			when some of the theses have been closed in the meantime.
+			Return the number of closed theses.
+		"""
+		marked = [form.instance for form in self.forms if "mark" in form.changed_data]
+		Thesis.objects.bulk_update(marked, ["mark"])
+		models.ChangeEvent.objects.bulk_create([
+			models.ChangeEvent(thesis_id=thesis.pk, kind=models.ChangeEvent.EDIT, fields=["mark"]) for thesis in marked
+		])
+
+		by_state = {}
+		for form in self.forms:
+			if form.cleaned_data.get("state"):
+				by_state.setdefault(form.cleaned_data["state"], []).append(form.instance.pk)
+
+		open_states = [code for code, state in models.State.registry().items() if not state.is_closed]
+		for state, pks in by_state.items():
+			if len(Thesis.transition_many(pks, open_states, state, user)) != len(pks):
+				raise ValidationError(self.CLOSED_MESSAGE)
+
+		publish.schedule_many([pk for state, pks in by_state.items() if models.State.get(state).is_public for pk in pks])
+		return sum(map(len, by_state.values()))
+
+
+BulkEvaluationFormSet = forms.modelformset_factory(
+	Thesis, form=BulkEvaluationForm, formset=BaseBulkEvaluationFormSet, extra=0
+)
+
+
+class SubjectWidget(forms.Select):
+	"""
+		A select with only the chosen subject, the others are picked
+		from a tree loaded lazily from the subjects endpoint.
+	"""
+	empty_label = None
+
+	def __init__(self, attrs=None):
+		super().__init__({"data-subjects": reverse_lazy("subjects"), **(attrs or {})})
+
+	class Media:
+		js = ["js/subjects.js"]
+
+	def optgroups(self, name, value, attrs=None):
+		labels = models.Subject.labels()
+		self.choices = [] if self.empty_label is None else [("", self.empty_label)]
+		self.choices += [(int(v), labels[int(v)]) for v in value if str(v).isdigit() and int(v) in labels]
+		return super().optgroups(name, value, attrs)
 
 
 class SubjectChoiceField(forms.ModelChoiceField):
-	iterator = SortedModelChoiceIterator
+	"""A subject field, which does not load all subjects when rendered"""
+	widget = SubjectWidget
+
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.widget.empty_label = self.empty_label
 
 
 class ThesisCreateForm(forms.ModelForm):
@@ -111,12 +239,23 @@ class ThesisCreateForm(forms.ModelForm):
 		fields = ["title", "subject", "assignment"]
 
 
+class ThesisImportForm(forms.Form):
+	file = forms.FileField(
+		label="Soubor",
+		help_text="CSV nebo JSON se sloupci title, subject, assignment, year, keywords, author, supervisor a opponent",
+	)
+
+
 class SearchForm(forms.Form):
-	title = forms.CharField(required=False, max_length=255, label="Název")
+	title = forms.CharField(
+		required=False, max_length=255, label="Název",
+		widget=forms.TextInput(attrs={"data-autocomplete": reverse_lazy("autocomplete", kwargs={"kind": "titles"})}),
+	)
 	keywords = KeywordField(required=False, label="Klíčová slova", help_text="klíčová slova oddělte čárkami")
 	author_name = forms.CharField(required=False, label="Jméno autora")
 	supervisor_name = forms.CharField(required=False, label="Jméno vedoucího")
 	opponent_name = forms.CharField(required=False, label="Jméno oponenta")
+	text = forms.CharField(required=False, max_length=255, label="Text práce", help_text="hledá v textu nahraných souborů PDF")
 	year = forms.ChoiceField(required=False, choices=lambda: [(None, "Vše")] + [(y, str(y)) for y in Thesis.public_years()], label="Ročník")
 	subject = SubjectChoiceField(
 		required=False, empty_label="Vše", label="Předmět",
@@ -133,8 +272,15 @@ class SearchForm(forms.Form):
 				qs = qs.filter(title__icontains=self.cleaned_data["title"])
 
 		if self.cleaned_data["keywords"]:
-			for kw in self.cleaned_data["keywords"]:
-				qs = qs.filter(keywords=kw)
+			# A single IN lookup, keeping the theses which have all the keywords
+			keywords = self.cleaned_data["keywords"]
+			matching = (Thesis.keywords.through.objects
+				.filter(keyword__title__in=[kw.title for kw in keywords])
+				.values("thesis")
+				.annotate(matched=Count("keyword__title", distinct=True))
+				.filter(matched=len(keywords))
+				.values("thesis"))
+			qs = qs.filter(pk__in=matching)
 
 		if self.cleaned_data["author_name"]:
 			first_name, last_name = split_person_name(self.cleaned_data["author_name"])
@@ -178,6 +324,11 @@ class SearchForm(forms.Form):
 				else:
 					qs = qs.filter(opponent__first_name__iexact=first_name)
 
+		if self.cleaned_data["text"]:
+			# The texts are stored normalized, so the search is case and diacritics insensitive everywhere
+			text = " ".join(normalize(self.cleaned_data["text"]).split())
+			qs = qs.filter(Exists(models.FileText.objects.filter(file__thesis=OuterRef("pk"), text__contains=text)))
+
 		if self.cleaned_data["year"]:
 			qs = qs.filter(year=self.cleaned_data["year"])
 
@@ -0,0 +1,62 @@
+from django.db import transaction
+
+from .models import Thesis, LogEntry, ArchivedLogEntry, current_year
+
+
+def redundant_entries(entries):
+	"""
+		Return the entries of a single thesis history (ordered by timestamp)
+		which can be removed without losing the course of the thesis.
+
+		The first entry, the last (closing) entry and the last entry
+		of every state are kept, repeated intermediate states
+		(e.g. the author/supervisor approval ping-pong) are redundant.
+	"""
+	if len(entries) <= 2:
+		return []
+
+	keep = {entries[0].pk, entries[-1].pk}
+	keep.update({entry.state_id: entry.pk for entry in entries}.values())
+	return [entry for entry in entries if entry.pk not in keep]
+
+
+def compactable(before_year=None):
+	"""Closed theses from the years before `before_year` (the current one by default)"""
+	if before_year is None:
+		before_year = current_year()
+	return Thesis.closed.filter(year__lt=before_year)
+
+
+@transaction.atomic
+def compact(thesis_ids, dry_run=False):
+	"""
+		Move the redundant log entries of the given theses into `ArchivedLogEntry`.
+		Return the number of moved entries.
+	"""
+	histories = {}
+	for entry in LogEntry.objects.filter(thesis_id__in=thesis_ids).order_by("timestamp"):
+		histories.setdefault(entry.thesis_id, []).append(entry)
+
+	redundant = [entry for entries in histories.values() for entry in redundant_entries(entries)]
+	if dry_run or not redundant:
+		return len(redundant)
+
+	ArchivedLogEntry.objects.bulk_create([
+		ArchivedLogEntry(id=entry.pk, state_id=entry.state_id, thesis_id=entry.thesis_id, user_id=entry.user_id, timestamp=entry.timestamp)
+		for entry in redundant
+	], ignore_conflicts=True)
+	# Without the per-row signals: the latest entry is kept, so the states do not change
+	redundant_qs = LogEntry.objects.filter(pk__in=[entry.pk for entry in redundant])
+	redundant_qs._raw_delete(redundant_qs.db)
+	return len(redundant)
+
+
+def compact_all(before_year=None, chunk_size=500, dry_run=False):
+	"""
+		Compact the histories of all compactable theses in chunks of `chunk_size`,
+		each in its own transaction. Yield the number of theses and moved entries per chunk.
+	"""
+	ids = list(compactable(before_year).order_by("pk").values_list("pk", flat=True))
+	for i in range(0, len(ids), chunk_size):
+		chunk = ids[i:i + chunk_size]
+		yield len(chunk), compact(chunk, dry_run=dry_run)
@@ -0,0 +1,190 @@
+import csv
+import io
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .models import Thesis, Subject, Keyword, LogEntry, ChangeEvent, User, current_year
+
+
+def read_rows(file, name):
+	"""
+		Read the rows of an uploaded CSV or JSON file as a list of dictionaries.
+
+		A CSV file must have a header row, a JSON file must contain a list of objects.
+		Keywords are given as a comma separated string in both formats
+		(a JSON list of strings is accepted as well).
+	"""
+	content = file.read()
+	if isinstance(content, bytes):
+		try:
+			content = content.decode("utf-8-sig")
+		except UnicodeDecodeError:
+			raise ValidationError("Soubor není v kódování UTF-8.")
+
+	if name.endswith(".json"):
+		try:
+			rows = json.loads(content)
+		except ValueError:
+			raise ValidationError("Soubor není platný JSON.")
+		if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+			raise ValidationError("JSON musí obsahovat seznam objektů.")
+		return rows
+	elif name.endswith(".csv"):
+		return list(csv.DictReader(io.StringIO(content)))
+
+	raise ValidationError("Podporované formáty jsou CSV a JSON.")
+
+
+class ThesisImporter:
+	"""
+		Create theses from a list of rows (dictionaries) in bulk.
+
+		Every row may contain the keys `title`, `subject` (pk or full label),
+		`assignment`, `year`, `keywords`, `author`, `supervisor` and `opponent`
+		(usernames). All rows are validated before anything is written,
+		the errors are collected in `errors` as `(row number, message)` pairs.
+		The theses, missing keywords, initial log entries and their changes
+		(see `submissions.feed`) are then created using a constant number
+		of queries inside a single transaction.
+
+		Example.
+			>>> importer = ThesisImporter(rows, request.user)
+			>>> if importer.is_valid():
+			...     importer.save()
+	"""
+	USER_FIELDS = ["author", "supervisor", "opponent"]
+	BATCH_SIZE = 500
+
+	def __init__(self, rows, user):
+		self.rows = rows
+		self.user = user
+		self.errors = []
+		self.theses = []
+
+	def is_valid(self):
+		self.errors = []
+		self.theses = []
+
+		labels = Subject.labels()
+		self.subjects = {label: pk for pk, label in labels.items()}
+		self.subjects.update({str(pk): pk for pk in labels})
+
+		usernames = {
+			str(row.get(field)).strip()
+			for row in self.rows for field in self.USER_FIELDS
+			if row.get(field)
+		}
+		self.users = {u.username: u for u in User.objects.filter(username__in=usernames)}
+
+		for number, row in enumerate(self.rows, start=1):
+			try:
+				self.theses.append(self.clean_row(row))
+			except ValidationError as e:
+				self.errors.extend((number, message) for message in e.messages)
+
+		return not self.errors
+
+	@staticmethod
+	def split_keywords(value):
+		if not value:
+			return []
+		if isinstance(value, str):
+			value = value.split(",")
+		return list(dict.fromkeys(str(x).strip() for x in value if str(x).strip()))
+
+	def clean_row(self, row):
+		"""Return an unsaved thesis with its keyword titles for the given row"""
+		errors = []
+
+		title = str(row.get("title") or "").strip()
+		if not title:
+			errors.append("chybí název práce")
+		elif len(title) > 255:
+			errors.append("název práce je delší než 255 znaků")
+
+		subject = self.subjects.get(str(row.get("subject") or "").strip())
+		if subject is None:
+			errors.append(f"předmět {row.get('subject')} není v databázi")
+
+		year = row.get("year") or current_year()
+		try:
+			year = int(year)
+		except (TypeError, ValueError):
+			errors.append(f"ročník {year} není číslo")
+
+		users = {}
+		for field in self.USER_FIELDS:
+			username = str(row.get(field) or "").strip()
+			if username:
+				users[field] = self.users.get(username)
+				if users[field] is None:
+					errors.append(f"uživatel {username} není v databázi")
+
+		keywords = self.split_keywords(row.get("keywords"))
+		for kw in keywords:
+			if len(kw) > 255:
+				errors.append(f"klíčové slovo {kw[:32]}… je delší než 255 znaků")
+
+		if errors:
+			raise ValidationError(errors)
+
+		if not users.get("author") and not users.get("supervisor"):
+			users["supervisor"] = self.user
+
+		thesis = Thesis(
+			title=title,
+			subject_id=subject,
+			assignment=row.get("assignment") or None,
+			year=year,
+			**users,
+		)
+		thesis.sanitize()
+		return thesis, keywords
+
+	def initial_state(self, thesis):
+		"""The same initial state as when the thesis is created by its author or supervisor"""
+		if thesis.author and not thesis.supervisor:
+			return "author_approved"
+		return "supervisor_approved"
+
+	@transaction.atomic
+	def save(self):
+		"""Create the validated theses and return them"""
+		assert not self.errors, "cannot save an import with errors"
+
+		titles = {kw for _, keywords in self.theses for kw in keywords}
+		existing = set(Keyword.objects.filter(title__in=titles).values_list("title", flat=True))
+		Keyword.objects.bulk_create(
+			[Keyword(title=kw) for kw in titles - existing],
+			batch_size=self.BATCH_SIZE
+		)
+		keywords = dict(Keyword.objects.filter(title__in=titles).values_list("title", "pk"))
+
+		for thesis, _ in self.theses:
+			thesis.current_state_id = self.initial_state(thesis)
+		theses = Thesis.objects.bulk_create(
+			[thesis for thesis, _ in self.theses],
+			batch_size=self.BATCH_SIZE
+		)
+
+		Through = Thesis.keywords.through
+		Through.objects.bulk_create([
+			Through(thesis_id=thesis.pk, keyword_id=keywords[kw])
+			for thesis, kws in self.theses for kw in kws
+		], batch_size=self.BATCH_SIZE)
+
+		LogEntry.objects.bulk_create([
+			LogEntry(thesis=thesis, state_id=thesis.current_state_id, user=self.user)
+			for thesis in theses
+		], batch_size=self.BATCH_SIZE)
+
+		# Bulk creation sends no signals, so the changes are recorded here
+		ChangeEvent.objects.bulk_create([
+			ChangeEvent(thesis_id=thesis.pk, kind=kind, state=state)
+			for thesis in theses
+			for kind, state in [(ChangeEvent.CREATED, ""), (ChangeEvent.STATE, thesis.current_state_id)]
+		], batch_size=self.BATCH_SIZE)
+
+		return theses
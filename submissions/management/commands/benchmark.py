@@ -0,0 +1,142 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+
+from acceptor import tracing
+from submissions import tasks
+from submissions.models import Thesis, Keyword, ConsultationPeriod, Subject, User, current_year
+from submissions.utils import percentile
+
+from datetime import date
+from itertools import cycle
+from statistics import mean, median
+from unittest import mock
+import json
+import subprocess
+import time
+
+
+class Command(BaseCommand):
+	help = "Measures the latency and query counts of the core views on the current database (see gendata)"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--repeat", type=int, default=20, help="number of measured runs of every case")
+		parser.add_argument("--output", help="write the JSON report into this file instead of stdout")
+		parser.add_argument("--compare", help="a previous JSON report to compare the results with")
+
+	def measure(self, name, func):
+		"""Run `func` `--repeat` times and return the latency and query statistics"""
+		count = [0]
+
+		def count_queries(execute, sql, params, many, context):
+			count[0] += 1
+			return execute(sql, params, many, context)
+
+		func()  # warm up
+		timings = []
+		queries = []
+		for _ in range(self.repeat):
+			count[0] = 0
+			with connection.execute_wrapper(count_queries):
+				start = time.perf_counter()
+				res = func()
+				timings.append((time.perf_counter() - start) * 1000)
+			if res is not None and res.status_code != 200:
+				raise CommandError(f"{name} returned status {res.status_code}")
+			queries.append(count[0])
+
+		self.stderr.write(f"{name}: p50 {percentile(timings, 50):.1f} ms, {median(queries):g} queries")
+		return {
+			"runs": self.repeat,
+			"mean_ms": round(mean(timings), 3),
+			"p50_ms": round(percentile(timings, 50), 3),
+			"p90_ms": round(percentile(timings, 90), 3),
+			"p99_ms": round(percentile(timings, 99), 3),
+			"max_ms": round(max(timings), 3),
+			"queries": median(queries),
+		}
+
+	def cases(self):
+		"""Return a dictionary of the benchmarked cases"""
+		year = current_year()
+		thesis = Thesis.objects.filter(year=year, author__isnull=False, supervisor__isnull=False).order_by("pk").first()
+		public = Thesis.public.order_by("pk").first()
+		if thesis is None or public is None:
+			raise CommandError("The database does not contain enough data, run gendata first.")
+
+		client = Client()
+		client.force_login(thesis.supervisor)
+		author = Client()
+		author.force_login(thesis.author)
+
+		root = Subject.roots.order_by("pk").first()
+		keywords = ", ".join(public.keywords.values_list("title", flat=True)[:2])
+		period = ConsultationPeriod.objects.order_by("pk").first()
+
+		def autocomplete(kind, titles):
+			prefixes = cycle([title[:4] for title in titles if title] or ["a"])
+
+			def case():
+				cache.clear()  # measure the lookup, not the cache
+				return Client().get(reverse("autocomplete", kwargs={"kind": kind}), {"q": next(prefixes)})
+			return case
+
+		def notifications():
+			remaining = (period.end - date.today()).days
+			with mock.patch.object(tracing, "async_task"):
+				tasks.notifications(remaining=remaining)
+
+		return {
+			"thesis-detail": lambda: client.get(thesis.get_absolute_url()),
+			"thesis-detail-public": lambda: Client().get(public.get_absolute_url()),
+			"thesis-list": lambda: client.get(reverse("thesis-list", kwargs={"subject": root.pk})),
+			"thesis-me": lambda: author.get(reverse("thesis-me")),
+			"archive-search-empty": lambda: Client().get(reverse("archive-search")),
+			"archive-search-keywords": lambda: Client().get(reverse("archive-search"), {"keywords": keywords}),
+			"archive-search-year": lambda: Client().get(reverse("archive-search"), {"year": public.year, "subject": root.pk}),
+			"autocomplete-keywords": autocomplete("keywords", Keyword.objects.order_by("?").values_list("title", flat=True)[:100]),
+			"autocomplete-titles": autocomplete("titles", Thesis.public.order_by("?").values_list("title", flat=True)[:100]),
+			"tasks-notifications": notifications,
+		}
+
+	def git_revision(self):
+		try:
+			return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+		except (OSError, subprocess.CalledProcessError):
+			return None
+
+	def handle(self, *args, **options):
+		try:
+			setup_test_environment()
+		except RuntimeError:
+			pass  # already set up, e.g. when run from the tests
+		self.repeat = options["repeat"]
+
+		report = {
+			"revision": self.git_revision(),
+			"dataset": {
+				"theses": Thesis.objects.count(),
+				"subjects": Subject.objects.count(),
+				"keywords": Keyword.objects.count(),
+				"users": User.objects.count(),
+			},
+			"cases": {name: self.measure(name, case) for name, case in self.cases().items()},
+		}
+
+		if options["compare"]:
+			with open(options["compare"]) as f:
+				previous = json.load(f)["cases"]
+			for name, result in report["cases"].items():
+				if name in previous:
+					result["p50_change"] = round(result["p50_ms"] / previous[name]["p50_ms"] - 1, 3)
+					result["queries_change"] = result["queries"] - previous[name]["queries"]
+
+		output = json.dumps(report, indent=2)
+		if options["output"]:
+			with open(options["output"], "w") as f:
+				f.write(output)
+		else:
+			self.stdout.write(output)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from submissions import feed
+
+import json
+
+
+class Command(BaseCommand):
+	help = "Prints the thesis changes after a cursor as JSON lines, the cursor of the last one is printed to stderr"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--after", default=None, help="the cursor of the last seen change (from the beginning by default)")
+		parser.add_argument("--limit", type=int, default=1000, help="maximal number of printed changes")
+
+	def handle(self, *args, **options):
+		try:
+			events = feed.changes(options["after"], options["limit"])
+		except ValueError:
+			raise CommandError("Invalid cursor.")
+
+		for event in events:
+			self.stdout.write(json.dumps(feed.serialize(event)))
+		self.stderr.write(feed.encode_cursor(events[-1]) if events else options["after"] or "")
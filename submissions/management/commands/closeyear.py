@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from submissions.models import State
+from submissions.rollover import close_year, UNFINISHED
+
+from collections import Counter
+
+
+class Command(BaseCommand):
+	help = "Closes all open theses of a finished year, evaluated ones by their marks, unfinished ones are archived"
+
+	def add_arguments(self, parser):
+		parser.add_argument("year", type=int, help="the year to close")
+		parser.add_argument("--chunk-size", type=int, default=500, help="number of theses closed in one transaction")
+		parser.add_argument("--dry-run", action="store_true", help="only report what would be closed")
+
+	def handle(self, *args, **options):
+		if UNFINISHED not in State.registry():
+			raise CommandError(f"The state {UNFINISHED} does not exist, run the migrations first.")
+
+		total = Counter()
+		for counts in close_year(options["year"], options["chunk_size"], dry_run=options["dry_run"]):
+			total.update(counts)
+			self.stderr.write(f"{sum(total.values())} theses processed")
+
+		for code, count in sorted(total.items()):
+			self.stdout.write(f"{State.get(code).name}: {count}")
+
+		if options["dry_run"]:
+			self.stdout.write(self.style.SUCCESS(f"{sum(total.values())} theses of {options['year']} can be closed."))
+		else:
+			self.stdout.write(self.style.SUCCESS(f"Successfully closed {sum(total.values())} theses of {options['year']}."))
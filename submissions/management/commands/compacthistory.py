@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from submissions.history import compact_all
+
+
+class Command(BaseCommand):
+	help = "Moves redundant log entries of closed theses from past years into the archive"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--before", type=int, default=None, help="compact theses from the years before this one (the current one by default)")
+		parser.add_argument("--chunk-size", type=int, default=500, help="number of theses compacted in one transaction")
+		parser.add_argument("--dry-run", action="store_true", help="only count the redundant entries")
+
+	def handle(self, *args, **options):
+		theses = entries = 0
+		for chunk_theses, chunk_entries in compact_all(options["before"], options["chunk_size"], options["dry_run"]):
+			theses += chunk_theses
+			entries += chunk_entries
+			self.stderr.write(f"{theses} theses processed")
+
+		if options["dry_run"]:
+			self.stdout.write(self.style.SUCCESS(f"{entries} log entries of {theses} theses can be archived."))
+		else:
+			self.stdout.write(self.style.SUCCESS(f"Successfully archived {entries} log entries of {theses} theses."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from submissions import extraction
+
+
+class Command(BaseCommand):
+	help = "Queues the text extraction of all file attachments without an extracted text"
+
+	def handle(self, *args, **options):
+		count = extraction.schedule_all()
+		self.stdout.write(self.style.SUCCESS(f"Successfully queued {count} files."))
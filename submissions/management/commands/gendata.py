@@ -0,0 +1,161 @@
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from submissions import models
+from submissions.models import Thesis, LogEntry, User, current_year
+
+from datetime import date, timedelta
+import random
+import uuid
+
+
+WORDS = [
+	"analýza", "vliv", "historie", "vývoj", "model", "simulace", "etika", "logika",
+	"společnost", "příroda", "jazyk", "literatura", "umění", "hudba", "filosofie", "fyzika",
+	"chemie", "biologie", "matematika", "informatika", "ekonomie", "politika", "psychologie",
+	"geografie", "architektura", "film", "médiích", "regionu", "Praze", "Evropě", "století",
+]
+
+# Typical histories of a thesis, the last state is the current one
+HISTORIES = {
+	"closed": [
+		["author_approved", "supervisor_approved", "author_approved", "approved", "submitted", "defense_ready", "defended"],
+		["supervisor_approved", "approved", "submitted", "defense_ready", "defended"],
+		["author_approved", "supervisor_approved", "approved", "submitted", "approved", "submitted", "defense_ready", "defended_nonpublic"],
+		["supervisor_approved", "author_approved", "supervisor_approved", "approved", "submitted", "defense_ready", "failed"],
+	],
+	"current": [
+		["author_approved"],
+		["supervisor_approved", "author_approved"],
+		["supervisor_approved", "approved"],
+		["author_approved", "approved", "submitted"],
+		["supervisor_approved", "approved", "submitted", "defense_ready"],
+	],
+}
+
+
+class Command(BaseCommand):
+	help = "Generates a large synthetic dataset for benchmarking, do not run on a production database"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--theses", type=int, default=20000, help="number of generated theses")
+		parser.add_argument("--years", type=int, default=10, help="number of years the theses are spread over")
+		parser.add_argument("--depth", type=int, default=4, help="depth of the subject tree")
+		parser.add_argument("--keywords", type=int, default=2000, help="number of generated keywords")
+		parser.add_argument("--seed", type=int, default=0, help="seed of the random generator")
+
+	def sentence(self, n):
+		return " ".join(self.random.choice(WORDS) for _ in range(n)).capitalize()
+
+	def create_subjects(self, depth):
+		"""Create a subject tree with the given depth and return its leaves"""
+		level = [None]
+		for d in range(depth):
+			next_level = []
+			for parent in level:
+				for i in range(self.random.randint(2, 4) if d else 3):
+					next_level.append(models.Subject.objects.create(title=self.sentence(2), parent=parent))
+			level = next_level
+		return level
+
+	def create_users(self, prefix, count, group):
+		users = User.objects.bulk_create([
+			User(username=f"{prefix}{uuid.uuid4().hex[:12]}", first_name=self.sentence(1), last_name=self.sentence(1), email=f"{prefix}{i}@example.com")
+			for i in range(count)
+		], batch_size=1000)
+		users = list(User.objects.filter(username__in=[u.username for u in users]))
+		group.user_set.add(*users)
+		return users
+
+	@transaction.atomic
+	def handle(self, *args, **options):
+		self.random = random.Random(options["seed"])
+		states = models.State.objects.in_bulk()
+		today = current_year()
+
+		leaves = self.create_subjects(options["depth"])
+		self.stdout.write(f"Created {models.Subject.objects.count()} subjects")
+
+		for root in models.Subject.roots.all():
+			models.ConsultationPeriod.objects.create(
+				subject=root, count=2,
+				start=date.today() - timedelta(days=30), end=date.today() + timedelta(days=7),
+			)
+
+		students = self.create_users("xbench", options["theses"] // options["years"] + 1, Group.objects.get(name="Studenti"))
+		teachers = self.create_users("bench", max(10, options["theses"] // 200), Group.objects.get(name="Učitelé"))
+
+		keywords = models.Keyword.objects.bulk_create(
+			[models.Keyword(title=f"{self.sentence(1)} {i}") for i in range(options["keywords"])],
+			batch_size=1000
+		)
+		keywords = list(models.Keyword.objects.filter(title__in=[k.title for k in keywords]).values_list("pk", flat=True))
+
+		theses = []
+		histories = []
+		for i in range(options["theses"]):
+			year = today - i % options["years"]
+			history = self.random.choice(HISTORIES["current" if year == today else "closed"])
+			theses.append(Thesis(
+				title=self.sentence(self.random.randint(3, 8)),
+				abstract=f"<p>{self.sentence(60)}</p>",
+				assignment=f"<p>{self.sentence(40)}</p>",
+				author=self.random.choice(students),
+				supervisor=self.random.choice(teachers),
+				opponent=self.random.choice(teachers) if "submitted" in history else None,
+				supervisor_opinion=f"<p>{self.sentence(30)}</p>" if "defense_ready" in history else None,
+				opponent_opinion=f"<p>{self.sentence(30)}</p>" if "defense_ready" in history else None,
+				mark=self.random.randint(1, 5) if year != today else None,
+				year=year,
+				subject=self.random.choice(leaves),
+				current_state_id=history[-1],
+			))
+			histories.append(history)
+		Thesis.objects.bulk_create(theses, batch_size=1000)
+		self.stdout.write(f"Created {len(theses)} theses")
+
+		Through = Thesis.keywords.through
+		Through.objects.bulk_create([
+			Through(thesis_id=thesis.pk, keyword_id=kw)
+			for thesis in theses for kw in self.random.sample(keywords, min(len(keywords), self.random.randint(2, 6)))
+		], batch_size=5000)
+
+		entries = []
+		for thesis, history in zip(theses, histories):
+			timestamp = timezone.now() - timedelta(days=365 * (today - thesis.year) + 300)
+			for code in history:
+				timestamp += timedelta(days=self.random.randint(1, 30), seconds=self.random.randint(0, 86400))
+				entries.append(LogEntry(thesis=thesis, state=states[code], user=thesis.supervisor, timestamp=timestamp))
+		LogEntry.objects.bulk_create(entries, batch_size=5000)
+		# `auto_now_add` overwrites the timestamps on insert
+		LogEntry.objects.bulk_update(entries, ["timestamp"], batch_size=5000)
+		self.stdout.write(f"Created {len(entries)} log entries")
+
+		periods = {p.subject_id: p for p in models.ConsultationPeriod.objects.all()}
+		leaf_periods = {leaf.pk: periods[leaf.root.pk] for leaf in leaves}
+		models.Consultation.objects.bulk_create([
+			models.Consultation(
+				thesis=thesis, period=leaf_periods[thesis.subject_id],
+				date=date.today() - timedelta(days=self.random.randint(0, 30)),
+				note=self.sentence(10),
+			)
+			for thesis in theses if thesis.year == today
+			for _ in range(self.random.randint(0, 3))
+		], batch_size=5000)
+
+		# Multi-table inheritance prevents using bulk_create for links
+		attachments = models.SubmissionAttachment.objects.bulk_create([
+			models.SubmissionAttachment(thesis=thesis)
+			for thesis, history in zip(theses, histories) if "submitted" in history
+		], batch_size=5000)
+		pk_field = models.SubmissionAttachment._meta.pk
+		with connection.cursor() as cursor:
+			cursor.executemany(
+				f"INSERT INTO {models.Link._meta.db_table} (submissionattachment_ptr_id, url) VALUES (%s, %s)",
+				[(pk_field.get_db_prep_value(a.pk, connection), f"https://example.com/{a.pk}") for a in attachments]
+			)
+		self.stdout.write(f"Created {len(attachments)} attachments")
+
+		self.stdout.write(self.style.SUCCESS("Successfully generated the dataset."))
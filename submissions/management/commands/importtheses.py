@@ -0,0 +1,41 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from submissions.imports import ThesisImporter, read_rows
+from submissions.models import User
+
+
+class Command(BaseCommand):
+	help = "Imports thesis topics in bulk from a CSV or JSON file"
+
+	def add_arguments(self, parser):
+		parser.add_argument("file", help="a CSV or JSON file with the theses")
+		parser.add_argument("--user", required=True, help="username of the user performing the import")
+		parser.add_argument("--dry-run", action="store_true", help="only validate the file")
+
+	def handle(self, *args, **options):
+		try:
+			user = User.objects.get(username=options["user"])
+		except User.DoesNotExist:
+			raise CommandError(f"User {options['user']} does not exist.")
+
+		try:
+			with open(options["file"], "rb") as f:
+				rows = read_rows(f, options["file"].lower())
+		except OSError as e:
+			raise CommandError(e)
+		except ValidationError as e:
+			raise CommandError(" ".join(e.messages))
+
+		importer = ThesisImporter(rows, user)
+		if not importer.is_valid():
+			for row, message in importer.errors:
+				self.stderr.write(f"row {row}: {message}")
+			raise CommandError(f"The file contains {len(importer.errors)} errors, nothing was imported.")
+
+		if options["dry_run"]:
+			self.stdout.write(self.style.SUCCESS(f"The file is valid ({len(rows)} theses)."))
+			return
+
+		theses = importer.save()
+		self.stdout.write(self.style.SUCCESS(f"Successfully imported {len(theses)} theses."))
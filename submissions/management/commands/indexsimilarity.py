@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from submissions import similarity
+
+
+class Command(BaseCommand):
+	help = "Updates the similarity signatures of all theses with extracted texts using a pool of processes"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--processes", type=int, default=None, help="number of worker processes (one per CPU by default)")
+		parser.add_argument("--chunk-size", type=int, default=100, help="number of theses read from the database at once")
+
+	def handle(self, *args, **options):
+		count = similarity.index_archive(options["processes"], options["chunk_size"])
+		self.stdout.write(self.style.SUCCESS(f"Successfully indexed {count} theses."))
@@ -0,0 +1,222 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from submissions.models import Thesis, User, current_year
+from submissions.utils import percentile
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+
+# A minimal valid PDF used for synthesized uploads
+PDF = b"%PDF-1.1\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n2 0 obj<</Type/Pages/Kids[]/Count 0>>endobj\ntrailer<</Root 1 0 R>>\n%%EOF\n"
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+	def redirect_request(self, *args, **kwargs):
+		return None
+
+
+class VirtualUser:
+	"""A logged in browser session replaying requests of the scenario"""
+
+	def __init__(self, base_url, user):
+		self.base_url = base_url.rstrip("/")
+		self.user = user
+		self.cookies = CookieJar()
+		self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), NoRedirect)
+
+	def csrf_token(self):
+		for cookie in self.cookies:
+			if cookie.name == "csrftoken":
+				return cookie.value
+		return ""
+
+	def request(self, method, path, data=None, files=None, timeout=30):
+		"""Send a request and return its status code"""
+		url = self.base_url + path
+		headers = {"Referer": url}
+		body = None
+		if method == "POST":
+			headers["X-CSRFToken"] = self.csrf_token()
+			fields = {"csrfmiddlewaretoken": self.csrf_token(), **(data or {})}
+			if files:
+				boundary = uuid.uuid4().hex
+				headers["Content-Type"] = f"multipart/form-data; boundary={boundary}"
+				body = b""
+				for name, value in fields.items():
+					body += f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+				for name, (filename, content) in files.items():
+					body += f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\nContent-Type: application/octet-stream\r\n\r\n'.encode()
+					body += content + b"\r\n"
+				body += f"--{boundary}--\r\n".encode()
+			else:
+				headers["Content-Type"] = "application/x-www-form-urlencoded"
+				body = urllib.parse.urlencode(fields).encode()
+
+		req = urllib.request.Request(url, data=body, headers=headers, method=method)
+		try:
+			with self.opener.open(req, timeout=timeout) as res:
+				res.read()
+				return res.status
+		except urllib.error.HTTPError as e:
+			return e.code
+
+	def login(self):
+		self.request("GET", "/auth/login/")
+		status = self.request("POST", "/auth/login/", {"username": self.user["username"], "password": self.user["password"]})
+		if status != 302:
+			raise CommandError(f"Could not log in as {self.user['username']} (status {status}).")
+
+
+class Command(BaseCommand):
+	help = (
+		"Replays a mix of requests from a scenario file against a running instance "
+		"and reports throughput, error rates and tail latency per endpoint"
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument("scenario", help="a JSON scenario file, written by --synthesize")
+		parser.add_argument("--base-url", default="http://localhost:8000", help="URL of the tested instance")
+		parser.add_argument("--concurrency", type=int, default=10, help="number of simultaneous virtual users")
+		parser.add_argument("--duration", type=float, default=60, help="length of the test in seconds")
+		parser.add_argument("--output", help="write the JSON report into this file instead of stdout")
+		parser.add_argument("--seed", type=int, default=None, help="seed of the random choice of requests")
+		parser.add_argument(
+			"--synthesize", action="store_true",
+			help="instead of replaying, write a deadline-day scenario for the current database into the file. "
+			"Sets the password of the used users, never use it on a production database!"
+		)
+		parser.add_argument("--password", default="loadtest", help="password of the users of a synthesized scenario")
+		parser.add_argument("--users", type=int, default=50, help="number of users in a synthesized scenario")
+
+	def synthesize(self, options):
+		"""
+		A deadline-day scenario: students view and upload to their approved theses,
+		submit and cancel the submission, everyone browses thesis details.
+		"""
+		theses = list(Thesis.objects
+			.filter(year=current_year(), author__isnull=False)
+			.select_related("author")
+			.order_by("?")[:options["users"]])
+		if not theses:
+			raise CommandError("There are no current theses with authors in the database.")
+
+		users = []
+		for thesis in theses:
+			thesis.author.set_password(options["password"])
+			users.append({"username": thesis.author.username, "password": options["password"], "params": {"thesis": str(thesis.pk)}})
+		User.objects.bulk_update([t.author for t in theses], ["password"])
+
+		return {
+			"users": users,
+			"params": {"public": [str(pk) for pk in Thesis.public.values_list("pk", flat=True)[:200]]},
+			"requests": [
+				{"name": "thesis-detail", "method": "GET", "path": "/thesis/{thesis}/", "weight": 10},
+				{"name": "thesis-me", "method": "GET", "path": "/theses/my-list/", "weight": 3},
+				{"name": "public-detail", "method": "GET", "path": "/thesis/{public}/", "weight": 3},
+				{"name": "attachment-upload", "method": "POST", "path": "/thesis/{thesis}/attachment/upload", "upload": "upload", "weight": 3, "expect": [302, 403]},
+				{"name": "attachment-link", "method": "POST", "path": "/thesis/{thesis}/attachment/link", "data": {"url": "https://example.com"}, "weight": 1, "expect": [302, 403]},
+				{"name": "thesis-submit", "method": "POST", "path": "/thesis/{thesis}/submit", "weight": 2, "expect": [302, 403]},
+				{"name": "thesis-submit-cancel", "method": "POST", "path": "/thesis/{thesis}/submit-cancel", "weight": 1, "expect": [302, 403]},
+			],
+		}
+
+	def run_user(self, user, scenario, deadline, results, lock, rand):
+		client = VirtualUser(self.base_url, user)
+		start = time.perf_counter()
+		try:
+			client.login()
+			logged_in = True
+		except (CommandError, OSError):
+			logged_in = False
+		with lock:
+			results["login"].append((time.perf_counter() - start, logged_in))
+
+		requests = scenario["requests"]
+		weights = [r.get("weight", 1) for r in requests]
+		while logged_in and time.monotonic() < deadline:
+			req = rand.choices(requests, weights)[0]
+			params = {name: rand.choice(values) for name, values in scenario.get("params", {}).items() if values}
+			params.update(user.get("params", {}))
+			try:
+				path = req["path"].format(**params)
+			except KeyError:
+				continue
+
+			files = {req["upload"]: (f"{uuid.uuid4().hex[:8]}.pdf", PDF)} if req.get("upload") else None
+			start = time.perf_counter()
+			try:
+				status = client.request(req["method"], path, req.get("data"), files)
+				ok = status in req.get("expect", [200])
+			except OSError:
+				status, ok = 0, False
+			with lock:
+				results[req["name"]].append((time.perf_counter() - start, ok))
+
+	def report(self, results, elapsed):
+		report = {}
+		for name, samples in sorted(results.items()):
+			timings = [t * 1000 for t, _ in samples]
+			errors = sum(1 for _, ok in samples if not ok)
+			report[name] = {
+				"requests": len(samples),
+				"throughput_rps": round(len(samples) / elapsed, 2),
+				"error_rate": round(errors / len(samples), 4) if samples else 0,
+				"p50_ms": round(percentile(timings, 50), 2),
+				"p95_ms": round(percentile(timings, 95), 2),
+				"p99_ms": round(percentile(timings, 99), 2),
+				"max_ms": round(max(timings), 2),
+			}
+		return report
+
+	def handle(self, *args, **options):
+		if options["synthesize"]:
+			with open(options["scenario"], "w") as f:
+				json.dump(self.synthesize(options), f, indent=2)
+			self.stdout.write(self.style.SUCCESS(f"Successfully wrote the scenario into {options['scenario']}."))
+			return
+
+		try:
+			with open(options["scenario"]) as f:
+				scenario = json.load(f)
+		except (OSError, ValueError) as e:
+			raise CommandError(e)
+
+		self.base_url = options["base_url"]
+		rand = random.Random(options["seed"])
+		users = scenario["users"]
+		results = defaultdict(list)
+		lock = threading.Lock()
+
+		start = time.monotonic()
+		deadline = start + options["duration"]
+		with ThreadPoolExecutor(options["concurrency"]) as pool:
+			futures = [
+				pool.submit(self.run_user, users[i % len(users)], scenario, deadline, results, lock, random.Random(rand.random()))
+				for i in range(options["concurrency"])
+			]
+			for future in futures:
+				future.result()
+		elapsed = time.monotonic() - start
+
+		output = json.dumps({
+			"base_url": self.base_url,
+			"concurrency": options["concurrency"],
+			"duration_s": round(elapsed, 2),
+			"total_requests": sum(map(len, results.values())),
+			"endpoints": self.report(results, elapsed),
+		}, indent=2)
+		if options["output"]:
+			with open(options["output"], "w") as f:
+				f.write(output)
+		else:
+			self.stdout.write(output)
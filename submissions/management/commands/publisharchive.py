@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from submissions import publish
+
+
+class Command(BaseCommand):
+	help = "Renders the static copies of all public theses and archive indexes into PUBLISH_ROOT"
+
+	def handle(self, *args, **options):
+		if not publish.enabled():
+			raise CommandError("PUBLISH_ROOT is not set.")
+
+		count = publish.publish_all()
+		self.stdout.write(self.style.SUCCESS(f"Successfully published {count} theses."))
@@ -1,15 +1,33 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from django_q.models import Schedule
 
+from acceptor import queues
+
+
+# func, schedule type, minutes (for Schedule.MINUTES), queue (cluster) running it;
+# the batches over all theses or users run on the maintenance queue, the email
+# queue with its short timeout only gets the individual emails
+SCHEDULES = [
+	("submissions.tasks.notifications", Schedule.DAILY, None, queues.MAINTENANCE),
+	("submissions.tasks.send_digests", Schedule.MINUTES, settings.NOTIFICATION_DIGEST_MINUTES, queues.MAINTENANCE),
+	("submissions.tasks.compact_history", Schedule.MONTHLY, None, queues.MAINTENANCE),
+]
+
 
 class Command(BaseCommand):
-	help = "Sets up a scheduled task for sending emails"
+	help = "Sets up the scheduled tasks, updates the existing ones without moving their next runs"
 
 	def handle(self, *args, **options):
-		if not Schedule.objects.filter(func="submissions.tasks.notifications").exists():
-			Schedule.objects.create(
-				func="submissions.tasks.notifications",
-				schedule_type=Schedule.DAILY,
-			)
+		created = 0
+		for func, schedule_type, minutes, queue in SCHEDULES:
+			_, new = Schedule.objects.update_or_create(func=func, defaults={
+				"name": func.rsplit(".", 1)[1],
+				"schedule_type": schedule_type,
+				"minutes": minutes,
+				"cluster": queue,
+				"repeats": -1,
+			})
+			created += new
 
-		self.stdout.write(self.style.SUCCESS("Successfully set the scheduled task."))
+		self.stdout.write(self.style.SUCCESS(f"Successfully set the scheduled tasks ({created} new, {len(SCHEDULES) - created} updated)."))
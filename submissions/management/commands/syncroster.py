@@ -0,0 +1,27 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from acceptor.accounts import sync_roster
+from submissions.imports import read_rows
+
+
+class Command(BaseCommand):
+	help = "Creates or updates users and their groups in bulk from a CSV or JSON roster export"
+
+	def add_arguments(self, parser):
+		parser.add_argument("file", help="a CSV or JSON file with the columns email, first_name, last_name and group")
+
+	def handle(self, *args, **options):
+		try:
+			with open(options["file"], "rb") as f:
+				rows = read_rows(f, options["file"].lower())
+		except OSError as e:
+			raise CommandError(e)
+		except ValidationError as e:
+			raise CommandError(" ".join(e.messages))
+
+		created, updated, errors = sync_roster(rows)
+		for row, message in errors:
+			self.stderr.write(f"row {row}: {message}")
+
+		self.stdout.write(self.style.SUCCESS(f"Successfully synced the roster ({created} created, {updated} updated, {len(errors)} skipped)."))
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.2 on 2026-10-19 14:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0002_auto_20220218_1549'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='keyword',
+            name='title',
+            field=models.CharField(db_index=True, max_length=255, verbose_name='Název'),
+        ),
+    ]
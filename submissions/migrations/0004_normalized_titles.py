@@ -0,0 +1,54 @@
+# Generated by Django 4.0.2 on 2026-10-19 14:13
+
+from django.db import migrations, models
+import submissions.models
+import unicodedata
+
+
+def normalize(text):
+    # A copy of utils.normalize at the time of this migration
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def fill_normalized(apps, schema_editor):
+    Keyword = apps.get_model("submissions", "Keyword")
+    keywords = list(Keyword.objects.all())
+    for keyword in keywords:
+        keyword.normalized = normalize(keyword.title)
+    Keyword.objects.bulk_update(keywords, ["normalized"], batch_size=500)
+
+    Thesis = apps.get_model("submissions", "Thesis")
+    theses = list(Thesis.objects.all())
+    for thesis in theses:
+        thesis.normalized_title = normalize(thesis.title)
+    Thesis.objects.bulk_update(theses, ["normalized_title"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0003_keyword_title_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='keyword',
+            name='normalized',
+            field=submissions.models.NormalizedField(default='', editable=False, max_length=255, source='title'),
+        ),
+        migrations.AddField(
+            model_name='thesis',
+            name='normalized_title',
+            field=submissions.models.NormalizedField(default='', editable=False, max_length=255, source='title'),
+        ),
+        migrations.AddIndex(
+            model_name='keyword',
+            index=models.Index(fields=['normalized'], name='keyword_normalized_prefix', opclasses=['text_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='thesis',
+            index=models.Index(fields=['normalized_title'], name='thesis_normalized_title_prefix', opclasses=['text_pattern_ops']),
+        ),
+        migrations.RunPython(fill_normalized, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.0.2 on 2026-10-19 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0004_normalized_titles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Čas')),
+                ('view', models.CharField(max_length=255, verbose_name='Pohled')),
+                ('call_site', models.CharField(max_length=255, verbose_name='Místo volání')),
+                ('sql', models.TextField(verbose_name='SQL')),
+                ('duration', models.FloatField(verbose_name='Doba trvání (ms)')),
+                ('plan', models.TextField(blank=True, verbose_name='Plán dotazu')),
+            ],
+            options={
+                'verbose_name': 'Pomalý dotaz',
+                'verbose_name_plural': 'Pomalé dotazy',
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.0.2 on 2026-10-19 14:26
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('submissions', '0005_slowquery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedLogEntry',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('timestamp', models.DateTimeField(verbose_name='Čas')),
+                ('archived', models.DateTimeField(auto_now_add=True, verbose_name='Archivováno')),
+            ],
+            options={
+                'verbose_name': 'Archivovaný záznam',
+                'verbose_name_plural': 'Archivované záznamy',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='logentry',
+            index=models.Index(fields=['thesis', 'timestamp'], name='logentry_thesis_timestamp'),
+        ),
+        migrations.AddField(
+            model_name='archivedlogentry',
+            name='state',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_log_entries', to='submissions.state', verbose_name='Stav'),
+        ),
+        migrations.AddField(
+            model_name='archivedlogentry',
+            name='thesis',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_log_entries', to='submissions.thesis', verbose_name='Práce'),
+        ),
+        migrations.AddField(
+            model_name='archivedlogentry',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_log_entries', to=settings.AUTH_USER_MODEL, verbose_name='Měnil'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedlogentry',
+            index=models.Index(fields=['thesis', 'timestamp'], name='archivedlogentry_thesis_ts'),
+        ),
+    ]
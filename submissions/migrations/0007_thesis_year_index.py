@@ -0,0 +1,19 @@
+# Generated by Django 4.0.2 on 2026-10-19 14:29
+
+from django.db import migrations, models
+import submissions.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0006_logentry_archive'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='thesis',
+            name='year',
+            field=models.IntegerField(db_index=True, default=submissions.models.current_year, verbose_name='Ročník'),
+        ),
+    ]
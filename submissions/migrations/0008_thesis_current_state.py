@@ -0,0 +1,29 @@
+# Generated by Django 4.0.2 on 2026-10-19 14:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_current_state(apps, schema_editor):
+    Thesis = apps.get_model("submissions", "Thesis")
+    LogEntry = apps.get_model("submissions", "LogEntry")
+    Thesis.objects.update(current_state=models.Subquery(LogEntry.objects
+        .filter(thesis=models.OuterRef("pk"))
+        .order_by("-timestamp")
+        .values("state")[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0007_thesis_year_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thesis',
+            name='current_state',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='submissions.state', verbose_name='Aktuální stav'),
+        ),
+        migrations.RunPython(fill_current_state, migrations.RunPython.noop),
+    ]
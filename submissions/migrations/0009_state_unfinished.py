@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def add_state(apps, schema_editor):
+    State = apps.get_model("submissions", "State")
+    State.objects.get_or_create(
+        code="unfinished",
+        defaults=dict(
+            name="Nedokončena",
+            description="Práce nebyla v daném ročníku dokončena a byla archivována při uzavření ročníku.",
+            is_closed=True,
+        ),
+    )
+
+
+def remove_state(apps, schema_editor):
+    State = apps.get_model("submissions", "State")
+    State.objects.filter(code="unfinished").delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0008_thesis_current_state'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_state, remove_state),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.0.2 on 2026-10-19 14:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0009_state_unfinished'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('thesis_id', models.UUIDField(verbose_name='Práce')),
+                ('kind', models.CharField(choices=[('created', 'Vytvořena'), ('state', 'Změna stavu'), ('edit', 'Úprava'), ('deleted', 'Smazána')], max_length=16, verbose_name='Druh')),
+                ('state', models.CharField(blank=True, max_length=32, verbose_name='Stav')),
+                ('fields', models.JSONField(blank=True, default=list, verbose_name='Změněná pole')),
+                ('timestamp', models.DateTimeField(auto_now_add=True, verbose_name='Čas')),
+            ],
+            options={
+                'verbose_name': 'Změna',
+                'verbose_name_plural': 'Změny',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='changeevent',
+            index=models.Index(fields=['timestamp', 'id'], name='changeevent_cursor'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.0.2 on 2026-10-19 14:51
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def fill_modified(apps, schema_editor):
+    Thesis = apps.get_model("submissions", "Thesis")
+    LogEntry = apps.get_model("submissions", "LogEntry")
+    Thesis.objects.filter(log_entries__isnull=False).update(modified=models.Subquery(LogEntry.objects
+        .filter(thesis=models.OuterRef("pk"))
+        .order_by("-timestamp")
+        .values("timestamp")[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0010_changeevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thesis',
+            name='modified',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Změněna'),
+        ),
+        migrations.RunPython(fill_modified, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='thesis',
+            index=models.Index(fields=['modified', 'id'], name='thesis_modified'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.0.2 on 2026-10-19 14:53
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('submissions', '0011_thesis_modified'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('state', 'Změna stavu'), ('opinion', 'Nový posudek')], max_length=16, verbose_name='Druh')),
+                ('field', models.CharField(blank=True, max_length=32, verbose_name='Posudek')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Čas')),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to=settings.AUTH_USER_MODEL, verbose_name='Příjemce')),
+                ('state', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='submissions.state', verbose_name='Stav')),
+                ('thesis', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='submissions.thesis', verbose_name='Práce')),
+            ],
+            options={
+                'verbose_name': 'Upozornění',
+                'verbose_name_plural': 'Upozornění',
+            },
+        ),
+    ]
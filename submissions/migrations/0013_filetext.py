@@ -0,0 +1,28 @@
+# Generated by Django 4.0.2 on 2026-10-19 14:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0012_notification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileText',
+            fields=[
+                ('file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='text', serialize=False, to='submissions.file', verbose_name='Soubor')),
+                ('digest', models.CharField(max_length=64, verbose_name='Otisk (SHA-256)')),
+                ('status', models.CharField(choices=[('extracted', 'Extrahován'), ('unsupported', 'Nepodporovaný formát'), ('too_large', 'Příliš velký soubor'), ('timeout', 'Vypršel časový limit'), ('failed', 'Chyba')], max_length=16, verbose_name='Stav')),
+                ('text', models.TextField(blank=True, verbose_name='Text')),
+                ('extracted', models.DateTimeField(auto_now=True, verbose_name='Čas')),
+            ],
+            options={
+                'verbose_name': 'Text souboru',
+                'verbose_name_plural': 'Texty souborů',
+            },
+        ),
+    ]
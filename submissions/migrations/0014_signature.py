@@ -0,0 +1,35 @@
+# Generated by Django 4.0.2 on 2026-10-19 15:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0013_filetext'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Signature',
+            fields=[
+                ('thesis', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='submissions.thesis', verbose_name='Práce')),
+                ('digest', models.CharField(max_length=64, verbose_name='Otisk textu (SHA-256)')),
+                ('minhash', models.BinaryField(verbose_name='MinHash')),
+                ('created', models.DateTimeField(auto_now=True, verbose_name='Čas')),
+            ],
+            options={
+                'verbose_name': 'Otisk práce',
+                'verbose_name_plural': 'Otisky prací',
+            },
+        ),
+        migrations.CreateModel(
+            name='SignatureBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField(db_index=True)),
+                ('signature', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bands', to='submissions.signature')),
+            ],
+        ),
+    ]
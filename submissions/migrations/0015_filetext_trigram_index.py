@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    # A trigram index answering the LIKE '%...%' of the text search, only PostgreSQL has them
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute("CREATE INDEX filetext_text_trgm ON submissions_filetext USING gin (text gin_trgm_ops)")
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS filetext_text_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0014_signature'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
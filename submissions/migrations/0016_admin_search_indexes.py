@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.db import migrations
+
+
+# The admin searches by `istartswith` (UPPER(column) LIKE 'PREFIX%'), which on PostgreSQL
+# can use only an index of the same expression with text_pattern_ops
+INDEXES = [
+    ("auth_user_username_upper_prefix", "auth_user", "username"),
+    ("auth_user_last_name_upper_prefix", "auth_user", "last_name"),
+    ("subject_title_upper_prefix", "submissions_subject", "title"),
+]
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        for name, table, column in INDEXES:
+            schema_editor.execute(f"CREATE INDEX {name} ON {table} (UPPER({column}::text) text_pattern_ops)")
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        for name, _, _ in INDEXES:
+            schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('submissions', '0015_filetext_trigram_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.0.2 on 2026-10-19 15:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0016_admin_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='changeevent',
+            name='sequence',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, unique=True, verbose_name='Pořadí'),
+        ),
+        migrations.AddIndex(
+            model_name='changeevent',
+            index=models.Index(condition=models.Q(('sequence__isnull', True)), fields=['id'], name='changeevent_unsequenced'),
+        ),
+    ]
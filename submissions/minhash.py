@@ -0,0 +1,70 @@
+"""
+MinHash signatures of texts and their locality-sensitive hashing.
+
+A normalized text is split into shingles of `SHINGLE_SIZE` consecutive
+words. Its signature is the minimum of each of `PERMUTATIONS` random
+hash functions over the hashes of its shingles, the share of equal
+positions of two signatures estimates the Jaccard similarity of their
+shingle sets. The signature is cut into `BANDS` bands of `ROWS` values,
+the hash of each band is a key of the LSH index. Two texts share a key
+with a high probability only when their similarity is above about
+(1 / BANDS) ** (1 / ROWS), i.e. 0.42.
+
+Changing the parameters invalidates all stored signatures. The module
+does not use Django, so it can run in worker processes of any start
+method (see `similarity.index_archive`).
+"""
+import hashlib
+import random
+import struct
+import zlib
+
+
+SHINGLE_SIZE = 5
+PERMUTATIONS = 128
+BANDS = 32
+ROWS = PERMUTATIONS // BANDS
+
+PRIME = (1 << 61) - 1
+_random = random.Random(20220218)
+COEFFICIENTS = [(_random.randrange(1, PRIME), _random.randrange(PRIME)) for _ in range(PERMUTATIONS)]
+
+
+def shingles(text):
+	"""Return the set of 32-bit hashes of the shingles of a normalized text"""
+	words = text.split()
+	return {
+		zlib.crc32(" ".join(words[i:i + SHINGLE_SIZE]).encode())
+		for i in range(max(len(words) - SHINGLE_SIZE, 0) + 1)
+	} if words else set()
+
+
+def signature(text):
+	"""Return the MinHash signature of a normalized text as a list of `PERMUTATIONS` integers, None for an empty text"""
+	hashes = shingles(text)
+	if not hashes:
+		return None
+	return [min([(a * x + b) % PRIME for x in hashes]) for a, b in COEFFICIENTS]
+
+
+def band_keys(signature):
+	"""Return the LSH keys of a signature, one for every band, as signed 64-bit integers"""
+	return [
+		int.from_bytes(hashlib.blake2b(
+			struct.pack(f"<H{ROWS}Q", band, *signature[band * ROWS:(band + 1) * ROWS]), digest_size=8,
+		).digest(), "little", signed=True)
+		for band in range(BANDS)
+	]
+
+
+def similarity(a, b):
+	"""Return the estimated Jaccard similarity (0-1) of the texts with the signatures `a` and `b`"""
+	return sum(x == y for x, y in zip(a, b)) / PERMUTATIONS
+
+
+def pack(signature):
+	return struct.pack(f"<{PERMUTATIONS}Q", *signature)
+
+
+def unpack(data):
+	return list(struct.unpack(f"<{PERMUTATIONS}Q", data))
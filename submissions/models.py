@@ -1,18 +1,25 @@
-from django.db import models
-from django.db.models import Max
-from django.db.models.expressions import F
+from django.db import models, transaction
 
 from django.contrib.auth.models import User
 
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
 from django.utils import timezone
 from django.urls import reverse
 
 from pathlib import Path
+import time
 import uuid
 
 import bleach
 
+from acceptor import tracing
+
+from . import states
+from .utils import normalize
+
 
 ALLOWED_TAGS = bleach.sanitizer.ALLOWED_TAGS + ["p", "u", "br", "h3"]
 
@@ -27,6 +34,29 @@ def upload_path(instance, filename):
 	return Path(str(instance.thesis.pk)) / filename
 
 
+class NormalizedField(models.CharField):
+	"""
+		A non-editable field holding the normalized (see `utils.normalize`)
+		value of the `source` field. It is kept up to date on every save
+		and also in `bulk_create`, which is why it is not a `save` override.
+	"""
+	def __init__(self, *args, source, **kwargs):
+		self.source = source
+		kwargs.setdefault("editable", False)
+		kwargs.setdefault("default", "")
+		super().__init__(*args, **kwargs)
+
+	def deconstruct(self):
+		name, path, args, kwargs = super().deconstruct()
+		kwargs["source"] = self.source
+		return name, path, args, kwargs
+
+	def pre_save(self, model_instance, add):
+		value = normalize(getattr(model_instance, self.source) or "")
+		setattr(model_instance, self.attname, value)
+		return value
+
+
 class RootSubjectManager(models.Manager):
 	def get_queryset(self):
 		return super().get_queryset().filter(parent=None)
@@ -58,6 +88,56 @@ class Subject(models.Model):
 			node = node.parent
 		return node
 
+	@classmethod
+	def tree(cls):
+		"""
+			Return the cached tree of all subjects as a dictionary with
+			`labels` (pk -> full label), `normalized` (pk -> normalized label),
+			`titles` (pk -> title) and `children` (parent pk or None -> child pks sorted by label).
+			The cache is dropped when a subject is edited, other processes
+			(with a per-process cache) reload it after `SUBJECT_TREE_TIMEOUT` seconds.
+		"""
+		tree = cache.get(SUBJECT_TREE_CACHE_KEY)
+		if tree is not None:
+			return tree
+
+		rows = {pk: (parent, title) for pk, parent, title in cls.objects.values_list("pk", "parent", "title")}
+		labels = {}
+
+		def label(pk):
+			if pk not in labels:
+				parent, title = rows[pk]
+				labels[pk] = title if parent is None else f"{label(parent)}, {title}"
+			return labels[pk]
+
+		children = {}
+		for pk, (parent, title) in rows.items():
+			children.setdefault(parent, []).append(pk)
+		for pks in children.values():
+			pks.sort(key=label)
+
+		tree = {
+			"labels": {pk: label(pk) for pk in rows},
+			"normalized": {pk: normalize(label(pk)) for pk in rows},
+			"titles": {pk: title for pk, (_, title) in rows.items()},
+			"children": children,
+		}
+		cache.set(SUBJECT_TREE_CACHE_KEY, tree, SUBJECT_TREE_TIMEOUT)
+		return tree
+
+	@classmethod
+	def labels(cls):
+		"""Return a dictionary mapping subject pks to their full labels"""
+		return cls.tree()["labels"]
+
+	def subtree(self):
+		"""Return the pks of this subject and all its descendants using the cached tree"""
+		children = Subject.tree()["children"]
+		pks = [self.pk]
+		for pk in pks:
+			pks.extend(children.get(pk, []))
+		return pks
+
 	def flattree(self):
 		"""Return a flattened tree with starting with this subject node"""
 		stack = [self]
@@ -79,8 +159,19 @@ class Subject(models.Model):
 		verbose_name_plural = "Předměty"
 
 
+SUBJECT_TREE_CACHE_KEY = "subject-tree"
+SUBJECT_TREE_TIMEOUT = 60
+
+
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+def invalidate_subject_tree(sender, **kwargs):
+	cache.delete(SUBJECT_TREE_CACHE_KEY)
+
+
 class Keyword(models.Model):
-	title = models.CharField(max_length=255, verbose_name="Název")
+	title = models.CharField(max_length=255, db_index=True, verbose_name="Název")
+	normalized = NormalizedField(max_length=255, source="title")
 
 	def __str__(self):
 		return self.title
@@ -89,6 +180,10 @@ class Keyword(models.Model):
 		verbose_name = "Klíčové slovo"
 		verbose_name_plural = "Klíčová slova"
 
+		indexes = [
+			models.Index(fields=["normalized"], opclasses=["text_pattern_ops"], name="keyword_normalized_prefix"),
+		]
+
 
 class StateFilterManager(models.Manager):
 	def __init__(self, **kwargs):
@@ -96,14 +191,7 @@ class StateFilterManager(models.Manager):
 		super().__init__()
 
 	def get_queryset(self):
-		return (super()
-			.get_queryset()
-			.alias(
-				latest_logentry_date=Max("log_entries__timestamp")
-			).filter(
-				log_entries__timestamp=F("latest_logentry_date"),
-				**self.kwargs,
-			))
+		return super().get_queryset().filter(**self.kwargs)
 
 
 class Thesis(models.Model):
@@ -141,6 +229,7 @@ class Thesis(models.Model):
 
 	# Informative fields
 	title = models.CharField(max_length=255, verbose_name="Název")
+	normalized_title = NormalizedField(max_length=255, source="title")
 	abstract = models.TextField(
 		null=True, blank=True, 
 		verbose_name="Abstrakt"
@@ -151,7 +240,7 @@ class Thesis(models.Model):
 		verbose_name="Klíčová slova"
 	)
 
-	year = models.IntegerField(default=current_year, verbose_name="Ročník")
+	year = models.IntegerField(default=current_year, db_index=True, verbose_name="Ročník")
 
 	# Assignment related fields
 	assignment = models.TextField(
@@ -177,23 +266,86 @@ class Thesis(models.Model):
 
 	subject = models.ForeignKey(Subject, on_delete=models.PROTECT, related_name="theses", verbose_name="Předmět")
 
+	# The state of the latest log entry, denormalized for filtering and guarded transitions
+	current_state = models.ForeignKey(
+		"State",
+		related_name="+",
+		on_delete=models.PROTECT,
+		null=True, blank=True,
+		editable=False,
+		verbose_name="Aktuální stav"
+	)
+
+	# The last change of the fields, keywords or state, the datestamp of the thesis in OAI-PMH
+	modified = models.DateTimeField(default=timezone.now, editable=False, verbose_name="Změněna")
+
 	# Managers
 	objects = models.Manager()
-	not_closed = StateFilterManager(log_entries__state__is_closed=False)
-	closed = StateFilterManager(log_entries__state__is_closed=True)
-	public = StateFilterManager(log_entries__state__is_public=True)
+	not_closed = StateFilterManager(current_state__is_closed=False)
+	closed = StateFilterManager(current_state__is_closed=True)
+	public = StateFilterManager(current_state__is_public=True)
+
+	def sanitize(self):
+		"""Clean the rich text fields of the thesis from disallowed HTML"""
+		with tracing.span("bleach.clean"):
+			if self.abstract:
+				self.abstract = bleach.clean(self.abstract, tags=ALLOWED_TAGS)
+			if self.assignment:
+				self.assignment = bleach.clean(self.assignment, tags=ALLOWED_TAGS)
+			if self.supervisor_opinion:
+				self.supervisor_opinion = bleach.clean(self.supervisor_opinion, tags=ALLOWED_TAGS)
+			if self.opponent_opinion:
+				self.opponent_opinion = bleach.clean(self.opponent_opinion, tags=ALLOWED_TAGS)
+
+	# Fields whose edits are recorded in the change feed
+	FEED_FIELDS = [
+		"author", "supervisor", "opponent", "title", "abstract", "year",
+		"assignment", "supervisor_opinion", "opponent_opinion", "mark", "subject",
+	]
 
-	def save(self, **kwargs):
-		if self.abstract:
-			self.abstract = bleach.clean(self.abstract, tags=ALLOWED_TAGS)
-		if self.assignment:
-			self.assignment = bleach.clean(self.assignment, tags=ALLOWED_TAGS)
-		if self.supervisor_opinion:
-			self.supervisor_opinion = bleach.clean(self.supervisor_opinion, tags=ALLOWED_TAGS)
-		if self.opponent_opinion:
-			self.opponent_opinion = bleach.clean(self.opponent_opinion, tags=ALLOWED_TAGS)
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		instance._loaded = dict(zip(field_names, values))
+		return instance
+
+	def changed_fields(self, update_fields=None):
+		"""Return the names of the `FEED_FIELDS` changed since the thesis was loaded (all of them when it was not)"""
+		loaded = getattr(self, "_loaded", {})
+		changed = []
+		for name in self.FEED_FIELDS if update_fields is None else [f for f in self.FEED_FIELDS if f in update_fields]:
+			attname = self._meta.get_field(name).attname
+			if attname not in loaded or loaded[attname] != getattr(self, attname):
+				changed.append(name)
+		return changed
 
-		super().save(**kwargs)
+	def save(self, **kwargs):
+		self.sanitize()
+		adding = self._state.adding
+		if not adding and kwargs.get("update_fields") is None:
+			# The state is only changed by transitions and log entries, never overwritten by a stale copy
+			kwargs["update_fields"] = [
+				f.name for f in self._meta.concrete_fields
+				if not f.primary_key and f.name != "current_state"
+			]
+		changed = [] if adding else self.changed_fields(kwargs.get("update_fields"))
+		if changed:
+			self.modified = timezone.now()
+			if "modified" not in kwargs["update_fields"]:
+				kwargs["update_fields"] = [*kwargs["update_fields"], "modified"]
+		if adding or changed:
+			with transaction.atomic():
+				super().save(**kwargs)
+				if adding:
+					ChangeEvent.objects.create(thesis_id=self.pk, kind=ChangeEvent.CREATED)
+				else:
+					ChangeEvent.objects.create(thesis_id=self.pk, kind=ChangeEvent.EDIT, fields=changed)
+				for field, roles in states.OPINION_NOTIFICATIONS.items():
+					if field in changed and getattr(self, field) and not getattr(self, "_loaded", {}).get(field):
+						Notification.notify(self, roles, kind=Notification.OPINION, field=field)
+		else:
+			super().save(**kwargs)
+		self._loaded = {f.attname: getattr(self, f.attname) for f in self._meta.concrete_fields if f.attname in self.__dict__}
 
 	def get_absolute_url(self):
 		return reverse("thesis-detail", kwargs={"pk": self.pk})
@@ -211,7 +363,65 @@ class Thesis(models.Model):
 
 	def set_state_code(self, state_code, user):
 		"""Add a new log entry for setting the state with the given code"""
-		return self.set_state(State.objects.get(code=state_code), user)
+		return self.set_state(State.get(state_code), user)
+
+	def transition(self, from_states, to_state, user):
+		"""
+			Move the thesis from one of `from_states` (state codes) into the state
+			with the code `to_state`. The current state is checked and changed by a single
+			conditional update, so of two concurrent transitions from the same state only one
+			succeeds, without locking the thesis beforehand. Return whether the state was changed.
+		"""
+		with transaction.atomic():
+			changed = (Thesis.objects
+				.filter(pk=self.pk, current_state__in=from_states)
+				.update(current_state=to_state, modified=timezone.now()))
+			if not changed:
+				return False
+			LogEntry(thesis=self, state_id=to_state, user=user).save(sync_state=False)
+
+		self.current_state_id = to_state
+		return True
+
+	@classmethod
+	def transition_many(cls, pks, from_states, to_state, user):
+		"""
+			Move the theses with the given primary keys from one of `from_states` into `to_state`
+			by a single conditional update and log it by a single insert. The theses not in
+			`from_states` anymore are skipped. Return the primary keys of the moved theses.
+		"""
+		with transaction.atomic():
+			moved = list(cls.objects
+				.select_for_update()
+				.filter(pk__in=pks, current_state__in=from_states)
+				.values_list("pk", flat=True))
+			if moved:
+				cls.objects.filter(pk__in=moved).update(current_state=to_state, modified=timezone.now())
+				LogEntry.objects.bulk_create([LogEntry(thesis_id=pk, state_id=to_state, user=user) for pk in moved])
+				ChangeEvent.objects.bulk_create([ChangeEvent(thesis_id=pk, kind=ChangeEvent.STATE, state=to_state) for pk in moved])
+		return moved
+
+	def roles(self, user):
+		"""Return the roles (see `states.ROLES`) of the user in this thesis"""
+		if not user.is_authenticated:
+			return set()
+		return {role for role in states.ROLES if getattr(self, f"{role}_id") == user.pk}
+
+	def available_actions(self, user):
+		"""Return the set of actions of the state machine, which the user can perform now"""
+		return states.available_actions(self.current_state_id, self.roles(user))
+
+	def perform(self, action, user, roles=None):
+		"""Perform an action of the state machine as the user (in `roles`, all of theirs by default), return whether the state was changed"""
+		for to_state, from_states in states.targets(action, self.roles(user) if roles is None else roles).items():
+			if self.transition(from_states, to_state, user):
+				return True
+		return False
+
+	def sync_state(self):
+		"""Set the current state to the state of the latest log entry, the thesis is only modified when it differs"""
+		latest = LogEntry.objects.filter(thesis=self.pk).order_by("-timestamp").values_list("state", flat=True).first()
+		Thesis.objects.filter(pk=self.pk).exclude(current_state=latest).update(current_state=latest, modified=timezone.now())
 
 	# Computed properties and methods
 
@@ -225,10 +435,9 @@ class Thesis(models.Model):
 	@property
 	def state(self):
 		"""Return the current state of the thesis or None"""
-		entry = self.last_log_entry
-		if entry is None:
+		if self.current_state_id is None:
 			return None
-		return entry.state
+		return State.get(self.current_state_id)
 
 	@property
 	def mark_verbose(self):
@@ -267,63 +476,38 @@ class Thesis(models.Model):
 	# State transitions
 
 	def assignment_update(self, user):
-		if self.state.is_approved:
+		roles = self.roles(user) & {"author", "supervisor"}
+		if not roles:
 			return False
-		if user == self.author:
-			if self.state.code == "supervisor_approved":
-				self.set_state_code("author_approved", user)
-			return True
-		elif user == self.supervisor:
-			if self.state.code == "author_approved":
-				self.set_state_code("supervisor_approved", user)
-			return True
-
-		return False
+		if "author" in roles:
+			roles = {"author"}  # an author supervising their own thesis edits it as the author
+		if "edit_assignment" in states.available_actions(self.current_state_id, roles) and not self.perform("edit_assignment", user, roles):
+			self.refresh_from_db(fields=["current_state"])  # changed in the meantime, maybe approved
+		return not self.state.is_approved
 
 	def approve(self, user):
-		if self.state.is_approved:
-			return False
-
-		if user == self.author and user == self.supervisor:
-			self.set_state_code("approved", user)
-			return True
-		elif user == self.author:
-			if self.state.code == "supervisor_approved":
-				self.set_state_code("approved", user)
-				return True
-		elif user == self.supervisor:
-			if self.state.code == "author_approved":
-				self.set_state_code("approved", user)
-				return True
-		return False
+		return self.perform("approve", user)
 
 	def submit(self, user):
-		if not self.state.submittable or user != self.author:
-			return False
-		self.set_state_code("submitted", self.author)
-		return True
+		return self.perform("submit", user)
 
 	def cancel_submit(self, user):
-		if (not self.state.is_submitted or 
-				self.state.is_closed or 
-				user != self.author):
-			return False
-		self.set_state_code("approved", self.author)
-		return True
+		return self.perform("cancel_submit", user)
 
 	def opinion_added(self, user):
-		if self.state.is_closed:
-			return False
-
 		if self.supervisor_opinion and self.opponent_opinion:
-			self.set_state_code("defense_ready", user)
-
-		return True
+			self.perform("complete_opinions", user)
+		return not self.state.is_closed
 
 	class Meta:
 		verbose_name = "Práce"
 		verbose_name_plural = "Práce"
 
+		indexes = [
+			models.Index(fields=["normalized_title"], opclasses=["text_pattern_ops"], name="thesis_normalized_title_prefix"),
+			models.Index(fields=["modified", "id"], name="thesis_modified"),
+		]
+
 		permissions = [
 			("author", "Může být autor"),
 			("supervisor", "Může být vedoucí"),
@@ -352,11 +536,43 @@ class State(models.Model):
 	def __str__(self):
 		return self.name
 
+	@classmethod
+	def registry(cls):
+		"""
+			Return all states as a dictionary by their codes, cached in the process.
+			The cache is dropped when a state is edited, other processes reload it
+			after `STATE_REGISTRY_TIMEOUT` seconds.
+		"""
+		global _state_registry
+		if _state_registry is None or _state_registry[0] < time.monotonic():
+			_state_registry = (time.monotonic() + STATE_REGISTRY_TIMEOUT, cls.objects.in_bulk())
+		return _state_registry[1]
+
+	@classmethod
+	def get(cls, code):
+		"""Return the state with the given code from the registry"""
+		try:
+			return cls.registry()[code]
+		except KeyError:
+			raise cls.DoesNotExist(f"State {code} does not exist.")
+
 	class Meta:
 		verbose_name = "Stav"
 		verbose_name_plural = "Stavy"
 
 
+STATE_REGISTRY_TIMEOUT = 60
+
+_state_registry = None
+
+
+@receiver(post_save, sender=State)
+@receiver(post_delete, sender=State)
+def invalidate_state_registry(sender, **kwargs):
+	global _state_registry
+	_state_registry = None
+
+
 class LogEntry(models.Model):
 	id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
 
@@ -382,10 +598,160 @@ class LogEntry(models.Model):
 	def __str__(self):
 		return f"Uživatel {self.user} změnil stav práce {self.thesis} na {self.state}"
 
+	def save(self, sync_state=True, **kwargs):
+		"""Save the entry and update the current state of its thesis (unless `sync_state` is False)"""
+		adding = self._state.adding
+		super().save(**kwargs)
+		if sync_state:
+			Thesis(pk=self.thesis_id).sync_state()
+			if adding and LogEntry.thesis.is_cached(self):
+				self.thesis.current_state_id = self.state_id
+
 	class Meta:
 		verbose_name = "Záznam"
 		verbose_name_plural = "Záznamy"
 
+		indexes = [
+			models.Index(fields=["thesis", "timestamp"], name="logentry_thesis_timestamp"),
+		]
+
+
+@receiver(post_delete, sender=LogEntry)
+def log_entry_deleted(sender, instance, **kwargs):
+	Thesis(pk=instance.thesis_id).sync_state()
+
+
+class ChangeEvent(models.Model):
+	"""
+		A change of a thesis in the change feed (see `submissions.feed`),
+		either a new state or an edit of its fields, keywords or attachments.
+		Not bound to the thesis by a foreign key, so that deletions stay in the feed.
+	"""
+	CREATED = "created"
+	STATE = "state"
+	EDIT = "edit"
+	DELETED = "deleted"
+
+	KIND_CHOICES = [
+		(CREATED, "Vytvořena"),
+		(STATE, "Změna stavu"),
+		(EDIT, "Úprava"),
+		(DELETED, "Smazána"),
+	]
+
+	thesis_id = models.UUIDField(verbose_name="Práce")
+	kind = models.CharField(max_length=16, choices=KIND_CHOICES, verbose_name="Druh")
+	state = models.CharField(max_length=32, blank=True, verbose_name="Stav")
+	fields = models.JSONField(default=list, blank=True, verbose_name="Změněná pole")
+	timestamp = models.DateTimeField(auto_now_add=True, verbose_name="Čas")
+	# The position in the feed, assigned after the commit (see `feed.assign_sequence`)
+	sequence = models.BigIntegerField(null=True, blank=True, unique=True, editable=False, verbose_name="Pořadí")
+
+	def __str__(self):
+		return f"{self.get_kind_display()} {self.thesis_id}"
+
+	class Meta:
+		verbose_name = "Změna"
+		verbose_name_plural = "Změny"
+
+		indexes = [
+			models.Index(fields=["timestamp", "id"], name="changeevent_cursor"),
+			models.Index(fields=["id"], condition=models.Q(sequence__isnull=True), name="changeevent_unsequenced"),
+		]
+
+
+@receiver(post_save, sender=LogEntry)
+def log_entry_saved(sender, instance, created, **kwargs):
+	if created:
+		ChangeEvent.objects.create(thesis_id=instance.thesis_id, kind=ChangeEvent.STATE, state=instance.state_id)
+		if instance.state_id in states.NOTIFICATIONS:
+			Notification.notify(instance.thesis, states.NOTIFICATIONS[instance.state_id], exclude=instance.user_id, kind=Notification.STATE, state_id=instance.state_id)
+
+
+class Notification(models.Model):
+	"""
+		A pending notification of a user about a change of a thesis, written in the transaction
+		of the change and sent later in a digest with the other notifications of the user
+		(see `tasks.send_digests`).
+	"""
+	STATE = "state"
+	OPINION = "opinion"
+
+	KIND_CHOICES = [
+		(STATE, "Změna stavu"),
+		(OPINION, "Nový posudek"),
+	]
+
+	recipient = models.ForeignKey(User, related_name="notifications", on_delete=models.CASCADE, verbose_name="Příjemce")
+	thesis = models.ForeignKey(Thesis, related_name="+", on_delete=models.CASCADE, verbose_name="Práce")
+	kind = models.CharField(max_length=16, choices=KIND_CHOICES, verbose_name="Druh")
+	state = models.ForeignKey(State, related_name="+", on_delete=models.CASCADE, null=True, blank=True, verbose_name="Stav")
+	field = models.CharField(max_length=32, blank=True, verbose_name="Posudek")
+	created = models.DateTimeField(auto_now_add=True, verbose_name="Čas")
+
+	def __str__(self):
+		if self.kind == self.OPINION:
+			return f"{self.thesis.title}: {Thesis._meta.get_field(self.field).verbose_name.lower()} byl přidán"
+		return f"{self.thesis.title}: stav byl změněn na {self.state}"
+
+	@classmethod
+	def notify(cls, thesis, roles, exclude=None, **kwargs):
+		"""Queue a notification of the users in `roles` of the thesis (except the user with the pk `exclude`)"""
+		recipients = {getattr(thesis, f"{role}_id") for role in roles} - {None, exclude}
+		cls.objects.bulk_create([cls(recipient_id=pk, thesis=thesis, **kwargs) for pk in recipients])
+
+	class Meta:
+		verbose_name = "Upozornění"
+		verbose_name_plural = "Upozornění"
+
+
+@receiver(post_delete, sender=Thesis)
+def thesis_deleted(sender, instance, **kwargs):
+	ChangeEvent.objects.create(thesis_id=instance.pk, kind=ChangeEvent.DELETED)
+
+
+@receiver(m2m_changed, sender=Thesis.keywords.through)
+def keywords_changed(sender, instance, action, **kwargs):
+	if action.startswith("post_") and isinstance(instance, Thesis):
+		Thesis.objects.filter(pk=instance.pk).update(modified=timezone.now())
+		ChangeEvent.objects.create(thesis_id=instance.pk, kind=ChangeEvent.EDIT, fields=["keywords"])
+
+
+class ArchivedLogEntry(models.Model):
+	"""A log entry of a closed thesis removed from `LogEntry` by history compaction (see `submissions.history`)"""
+	id = models.UUIDField(primary_key=True, editable=False)
+
+	state = models.ForeignKey(
+		State, 
+		related_name="archived_log_entries", 
+		on_delete=models.PROTECT,
+		verbose_name="Stav")
+	thesis = models.ForeignKey(
+		Thesis, 
+		related_name="archived_log_entries", 
+		on_delete=models.CASCADE,
+		verbose_name="Práce")
+
+	user = models.ForeignKey(
+		User, 
+		related_name="archived_log_entries", 
+		on_delete=models.SET_NULL, 
+		verbose_name="Měnil",
+		null=True)
+	timestamp = models.DateTimeField(verbose_name="Čas")
+	archived = models.DateTimeField(auto_now_add=True, verbose_name="Archivováno")
+
+	def __str__(self):
+		return f"Uživatel {self.user} změnil stav práce {self.thesis} na {self.state}"
+
+	class Meta:
+		verbose_name = "Archivovaný záznam"
+		verbose_name_plural = "Archivované záznamy"
+
+		indexes = [
+			models.Index(fields=["thesis", "timestamp"], name="archivedlogentry_thesis_ts"),
+		]
+
 
 class ConsultationPeriod(models.Model):
 	"""A period in which `count` consultations must take place."""
@@ -432,7 +798,8 @@ class Consultation(models.Model):
 		return f"Konzultace {self.date}"
 
 	def save(self, **kwargs):
-		self.note = bleach.clean(self.note, tags=ALLOWED_TAGS)
+		with tracing.span("bleach.clean"):
+			self.note = bleach.clean(self.note, tags=ALLOWED_TAGS)
 
 		super().save(**kwargs)
 
@@ -481,3 +848,86 @@ class Link(SubmissionAttachment):
 
 	def __str__(self):
 		return self.url
+
+
+@receiver(post_save, sender=File)
+@receiver(post_save, sender=Link)
+@receiver(post_delete, sender=File)
+@receiver(post_delete, sender=Link)
+def attachment_changed(sender, instance, **kwargs):
+	ChangeEvent.objects.create(thesis_id=instance.thesis_id, kind=ChangeEvent.EDIT, fields=["attachments"])
+
+
+class FileText(models.Model):
+	"""
+		The text of a file attachment for the full-text search (see `submissions.extraction`),
+		normalized by `utils.normalize`. Extracted again only when the digest of the file changes.
+		On PostgreSQL the text has a trigram index for the search (see migration 0015).
+	"""
+	EXTRACTED = "extracted"
+	UNSUPPORTED = "unsupported"
+	TOO_LARGE = "too_large"
+	TIMEOUT = "timeout"
+	FAILED = "failed"
+
+	STATUS_CHOICES = [
+		(EXTRACTED, "Extrahován"),
+		(UNSUPPORTED, "Nepodporovaný formát"),
+		(TOO_LARGE, "Příliš velký soubor"),
+		(TIMEOUT, "Vypršel časový limit"),
+		(FAILED, "Chyba"),
+	]
+
+	file = models.OneToOneField(File, primary_key=True, related_name="text", on_delete=models.CASCADE, verbose_name="Soubor")
+	digest = models.CharField(max_length=64, verbose_name="Otisk (SHA-256)")
+	status = models.CharField(max_length=16, choices=STATUS_CHOICES, verbose_name="Stav")
+	text = models.TextField(blank=True, verbose_name="Text")
+	extracted = models.DateTimeField(auto_now=True, verbose_name="Čas")
+
+	def __str__(self):
+		return str(self.file)
+
+	class Meta:
+		verbose_name = "Text souboru"
+		verbose_name_plural = "Texty souborů"
+
+
+class Signature(models.Model):
+	"""
+		The MinHash signature of the text of all files of a thesis (see `submissions.similarity`),
+		with the digest of the text it was computed from.
+	"""
+	thesis = models.OneToOneField(Thesis, primary_key=True, related_name="signature", on_delete=models.CASCADE, verbose_name="Práce")
+	digest = models.CharField(max_length=64, verbose_name="Otisk textu (SHA-256)")
+	minhash = models.BinaryField(verbose_name="MinHash")
+	created = models.DateTimeField(auto_now=True, verbose_name="Čas")
+
+	def __str__(self):
+		return str(self.thesis)
+
+	class Meta:
+		verbose_name = "Otisk práce"
+		verbose_name_plural = "Otisky prací"
+
+
+class SignatureBand(models.Model):
+	"""A key of the LSH index of signatures, the hash of one band of a signature (see `minhash.band_keys`)"""
+	signature = models.ForeignKey(Signature, related_name="bands", on_delete=models.CASCADE)
+	key = models.BigIntegerField(db_index=True)
+
+
+class SlowQuery(models.Model):
+	"""A database query slower than `settings.SLOW_QUERY_THRESHOLD_MS`"""
+	timestamp = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="Čas")
+	view = models.CharField(max_length=255, verbose_name="Pohled")
+	call_site = models.CharField(max_length=255, verbose_name="Místo volání")
+	sql = models.TextField(verbose_name="SQL")
+	duration = models.FloatField(verbose_name="Doba trvání (ms)")
+	plan = models.TextField(blank=True, verbose_name="Plán dotazu")
+
+	def __str__(self):
+		return f"{self.view}: {self.duration:.0f} ms"
+
+	class Meta:
+		verbose_name = "Pomalý dotaz"
+		verbose_name_plural = "Pomalé dotazy"
@@ -0,0 +1,214 @@
+"""
+OAI-PMH 2.0 provider of the public archive for library harvesting.
+
+Public theses are exposed as Dublin Core (`oai_dc`) records with
+`Thesis.modified` as their datestamp. Lists are ordered by
+`(modified, id)` over an index and split into pages of
+`settings.OAI_PAGE_SIZE` records. The resumption token carries the
+arguments of the request and the position of the last record, so
+the provider keeps no state between the requests and a harvest of
+the whole archive runs in constant memory.
+"""
+from django.conf import settings
+from django.db.models import Min, Prefetch, Q
+from django.shortcuts import render
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+
+from .models import Thesis, Keyword, Subject
+
+from datetime import datetime, timedelta
+import base64
+import binascii
+import uuid
+
+
+GRANULARITY = "YYYY-MM-DDThh:mm:ssZ"
+DATESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+METADATA_FORMATS = {
+	"oai_dc": ("http://www.openarchives.org/OAI/2.0/oai_dc.xsd", "http://www.openarchives.org/OAI/2.0/oai_dc/"),
+}
+
+ARGUMENTS = {
+	"Identify": ([], []),
+	"ListMetadataFormats": ([], ["identifier"]),
+	"ListSets": ([], []),
+	"ListIdentifiers": (["metadataPrefix"], ["from", "until", "set"]),
+	"ListRecords": (["metadataPrefix"], ["from", "until", "set"]),
+	"GetRecord": (["identifier", "metadataPrefix"], []),
+}
+
+RESUMABLE = {"ListIdentifiers", "ListRecords"}
+
+
+class OAIError(Exception):
+	def __init__(self, code, message):
+		super().__init__(message)
+		self.code = code
+		self.message = message
+
+
+def parse_datestamp(value, end=False):
+	"""Parse a datestamp of either granularity, with `end` as the last microsecond of the second or day"""
+	try:
+		second = datetime.strptime(value, DATESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+	except ValueError:
+		pass
+	else:
+		return second + timedelta(seconds=1, microseconds=-1) if end else second
+	try:
+		day = datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+	except ValueError:
+		raise OAIError("badArgument", f"Invalid datestamp {value}.")
+	return day + timedelta(days=1, microseconds=-1) if end else day
+
+
+def identifier(request, pk):
+	return f"oai:{request.get_host().split(':')[0]}:{pk}"
+
+
+def parse_identifier(request, value):
+	"""Return the primary key of the thesis with the OAI identifier `value`"""
+	prefix = identifier(request, "")
+	try:
+		if not value.startswith(prefix):
+			raise ValueError
+		return uuid.UUID(value[len(prefix):])
+	except ValueError:
+		raise OAIError("idDoesNotExist", f"Unknown identifier {value}.")
+
+
+def encode_token(args, last):
+	"""Return a resumption token continuing after the record `last`"""
+	micros = (last.modified - EPOCH) // timedelta(microseconds=1)
+	raw = "|".join([args["metadataPrefix"], args.get("from", ""), args.get("until", ""), str(micros), str(last.pk)])
+	return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_token(token):
+	"""Return the arguments of the request and the position (datestamp, id) encoded in a resumption token"""
+	try:
+		prefix, from_, until, micros, pk = base64.urlsafe_b64decode(token.encode()).decode().split("|")
+		position = (EPOCH + timedelta(microseconds=int(micros)), uuid.UUID(pk))
+	except (ValueError, binascii.Error):
+		raise OAIError("badResumptionToken", "Invalid resumption token.")
+	args = {"metadataPrefix": prefix}
+	if from_:
+		args["from"] = from_
+	if until:
+		args["until"] = until
+	return args, position
+
+
+def parse_arguments(request):
+	"""Return the verb and its arguments, checked against the protocol"""
+	params = request.POST if request.method == "POST" else request.GET
+	if any(len(values) > 1 for _, values in params.lists()):
+		raise OAIError("badArgument", "Repeated argument.")
+	verb = params.get("verb")
+	if verb not in ARGUMENTS:
+		raise OAIError("badVerb", "Illegal OAI verb.")
+
+	args = {key: value for key, value in params.items() if key != "verb"}
+	if "resumptionToken" in args and verb in RESUMABLE:
+		if len(args) > 1:
+			raise OAIError("badArgument", "The resumption token is an exclusive argument.")
+		return verb, args
+
+	required, optional = ARGUMENTS[verb]
+	if set(args) - set(required) - set(optional) or set(required) - set(args):
+		raise OAIError("badArgument", f"Illegal or missing arguments of {verb}.")
+	if "metadataPrefix" in args and args["metadataPrefix"] not in METADATA_FORMATS:
+		raise OAIError("cannotDisseminateFormat", f"Unsupported metadata format {args['metadataPrefix']}.")
+	if "set" in args:
+		raise OAIError("noSetHierarchy", "This repository does not support sets.")
+	return verb, args
+
+
+def records(fields_only=False):
+	"""Public theses in the harvesting order, with all what is needed for their records"""
+	theses = Thesis.public.order_by("modified", "pk")
+	if fields_only:
+		return theses.only("pk", "modified")
+	return (theses
+		.select_related("author", "supervisor", "opponent")
+		.prefetch_related(Prefetch("keywords", Keyword.objects.only("title"))))
+
+
+def list_page(request, verb, args):
+	"""Return the page of records of `ListIdentifiers` or `ListRecords` and the context of its resumption token"""
+	position = None
+	if "resumptionToken" in args:
+		args, position = decode_token(args["resumptionToken"])
+
+	theses = records(fields_only=verb == "ListIdentifiers")
+	if "from" in args:
+		theses = theses.filter(modified__gte=parse_datestamp(args["from"]))
+	if "until" in args:
+		theses = theses.filter(modified__lte=parse_datestamp(args["until"], end=True))
+	if position:
+		modified, pk = position
+		theses = theses.filter(Q(modified__gt=modified) | Q(modified=modified, pk__gt=pk))
+
+	page = list(theses[:settings.OAI_PAGE_SIZE + 1])
+	if not page:
+		if position:
+			return [], {"token": ""}  # the last page was full, the list is complete
+		raise OAIError("noRecordsMatch", "No records match the arguments.")
+
+	resumption = None
+	if len(page) > settings.OAI_PAGE_SIZE:
+		page = page[:settings.OAI_PAGE_SIZE]
+		resumption = {"token": encode_token(args, page[-1])}
+	elif position:
+		resumption = {"token": ""}
+	return page, resumption
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def oai(request):
+	ctx = {
+		"now": timezone.now().strftime(DATESTAMP_FORMAT),
+		"base_url": request.build_absolute_uri(request.path),
+		"host": identifier(request, ""),
+		"params": {},
+	}
+
+	try:
+		verb, args = parse_arguments(request)
+		ctx["verb"] = verb
+		ctx["params"] = {"verb": verb, **args}
+
+		if verb == "Identify":
+			earliest = Thesis.public.aggregate(earliest=Min("modified"))["earliest"] or timezone.now()
+			ctx.update(
+				name=settings.OAI_REPOSITORY_NAME,
+				email=settings.OAI_ADMIN_EMAIL,
+				earliest=earliest.strftime(DATESTAMP_FORMAT),
+				granularity=GRANULARITY,
+			)
+		elif verb == "ListMetadataFormats":
+			if "identifier" in args and not Thesis.public.filter(pk=parse_identifier(request, args["identifier"])).exists():
+				raise OAIError("idDoesNotExist", f"Unknown identifier {args['identifier']}.")
+			ctx["formats"] = [(prefix, schema, namespace) for prefix, (schema, namespace) in METADATA_FORMATS.items()]
+		elif verb == "ListSets":
+			raise OAIError("noSetHierarchy", "This repository does not support sets.")
+		elif verb == "GetRecord":
+			try:
+				ctx["theses"] = [records().get(pk=parse_identifier(request, args["identifier"]))]
+			except Thesis.DoesNotExist:
+				raise OAIError("idDoesNotExist", f"Unknown identifier {args['identifier']}.")
+		else:
+			ctx["theses"], ctx["resumption"] = list_page(request, verb, args)
+	except OAIError as e:
+		ctx["error"] = e
+
+	if ctx.get("verb") in ("GetRecord", "ListRecords"):
+		labels = Subject.labels()
+		for thesis in ctx.get("theses", []):
+			thesis.subject_label = labels.get(thesis.subject_id)
+	return render(request, "submissions/oai.xml", ctx, content_type="text/xml; charset=utf-8")
@@ -0,0 +1,195 @@
+"""
+Static copies of the public archive.
+
+Pages of public theses (the detail and the opinions) and the archive
+indexes are rendered as an anonymous user into `settings.PUBLISH_ROOT`
+(`<path>/index.html` for every published path), from where nginx serves
+them to visitors without a session. Everything not rendered yet falls
+back to Django. The copies are updated by signals whenever a thesis or
+its history changes, `publisharchive` rebuilds all of them.
+"""
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.http import Http404, HttpRequest
+from django.urls import resolve, reverse
+
+from acceptor import queues, tracing
+
+from .models import Thesis, LogEntry, File, Link
+
+from pathlib import Path
+import os
+import shutil
+import tempfile
+
+
+def publish_root():
+	return Path(settings.PUBLISH_ROOT)
+
+
+def enabled():
+	return bool(settings.PUBLISH_ROOT)
+
+
+def render_path(path):
+	"""Render the page at `path` as an anonymous user, return its content or None when it is not public"""
+	match = resolve(path)
+	request = HttpRequest()
+	request.method = "GET"
+	request.path = request.path_info = path
+	request.META["SERVER_NAME"] = settings.ALLOWED_HOSTS[0]
+	request.META["SERVER_PORT"] = "80"
+	request.user = AnonymousUser()
+	request.resolver_match = match
+
+	try:
+		response = match.func(request, *match.args, **match.kwargs)
+	except (Http404, PermissionDenied):
+		return None
+	if hasattr(response, "render"):
+		response.render()
+	if response.status_code != 200:
+		return None
+	return response.content
+
+
+def file_of(path):
+	return publish_root() / path.strip("/") / "index.html"
+
+
+def write_path(path):
+	"""Publish the page at `path` or remove its stale copy, return whether it was published"""
+	content = render_path(path)
+	target = file_of(path)
+	if content is None:
+		target.unlink(missing_ok=True)
+		return False
+
+	target.parent.mkdir(parents=True, exist_ok=True)
+	fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=".index-")
+	with os.fdopen(fd, "wb") as f:
+		f.write(content)
+	os.chmod(tmp, 0o644)
+	os.replace(tmp, target)  # atomically, nginx never serves a partial page
+	return True
+
+
+def thesis_paths(pk):
+	return [
+		reverse("thesis-detail", kwargs={"pk": pk}),
+		reverse("thesis-supervisor-opinion", kwargs={"pk": pk}),
+		reverse("thesis-opponent-opinion", kwargs={"pk": pk}),
+	]
+
+
+def index_paths(year):
+	paths = [reverse("archive")]
+	if year is not None:
+		paths.append(reverse("archive-year", kwargs={"year": year}))
+	return paths
+
+
+def unpublish_thesis(pk):
+	"""Remove the copies of the pages of a thesis"""
+	shutil.rmtree(file_of(reverse("thesis-detail", kwargs={"pk": pk})).parent, ignore_errors=True)
+
+
+def publish_pages(pk):
+	"""Publish the pages of a thesis or remove them when it is not public, return its year (None when it does not exist)"""
+	thesis = Thesis.objects.filter(pk=pk).only("year").first()
+	if thesis is None or not write_path(thesis_paths(pk)[0]):
+		unpublish_thesis(pk)
+	else:
+		for path in thesis_paths(pk)[1:]:
+			write_path(path)
+	return thesis.year if thesis else None
+
+
+def publish_thesis(pk, year=None):
+	"""Publish the pages of a thesis and the indexes of its year, or remove them when it is not public"""
+	thesis_year = publish_pages(pk)
+	for path in index_paths(year if thesis_year is None else thesis_year):
+		write_path(path)
+
+
+def publish_all():
+	"""Rebuild the whole archive, return the number of published theses"""
+	for directory in ("thesis", "archive"):
+		shutil.rmtree(publish_root() / directory, ignore_errors=True)
+	count = 0
+	for pk in Thesis.public.values_list("pk", flat=True).iterator():
+		for path in thesis_paths(pk):
+			write_path(path)
+		count += 1
+	for year in Thesis.public_years():
+		write_path(reverse("archive-year", kwargs={"year": year}))
+	write_path(reverse("archive"))
+	return count
+
+
+def schedule(pk, year=None):
+	"""
+		Update the copies of a thesis after the current transaction commits.
+		Pages which are not public anymore are removed right away, the rendering is left to the task queue.
+	"""
+	if not enabled():
+		return
+
+	def update():
+		if not Thesis.public.filter(pk=pk).exists():
+			if not file_of(reverse("thesis-detail", kwargs={"pk": pk})).exists():
+				return  # has never been published, e.g. a current thesis
+			unpublish_thesis(pk)
+		tracing.async_task("submissions.publish.publish_thesis", pk, year, queue=queues.DOCUMENTS)
+
+	transaction.on_commit(update)
+
+
+def schedule_many(pks):
+	"""Publish the given theses after the current transaction commits, for changes made in bulk without signals"""
+	if enabled() and pks:
+		transaction.on_commit(lambda: tracing.async_task("submissions.publish.publish_theses", list(pks), queue=queues.DOCUMENTS))
+
+
+def publish_theses(pks):
+	"""Publish the pages of many theses, the index of every affected year only once"""
+	years = {publish_pages(pk) for pk in pks} - {None}
+	for year in sorted(years):
+		write_path(reverse("archive-year", kwargs={"year": year}))
+	write_path(reverse("archive"))
+
+
+@receiver(post_save, sender=Thesis)
+@receiver(post_delete, sender=Thesis)
+def thesis_changed(sender, instance, **kwargs):
+	schedule(instance.pk, instance.year)
+
+
+@receiver(post_save, sender=LogEntry)
+def state_changed(sender, instance, **kwargs):
+	schedule(instance.thesis_id)
+
+
+@receiver(post_delete, sender=LogEntry)
+def state_deleted(sender, instance, **kwargs):
+	# Removing an older entry (e.g. by history compaction) does not change the state
+	if enabled() and not LogEntry.objects.filter(thesis_id=instance.thesis_id, timestamp__gt=instance.timestamp).exists():
+		schedule(instance.thesis_id)
+
+
+@receiver(post_save, sender=File)
+@receiver(post_save, sender=Link)
+@receiver(post_delete, sender=File)
+@receiver(post_delete, sender=Link)
+def attachment_changed(sender, instance, **kwargs):
+	schedule(instance.thesis_id)
+
+
+@receiver(m2m_changed, sender=Thesis.keywords.through)
+def keywords_changed(sender, instance, action, **kwargs):
+	if action.startswith("post_") and isinstance(instance, Thesis):
+		schedule(instance.pk)
@@ -0,0 +1,71 @@
+"""
+Closing of a finished year.
+
+All theses of the year which are still open are closed in bulk:
+the evaluated ones (with a mark) are defended or failed according
+to the mark, the unfinished ones are archived in the `unfinished`
+state. The theses are processed in chunks ordered by their primary
+keys, each chunk in its own transaction, so the memory stays bounded
+and an interrupted run is resumed simply by running it again, because
+the already closed theses are not open anymore.
+"""
+from django.db import transaction
+
+from collections import Counter
+
+from . import publish
+from .models import Thesis, State
+
+
+DEFENDED = "defended"
+FAILED = "failed"
+UNFINISHED = "unfinished"
+
+FAILING_MARK = 5
+
+
+def closing_state(mark):
+	"""Return the code of the state into which a thesis with `mark` is closed"""
+	if mark is None:
+		return UNFINISHED
+	return FAILED if mark == FAILING_MARK else DEFENDED
+
+
+def open_states():
+	return [code for code, state in State.registry().items() if not state.is_closed]
+
+
+@transaction.atomic
+def close_chunk(pks, user=None, dry_run=False):
+	"""Close the given theses, return a counter of the theses per the state they were (or would be) closed into"""
+	by_state = {}
+	for pk, mark in Thesis.objects.filter(pk__in=pks, current_state__in=open_states()).values_list("pk", "mark"):
+		by_state.setdefault(closing_state(mark), []).append(pk)
+	if dry_run:
+		return Counter({state: len(state_pks) for state, state_pks in by_state.items()})
+
+	counts = Counter()
+	published = []
+	for state, state_pks in by_state.items():
+		moved = Thesis.transition_many(state_pks, open_states(), state, user)
+		counts[state] = len(moved)
+		if State.get(state).is_public:
+			published.extend(moved)
+	publish.schedule_many(published)
+	return counts
+
+
+def close_year(year, chunk_size=500, user=None, dry_run=False):
+	"""
+		Close all open theses of `year` in chunks of `chunk_size`.
+		Yield a counter of the theses closed into every state per chunk.
+	"""
+	theses = Thesis.objects.filter(year=year, current_state__in=open_states()).order_by("pk")
+	last = None
+	while True:
+		chunk = theses if last is None else theses.filter(pk__gt=last)
+		pks = list(chunk.values_list("pk", flat=True)[:chunk_size])
+		if not pks:
+			return
+		yield close_chunk(pks, user, dry_run)
+		last = pks[-1]
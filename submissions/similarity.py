@@ -0,0 +1,132 @@
+"""
+Near-duplicate detection of theses across the archive.
+
+Every thesis with extracted texts (see `submissions.extraction`) has a
+`Signature`, the MinHash of the text of all its files (see
+`submissions.minhash`), and a `SignatureBand` row for each of its LSH
+keys. `similar_theses` finds the candidates by an indexed lookup of the
+keys and ranks only them by the estimated similarity, so a report costs
+three queries whatever the size of the archive. Signatures are updated
+after every extraction, `indexsimilarity` builds them for the whole
+archive in a process pool.
+"""
+from django import db
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from acceptor import queues, tracing
+
+from . import minhash
+from .models import File, FileText, Signature, SignatureBand, Thesis
+
+from collections import defaultdict
+import hashlib
+import multiprocessing
+
+
+def text_digest(text):
+	return hashlib.sha256(text.encode()).hexdigest()
+
+
+def thesis_texts(pks):
+	"""Return a dictionary mapping the theses `pks` to the text of all their files"""
+	texts = defaultdict(list)
+	for pk, text in (FileText.objects
+		.filter(file__thesis__in=pks, status=FileText.EXTRACTED)
+		.order_by("file")
+		.values_list("file__thesis", "text")):
+		texts[pk].append(text)
+	return {pk: " ".join(parts) for pk, parts in texts.items()}
+
+
+def store(pk, digest, signature):
+	"""Replace the signature of the thesis `pk` and its keys, remove it when `signature` is None"""
+	with transaction.atomic():
+		Signature.objects.filter(pk=pk).delete()
+		if signature is None:
+			return
+		Signature.objects.create(thesis_id=pk, digest=digest, minhash=minhash.pack(signature))
+		SignatureBand.objects.bulk_create([SignatureBand(signature_id=pk, key=key) for key in minhash.band_keys(signature)])
+
+
+def index_thesis(pk):
+	"""Update the signature of a thesis unless its text has not changed"""
+	text = thesis_texts([pk]).get(pk, "")
+	digest = text_digest(text)
+	if Signature.objects.filter(pk=pk, digest=digest).exists():
+		return
+	with tracing.span("similarity.signature"):
+		store(pk, digest, minhash.signature(text))
+
+
+def index_archive(processes=None, chunk_size=100):
+	"""
+		Update the signatures of all theses with extracted texts, computing them in a pool
+		of `processes` worker processes (one per CPU by default, no pool for 1).
+		Theses are read in chunks of `chunk_size` by primary key, unchanged ones are skipped.
+		Return the number of updated signatures.
+	"""
+	theses = (Thesis.objects
+		.filter(pk__in=FileText.objects.filter(status=FileText.EXTRACTED).values("file__thesis"))
+		.order_by("pk")
+		.values_list("pk", flat=True))
+
+	db.connections.close_all()  # not to share the connections with the forked workers
+	pool = multiprocessing.Pool(processes) if processes != 1 else None
+	count = 0
+	last = None
+	try:
+		while True:
+			pks = list((theses.filter(pk__gt=last) if last else theses)[:chunk_size])
+			if not pks:
+				return count
+			last = pks[-1]
+
+			texts = thesis_texts(pks)
+			digests = {pk: text_digest(text) for pk, text in texts.items()}
+			current = dict(Signature.objects.filter(pk__in=pks).values_list("pk", "digest"))
+			changed = [pk for pk in pks if current.get(pk) != digests[pk]]
+
+			signatures = (pool.map if pool else map)(minhash.signature, [texts[pk] for pk in changed])
+			for pk, signature in zip(changed, signatures):
+				store(pk, digests[pk], signature)
+			count += len(changed)
+	finally:
+		if pool:
+			pool.terminate()
+
+
+def similar_theses(thesis, limit=None):
+	"""
+		Return up to `limit` (`settings.SIMILARITY_RESULTS` by default) theses of the past years
+		similar to `thesis` as pairs (thesis, estimated similarity 0-1), the most similar first.
+	"""
+	signature = Signature.objects.filter(pk=thesis.pk).only("minhash").first()
+	if signature is None or thesis.year is None:
+		return []
+	signature = minhash.unpack(signature.minhash)
+
+	candidates = list(SignatureBand.objects
+		.filter(key__in=minhash.band_keys(signature), signature__thesis__year__lt=thesis.year)
+		.values_list("signature", flat=True)
+		.distinct()[:settings.SIMILARITY_MAX_CANDIDATES])
+
+	results = []
+	for candidate in Signature.objects.filter(pk__in=candidates).select_related("thesis"):
+		score = minhash.similarity(signature, minhash.unpack(candidate.minhash))
+		if score >= settings.SIMILARITY_THRESHOLD:
+			results.append((candidate.thesis, score))
+	results.sort(key=lambda result: result[1], reverse=True)
+	return results[:limit or settings.SIMILARITY_RESULTS]
+
+
+def schedule(pk):
+	"""Update the signature of a thesis after the current transaction commits"""
+	transaction.on_commit(lambda: tracing.async_task("submissions.similarity.index_thesis", pk, queue=queues.DOCUMENTS))
+
+
+@receiver(post_delete, sender=File)
+def file_deleted(sender, instance, **kwargs):
+	schedule(instance.thesis_id)
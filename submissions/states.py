@@ -0,0 +1,84 @@
+"""
+The state machine of a thesis.
+
+Every transition is a row of `TRANSITIONS`: in one of the `from` states,
+a user with the `role` (author, supervisor or opponent of the thesis)
+can perform the `action`, which moves the thesis into the `to` state.
+The table is compiled on import into dictionaries, so that performing
+a transition or listing the available actions costs no queries.
+"""
+from collections import defaultdict
+
+
+ROLES = ["author", "supervisor", "opponent"]
+
+NOT_APPROVED = ["supervisor_approved", "author_approved"]
+SUBMITTED = ["submitted", "defense_ready", "postponed"]
+
+# (from states, role, action, to state)
+TRANSITIONS = [
+	(["supervisor_approved"], "author", "edit_assignment", "author_approved"),
+	(["author_approved"], "supervisor", "edit_assignment", "supervisor_approved"),
+	(["supervisor_approved"], "author", "approve", "approved"),
+	(["author_approved"], "supervisor", "approve", "approved"),
+	(["approved"], "author", "submit", "submitted"),
+	(SUBMITTED, "author", "cancel_submit", "approved"),
+	(NOT_APPROVED + ["approved", "submitted", "postponed"], "supervisor", "complete_opinions", "defense_ready"),
+	(NOT_APPROVED + ["approved", "submitted", "postponed"], "opponent", "complete_opinions", "defense_ready"),
+]
+
+
+# State -> roles notified when a thesis enters it (see `models.Notification`)
+NOTIFICATIONS = {
+	"supervisor_approved": ["author"],
+	"author_approved": ["supervisor"],
+	"approved": ["author", "supervisor"],
+	"submitted": ["supervisor", "opponent"],
+}
+
+# Opinion -> roles notified when it is added
+OPINION_NOTIFICATIONS = {
+	"supervisor_opinion": ["author", "opponent"],
+	"opponent_opinion": ["author", "supervisor"],
+}
+
+
+def compile_transitions(transitions):
+	"""
+		Return the dictionaries `(state, role) -> available actions`
+		and `(action, role) -> {to state: [from states]}` of a transition table.
+	"""
+	table = {}
+	actions = defaultdict(set)
+	targets = defaultdict(lambda: defaultdict(list))
+	for from_states, role, action, to_state in transitions:
+		assert role in ROLES, f"unknown role {role}"
+		for state in from_states:
+			key = (state, role, action)
+			assert key not in table, f"ambiguous transition {key}"
+			table[key] = to_state
+			actions[state, role].add(action)
+			targets[action, role][to_state].append(state)
+	return dict(actions), {key: dict(value) for key, value in targets.items()}
+
+
+ACTIONS, TARGETS = compile_transitions(TRANSITIONS)
+
+
+def states_used():
+	"""All state codes used by the transition table"""
+	return {state for from_states, _, _, to_state in TRANSITIONS for state in [*from_states, to_state]}
+
+
+def available_actions(state, roles):
+	"""Return the set of actions available in `state` to a user with `roles`"""
+	return set().union(*(ACTIONS.get((state, role), ()) for role in roles))
+
+
+def targets(action, roles):
+	"""Return a dictionary mapping the states into which `action` of a user with `roles` leads to the states it leads from"""
+	result = defaultdict(list)
+	for role in filter(roles.__contains__, ROLES):
+		for to_state, from_states in TARGETS.get((action, role), {}).items():
+			result[to_state].extend(from_states)
+	return dict(result)
@@ -0,0 +1,49 @@
+/*
+ * Suggestions for inputs with a `data-autocomplete` attribute holding
+ * the URL of an autocomplete endpoint. Inputs with
+ * `data-autocomplete-separator` complete only their last item.
+ */
+window.addEventListener("load", function() {
+	var inputs = document.querySelectorAll("input[data-autocomplete]");
+	for (let i = 0; i < inputs.length; i++) {
+		let input = inputs[i];
+		let separator = input.dataset.autocompleteSeparator;
+		let list = document.createElement("datalist");
+		let timer = null;
+
+		list.id = input.id + "-suggestions";
+		input.after(list);
+		input.setAttribute("list", list.id);
+		input.setAttribute("autocomplete", "off");
+
+		input.addEventListener("input", function() {
+			clearTimeout(timer);
+			timer = setTimeout(function() {
+				let head = "";
+				let query = input.value;
+				if (separator) {
+					let parts = input.value.split(separator);
+					query = parts.pop().trim();
+					head = parts.map(x => x.trim()).filter(x => x).join(separator + " ");
+					if (head) {
+						head += separator + " ";
+					}
+				}
+				if (!query) {
+					return;
+				}
+
+				fetch(input.dataset.autocomplete + "?q=" + encodeURIComponent(query))
+					.then(response => response.json())
+					.then(function(data) {
+						list.innerHTML = "";
+						for (let j = 0; j < data.results.length; j++) {
+							let option = document.createElement("option");
+							option.value = head + data.results[j];
+							list.append(option);
+						}
+					});
+			}, 150);
+		});
+	}
+});
@@ -0,0 +1,95 @@
+/*
+ * A subject picker for selects with a `data-subjects` attribute holding
+ * the URL of the subjects endpoint. The tree is loaded level by level
+ * as it is expanded, a search box finds subjects by their full label.
+ */
+window.addEventListener("load", function() {
+	var selects = document.querySelectorAll("select[data-subjects]");
+	for (let i = 0; i < selects.length; i++) {
+		let select = selects[i];
+		let url = select.dataset.subjects;
+
+		let picker = document.createElement("details");
+		let summary = document.createElement("summary");
+		let search = document.createElement("input");
+		let results = document.createElement("ul");
+		let tree = document.createElement("ul");
+		let timer = null;
+
+		summary.textContent = "Vybrat předmět";
+		search.type = "search";
+		search.placeholder = "Hledat předmět";
+		picker.append(summary, search, results, tree);
+		select.after(picker);
+
+		function choose(subject) {
+			let option = select.querySelector("option[value='" + subject.id + "']");
+			if (!option) {
+				option = document.createElement("option");
+				option.value = subject.id;
+				option.textContent = subject.label;
+				select.append(option);
+			}
+			select.value = subject.id;
+			picker.open = false;
+		}
+
+		function load(params, list) {
+			fetch(url + "?" + new URLSearchParams(params))
+				.then(response => response.json())
+				.then(function(data) {
+					list.innerHTML = "";
+					for (let j = 0; j < data.results.length; j++) {
+						list.append(node(data.results[j], list === results));
+					}
+				});
+		}
+
+		function node(subject, flat) {
+			let item = document.createElement("li");
+			let link = document.createElement("a");
+			link.href = "#";
+			link.textContent = flat ? subject.label : subject.title;
+			link.addEventListener("click", function(event) {
+				event.preventDefault();
+				choose(subject);
+			});
+			item.append(link);
+
+			if (subject.children && !flat) {
+				let children = document.createElement("ul");
+				let toggle = document.createElement("a");
+				toggle.href = "#";
+				toggle.textContent = " ▸";
+				toggle.addEventListener("click", function(event) {
+					event.preventDefault();
+					if (!children.childElementCount) {
+						load({parent: subject.id}, children);
+					}
+					children.hidden = !children.hidden;
+					toggle.textContent = children.hidden ? " ▸" : " ▾";
+				});
+				children.hidden = true;
+				item.append(toggle, children);
+			}
+			return item;
+		}
+
+		picker.addEventListener("toggle", function() {
+			if (picker.open && !tree.childElementCount) {
+				load({}, tree);
+			}
+		});
+
+		search.addEventListener("input", function() {
+			clearTimeout(timer);
+			timer = setTimeout(function() {
+				if (search.value.trim()) {
+					load({q: search.value.trim()}, results);
+				} else {
+					results.innerHTML = "";
+				}
+			}, 150);
+		});
+	}
+});
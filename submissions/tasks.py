@@ -1,20 +1,29 @@
 from django.core.mail import send_mail
 from django.conf import settings
+from django.db import transaction
 from django.template.loader import render_to_string
-from django_q.tasks import async_task
 
-from .models import Thesis, ConsultationPeriod, Consultation, User
+from acceptor import queues, tracing
+
+from .history import compact_all
+from . import rollover
+from .models import Thesis, ConsultationPeriod, Consultation, User, Notification
 from datetime import date
+import logging
+
+
+logger = logging.getLogger(__name__)
 
 
 def notify(email, thesis, have, required, remaining_days):
-	send_mail(
-		settings.CONSULTATION_EMAIL_SUBJECT,
-		render_to_string("submissions/emails/consultation.txt", {"thesis": thesis, "required": required, "have": have, "remaining_days": remaining_days}),
-		None,
-		[email],
-		fail_silently=False,
-	)
+	with tracing.span("email.send"):
+		send_mail(
+			settings.CONSULTATION_EMAIL_SUBJECT,
+			render_to_string("submissions/emails/consultation.txt", {"thesis": thesis, "required": required, "have": have, "remaining_days": remaining_days}),
+			None,
+			[email],
+			fail_silently=False,
+		)
 
 
 def notifications(remaining=settings.CONSULTATION_EMAIL_DAYS_LEFT):
@@ -31,4 +40,57 @@ def notifications(remaining=settings.CONSULTATION_EMAIL_DAYS_LEFT):
 
 				if cons.count() < period.count:
 					if thesis.author and thesis.author.email:
-						async_task("submissions.tasks.notify", thesis.author.email, thesis, cons.count(), period.count, remaining)
+						tracing.async_task("submissions.tasks.notify", thesis.author.email, thesis, cons.count(), period.count, remaining, queue=queues.EMAIL)
+
+
+def compact_history():
+	"""Archive the redundant log entries of theses closed in the past years"""
+	return sum(entries for _, entries in compact_all())
+
+
+def close_year(year, chunk_size=500):
+	"""Close all open theses of a finished year (see `submissions.rollover`), return the number of closed theses"""
+	return sum(sum(counts.values()) for counts in rollover.close_year(year, chunk_size))
+
+
+def send_digests():
+	"""
+		Send every user with pending notifications a single email summarizing them.
+		The notifications of a user are removed in the transaction of sending them,
+		so when the email fails, they are sent again by the next run. A failure
+		is logged and does not stop the digests of the other users.
+		Return the number of sent emails.
+	"""
+	sent = 0
+	for recipient in User.objects.filter(pk__in=Notification.objects.values("recipient")).iterator():
+		try:
+			sent += send_digest(recipient)
+		except OSError:  # including SMTPException, e.g. a refused address
+			logger.exception("Could not send the digest to %s", recipient.email)
+	return sent
+
+
+@transaction.atomic
+def send_digest(recipient):
+	"""Send the digest of the pending notifications of a user, return the number of sent emails"""
+	notifications = list(Notification.objects
+		.select_for_update(skip_locked=True, of=("self",))
+		.filter(recipient=recipient)
+		.select_related("thesis", "state")
+		.order_by("created"))
+	if not notifications:
+		return 0  # sent by another worker in the meantime
+
+	sent = 0
+	if recipient.email:
+		with tracing.span("email.send"):
+			send_mail(
+				settings.NOTIFICATION_EMAIL_SUBJECT,
+				render_to_string("submissions/emails/digest.txt", {"notifications": notifications, "host": settings.ALLOWED_HOSTS[-1]}),
+				None,
+				[recipient.email],
+				fail_silently=False,
+			)
+		sent = 1
+	Notification.objects.filter(pk__in=[notification.pk for notification in notifications]).delete()
+	return sent
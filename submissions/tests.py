@@ -1,12 +1,35 @@
-from django.test import TestCase
-
-from django.contrib.auth.models import Group
-from django.core.exceptions import PermissionDenied
-
+from django.test import TestCase, TransactionTestCase, LiveServerTestCase, override_settings
+
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django import db
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+import io
+import json
+import os
 import re
-
-from . import models
+import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
+from xml.etree import ElementTree
+
+from acceptor import metrics, tracing
+from acceptor.accounts import SubmissionAccountAdapter, sync_roster
+from acceptor.slowqueries import record_slow_queries
+from . import models, extraction, feed, forms, minhash, publish, rollover, similarity, states, tasks
 from .models import Thesis
+from .imports import ThesisImporter
+from .utils import prefix_filter
 
 
 class ThesisTestCase(TestCase):
@@ -48,6 +71,16 @@ class ThesisTestCase(TestCase):
 		self.assertTrue(self.thesis.assignment_update(self.author))
 		self.assertEqual(self.thesis.state.code, "author_approved")
 
+	def test_assignment_update_own_thesis(self):
+		self.thesis.supervisor = self.author
+		self.thesis.save()
+		self.thesis.set_state_code("author_approved", self.author)
+		self.assertTrue(self.thesis.assignment_update(self.author))
+		self.assertEqual(self.thesis.state.code, "author_approved")
+		self.thesis.set_state_code("supervisor_approved", self.author)
+		self.assertTrue(self.thesis.assignment_update(self.author))
+		self.assertEqual(self.thesis.state.code, "author_approved")
+
 	def test_approval(self):
 		self.thesis.set_state_code("author_approved", self.author)
 		self.assertFalse(self.thesis.state.is_approved)
@@ -82,6 +115,14 @@ class ThesisTestCase(TestCase):
 		self.assertFalse(self.thesis.submit(self.author))
 		self.assertFalse(self.thesis.cancel_submit(self.author))
 
+	def test_cancel_submit_button(self):
+		# Offered only in the submitted state, as the other submitted states are up to the teachers
+		self.client.force_login(self.author)
+		for code, shown in [("submitted", True), ("defense_ready", False), ("postponed", False)]:
+			self.thesis.set_state_code(code, self.supervisor)
+			res = self.client.get(self.thesis.get_absolute_url())
+			self.assertEqual("Zrušit odevzdání" in res.content.decode(), shown, code)
+
 
 class SystemTestCase(TestCase):
 	def setUp(self):
@@ -123,7 +164,10 @@ class SystemTestCase(TestCase):
 
 		res = self.client.post("/thesis/create/")
 		self.assertContains(res, "Toto pole je třeba vyplnit.")
-		self.assertInHTML('<option value="2">Humanitní studia, Filosofie</option>', res.content.decode())
+		self.assertContains(res, 'data-subjects="/subjects/"')
+
+		res = self.client.post("/thesis/create/", {"subject": models.Subject.objects.get(title="Filosofie").pk})
+		self.assertInHTML('<option value="2" selected>Humanitní studia, Filosofie</option>', res.content.decode())
 
 		res = self.client.post("/thesis/create/", {
 				"title": "Testovací práce", 
@@ -301,3 +345,1106 @@ class SystemTestCase(TestCase):
 		self.assertEquals(thesis.state.code, "defended")
 
 		return thesis
+
+
+class ThesisImportTestCase(TestCase):
+	def setUp(self):
+		super().setUp()
+
+		self.teacher = models.User.objects.create(username="john", first_name="John", last_name="Doe", is_staff=True)
+		self.student = models.User.objects.create(username="adam", first_name="Adam", last_name="Smith")
+		subject = models.Subject.objects.create(title="Humanitní studia")
+		self.subsubject = models.Subject.objects.create(title="Filosofie", parent=subject)
+		models.Keyword.objects.create(title="etika")
+
+	def test_import(self):
+		rows = [
+			{"title": "První práce", "subject": "Humanitní studia, Filosofie", "keywords": "etika, logika", "year": "2030"},
+			{"title": "Druhá práce", "subject": str(self.subsubject.pk), "author": "adam", "supervisor": "john"},
+			{"title": "Třetí práce", "subject": str(self.subsubject.pk), "author": "adam", "assignment": "<script>x</script>"},
+		]
+
+		importer = ThesisImporter(rows, self.teacher)
+		self.assertTrue(importer.is_valid())
+		importer.save()
+
+		first = Thesis.objects.get(title="První práce")
+		self.assertEqual(first.supervisor, self.teacher)
+		self.assertEqual(first.year, 2030)
+		self.assertEqual(first.state.code, "supervisor_approved")
+		self.assertEqual(sorted(map(str, first.keywords.all())), ["etika", "logika"])
+		self.assertEqual(models.Keyword.objects.filter(title="etika").count(), 1)
+
+		self.assertEqual(Thesis.objects.get(title="Druhá práce").state.code, "supervisor_approved")
+		third = Thesis.objects.get(title="Třetí práce")
+		self.assertEqual(third.state.code, "author_approved")
+		self.assertNotIn("<script>", third.assignment)
+
+		self.assertEqual(
+			sorted(models.ChangeEvent.objects.filter(thesis_id=first.pk).values_list("kind", "state")),
+			[("created", ""), ("state", "supervisor_approved")],
+		)
+		self.assertEqual(models.ChangeEvent.objects.filter(kind="created").count(), 3)
+
+	def test_invalid_rows(self):
+		rows = [
+			{"title": "Dobrá práce", "subject": "Humanitní studia"},
+			{"title": "", "subject": "Neexistující"},
+			{"title": "Špatný autor", "subject": "Humanitní studia", "author": "nobody", "year": "letos"},
+		]
+
+		importer = ThesisImporter(rows, self.teacher)
+		self.assertFalse(importer.is_valid())
+		self.assertEqual([row for row, _ in importer.errors], [2, 2, 3, 3])
+		self.assertFalse(Thesis.objects.exists())
+
+	def test_upload(self):
+		self.client.force_login(self.student)
+		self.assertEqual(self.client.get("/thesis/import/").status_code, 403)
+
+		self.teacher.user_permissions.add(Permission.objects.get(codename="add_thesis"))
+		self.client.force_login(self.teacher)
+
+		upload = SimpleUploadedFile("theses.csv", "title,subject,keywords\nNová práce,Humanitní studia,\"etika,logika\"\n".encode())
+		self.assertContains(self.client.post("/thesis/import/", {"file": upload}), "Úspěšně importováno 1 prací")
+		self.assertEqual(Thesis.objects.get(title="Nová práce").keywords.count(), 2)
+
+		upload = SimpleUploadedFile("theses.json", '[{"title": "Chybná"}]'.encode())
+		self.assertContains(self.client.post("/thesis/import/", {"file": upload}), "řádek 1")
+
+
+class RosterTestCase(TestCase):
+	def test_sync_roster(self):
+		models.User.objects.create(username="xnovak5", first_name="Jan", last_name="Novák", email="xnovak5@gjk.cz")
+		rows = [
+			{"email": "xnovak5@gjk.cz", "first_name": "Jan", "last_name": "Nováček"},
+			{"email": "XDVORAK1@gjk.cz", "first_name": "Eva", "last_name": "Dvořáková"},
+			{"email": "svoboda@gjk.cz", "first_name": "Petr", "last_name": "Svoboda"},
+			{"email": "someone@example.com", "first_name": "Cizí", "last_name": "Člověk"},
+		]
+
+		self.assertEqual(sync_roster(rows)[:2], (2, 1))
+		self.assertEqual(sync_roster(rows), (0, 0, [(4, "email someone@example.com is not in the domain gjk.cz")]))
+
+		self.assertEqual(models.User.objects.get(username="xnovak5").last_name, "Nováček")
+		self.assertTrue(models.User.objects.get(username="xdvorak1").groups.filter(name="Studenti").exists())
+		teacher = models.User.objects.get(username="svoboda")
+		self.assertTrue(teacher.groups.filter(name="Učitelé").exists())
+		self.assertFalse(teacher.has_usable_password())
+
+	def test_social_login(self):
+		from allauth.account.models import EmailAddress
+		from allauth.socialaccount.models import SocialAccount, SocialLogin
+
+		sync_roster([{"email": "xnovak5@gjk.cz"}, {"email": "svoboda@gjk.cz"}])
+		models.User.objects.filter(username="svoboda").update(is_staff=True)
+		adapter = SubmissionAccountAdapter()
+
+		def linked_user(email, verified=True):
+			sociallogin = SocialLogin(account=SocialAccount(provider="google"), email_addresses=[EmailAddress(email=email, verified=verified)])
+			with mock.patch.object(sociallogin, "connect") as connect:
+				adapter.pre_social_login(None, sociallogin)
+			return connect.call_args.args[1].username if connect.called else None
+		self.assertEqual(linked_user("XNovak5@gjk.cz"), "xnovak5")
+		self.assertIsNone(linked_user("xnovak5@gjk.cz", verified=False))
+		self.assertIsNone(linked_user("svoboda@gjk.cz"))  # the staff
+		self.assertIsNone(linked_user("xnovak5@example.com"))
+
+		user = adapter.populate_user(None, SocialLogin(user=models.User()), {"email": "XNovak5@gjk.cz"})
+		self.assertEqual((user.username, user.email), ("xnovak5", "xnovak5@gjk.cz"))
+
+
+class ArchiveSearchTestCase(TestCase):
+	def setUp(self):
+		super().setUp()
+
+		subject = models.Subject.objects.create(title="Humanitní studia")
+		defended = models.State.objects.get(code="defended")
+		self.etika, self.logika = models.Keyword.objects.bulk_create([
+			models.Keyword(title="etika"), models.Keyword(title="logika"),
+		])
+
+		self.both = Thesis.objects.create(title="Etika a logika", subject=subject)
+		self.both.keywords.set(models.Keyword.objects.all())
+		self.one = Thesis.objects.create(title="Etika", subject=subject)
+		self.one.keywords.set(models.Keyword.objects.filter(title="etika"))
+		for thesis in (self.both, self.one):
+			thesis.set_state(defended, None)
+
+	def search(self, **data):
+		form = forms.SearchForm(data=data)
+		self.assertTrue(form.is_valid())
+		return set(form.get_queryset())
+
+	def test_keywords(self):
+		self.assertEqual(self.search(keywords="etika"), {self.both, self.one})
+		self.assertEqual(self.search(keywords="etika, logika"), {self.both})
+		self.assertEqual(self.search(keywords="logika, etika, logika"), {self.both})
+		self.assertFalse(forms.SearchForm(data={"keywords": "etika, rétorika"}).is_valid())
+
+	def test_keyword_update(self):
+		field = forms.KeywordUpdateField()
+		keywords = field.clean(["logika", "rétorika", "rétorika", ""])
+		self.assertEqual([kw.title for kw in keywords], ["logika", "rétorika"])
+		self.assertEqual(keywords[0], self.logika)
+		self.assertEqual(models.Keyword.objects.count(), 3)
+
+
+class AutocompleteTestCase(TestCase):
+	def setUp(self):
+		super().setUp()
+		cache.clear()
+
+	def test_keywords(self):
+		models.Keyword.objects.bulk_create([
+			models.Keyword(title=title) for title in ["Štěstí", "štěstí", "Stát", "Sociologie", "etika"]
+		])
+
+		res = self.client.get("/autocomplete/keywords/", {"q": "ST"})
+		self.assertEqual(sorted(res.json()["results"]), ["Stát", "Štěstí", "štěstí"])
+		self.assertEqual(self.client.get("/autocomplete/keywords/", {"q": "šťě"}).json()["results"], ["Štěstí", "štěstí"])
+		self.assertEqual(self.client.get("/autocomplete/keywords/", {"q": ""}).json()["results"], [])
+		self.assertEqual(self.client.get("/autocomplete/unknown/", {"q": "a"}).status_code, 404)
+
+	def test_titles(self):
+		subject = models.Subject.objects.create(title="Humanitní studia")
+		public = Thesis.objects.create(title="Úvod do etiky", subject=subject)
+		public.set_state_code("defended", None)
+		Thesis.objects.create(title="Úvod do logiky", subject=subject).set_state_code("submitted", None)
+
+		self.assertEqual(self.client.get("/autocomplete/titles/", {"q": "uvod"}).json()["results"], ["Úvod do etiky"])
+
+	def test_prefix_filter(self):
+		models.Keyword.objects.bulk_create([models.Keyword(title=title) for title in ["ab", "abc", "abz", "abzz", "ac", "a", "b"]])
+
+		def matching(prefix):
+			return sorted(models.Keyword.objects.filter(prefix_filter("normalized", prefix)).values_list("title", flat=True))
+		self.assertEqual(matching("ab"), ["ab", "abc", "abz", "abzz"])
+		self.assertEqual(matching("abz"), ["abz", "abzz"])
+		self.assertEqual(matching("abd"), [])
+		self.assertEqual(len(matching("")), 7)
+
+	@skipUnless(os.environ.get("PERFORMANCE_TESTS"), "set PERFORMANCE_TESTS=1 to check the latency budgets")
+	def test_latency(self):
+		words = ["etika", "logika", "rétorika", "sociologie", "filosofie", "matematika", "fyzika", "chemie", "biologie", "dějepis"]
+		models.Keyword.objects.bulk_create(
+			[models.Keyword(title=f"{words[i % len(words)]} {i}") for i in range(100000)],
+			batch_size=5000,
+		)
+
+		timings = []
+		for i in range(200):
+			prefix = f"{words[i % len(words)]} {i}"
+			cache.clear()  # the lookup, not the cache
+			start = time.perf_counter()
+			res = self.client.get("/autocomplete/keywords/", {"q": prefix})
+			timings.append(time.perf_counter() - start)
+			self.assertIn(prefix, res.json()["results"][0])
+
+		timings.sort()
+		self.assertLess(timings[int(len(timings) * 0.99)], 0.020)
+
+
+class MetricsTestCase(TestCase):
+	def setUp(self):
+		super().setUp()
+		self.staff = models.User.objects.create(username="admin", is_staff=True)
+
+	def test_metrics(self):
+		self.client.get("/")
+		self.assertEqual(self.client.get("/metrics").status_code, 403)
+
+		self.client.force_login(self.staff)
+		res = self.client.get("/metrics")
+		self.assertEqual(res.status_code, 200)
+		content = res.content.decode()
+		self.assertIn('acceptor_requests_total{method="GET",status="200",view="index"}', content)
+		self.assertIn('acceptor_request_duration_seconds_bucket{view="index",le="+Inf"}', content)
+		self.assertIn('acceptor_template_render_seconds_count{view="index"}', content)
+
+	def test_multiprocess(self):
+		with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+			other = metrics.Metrics()
+			other.inc("acceptor_db_queries_total", 1000, view="elsewhere")
+			other.flush(force=True)
+
+			self.client.force_login(self.staff)
+			self.assertContains(self.client.get("/metrics"), 'acceptor_db_queries_total{view="elsewhere"} 1000')
+
+			# The counts of an exited process are kept in the aggregate
+			dead = Path(directory) / "metrics-999999999-dead.json"
+			dead.write_text(json.dumps({"counters": [["acceptor_db_queries_total", [["view", "dead"]], 7]], "histograms": []}))
+			for _ in range(2):
+				self.assertContains(self.client.get("/metrics"), 'acceptor_db_queries_total{view="dead"} 7')
+			self.assertFalse(dead.exists())
+			self.assertTrue((Path(directory) / metrics.AGGREGATE).exists())
+
+
+class BenchmarkTestCase(TestCase):
+	def test_gendata_and_benchmark(self):
+		call_command("gendata", theses=60, years=3, depth=2, keywords=30, stdout=io.StringIO())
+		self.assertEqual(Thesis.objects.count(), 60)
+		self.assertTrue(Thesis.public.exists())
+
+		with tempfile.NamedTemporaryFile("r") as f:
+			call_command("benchmark", repeat=2, output=f.name, stderr=io.StringIO())
+			report = json.load(f)
+
+		self.assertEqual(report["dataset"]["theses"], 60)
+		self.assertIn("thesis-detail", report["cases"])
+		self.assertGreater(report["cases"]["tasks-notifications"]["queries"], 0)
+
+
+class LoadReplayTestCase(LiveServerTestCase):
+	def test_replay(self):
+		subject = models.Subject.objects.create(title="Humanitní studia")
+		author = models.User.objects.create(username="adam")
+		thesis = Thesis.objects.create(title="Testovací práce", author=author, subject=subject)
+		thesis.set_state_code("approved", author)
+
+		with tempfile.NamedTemporaryFile("r", suffix=".json") as scenario, tempfile.NamedTemporaryFile("r") as output:
+			call_command("loadreplay", scenario.name, synthesize=True, password="heslo", stdout=io.StringIO())
+			self.assertEqual(json.load(scenario)["users"][0]["params"]["thesis"], str(thesis.pk))
+
+			with tempfile.TemporaryDirectory() as media, self.settings(MEDIA_ROOT=media):
+				call_command(
+					"loadreplay", scenario.name, base_url=self.live_server_url,
+					concurrency=1, duration=1, seed=0, output=output.name,
+				)
+			report = json.load(output)
+
+		self.assertEqual(report["endpoints"]["login"]["error_rate"], 0)
+		self.assertEqual(report["endpoints"]["thesis-detail"]["error_rate"], 0)
+		self.assertGreater(report["total_requests"], 2)
+
+
+class SlowQueryTestCase(TestCase):
+	def test_slow_queries(self):
+		models.Subject.objects.create(title="Humanitní studia")
+
+		with self.settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_EXPLAIN_RATE=1):
+			self.client.get("/archive/search/")
+
+		query = models.SlowQuery.objects.filter(sql__contains="submissions_subject").first()
+		self.assertEqual(query.view, "archive-search")
+		self.assertTrue(query.call_site.startswith("submissions/"))
+		self.assertIn("SCAN", query.plan)
+
+	def test_task(self):
+		with self.settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_EXPLAIN_RATE=0):
+			tracing.run_traced(None, "submissions.similarity.index_thesis", "5d1e0e0a6a0d4e3f9f2b7c1a2b3c4d5e")
+
+		queries = models.SlowQuery.objects.filter(view="task submissions.similarity.index_thesis")
+		self.assertTrue(queries.filter(sql__contains="submissions_filetext").exists())
+		self.assertTrue(queries.filter(sql__contains="submissions_signature").exists())
+		self.assertFalse(queries.filter(sql__contains="5d1e0e0a").exists())  # the parameters are not stored
+
+	def test_disabled(self):
+		with self.settings(SLOW_QUERY_THRESHOLD_MS=None):
+			self.client.get("/")
+			with record_slow_queries("task"):
+				list(models.Subject.objects.all())
+		self.assertFalse(models.SlowQuery.objects.exists())
+
+
+class ProfilingTestCase(TestCase):
+	def test_profile(self):
+		staff = models.User.objects.create(username="admin", is_staff=True, is_superuser=True)
+
+		with tempfile.TemporaryDirectory() as directory, self.settings(PROFILE_DIR=directory):
+			self.assertNotIn("X-Profile-Id", self.client.get("/", {"profile": 1}))
+
+			self.client.force_login(staff)
+			self.assertNotIn("X-Profile-Id", self.client.get("/"))
+			name = self.client.get("/", {"profile": 1})["X-Profile-Id"]
+			self.assertIn("-index-", name)
+
+			self.assertContains(self.client.get("/admin/profiles/"), name)
+			self.assertContains(self.client.get(f"/admin/profiles/{name}", {"sort": "tottime"}), "function calls")
+			self.assertEqual(self.client.get("/admin/profiles/../settings.py").status_code, 404)
+
+
+class TracingTestCase(TestCase):
+	def read_spans(self, path):
+		tracing.exporter.flush()
+		with open(path) as f:
+			return [
+				span
+				for line in f
+				for span in json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"]
+			]
+
+	def test_request_trace(self):
+		subject = models.Subject.objects.create(title="Humanitní studia")
+		user = models.User.objects.create(username="admin", is_superuser=True)
+		thesis = Thesis.objects.create(title="Testovací práce", subject=subject, supervisor=user)
+		thesis.set_state_code("approved", user)
+		self.client.force_login(user)
+
+		with tempfile.NamedTemporaryFile("r") as f, self.settings(TRACE_FILE=f.name):
+			res = self.client.get(thesis.get_absolute_url(), HTTP_TRACEPARENT=f"00-{'a' * 32}-{'b' * 16}-01")
+			spans = self.read_spans(f.name)
+
+		self.assertTrue(res["traceparent"].startswith(f"00-{'a' * 32}-"))
+		self.assertEqual({span["traceId"] for span in spans}, {"a" * 32})
+		names = [span["name"] for span in spans]
+		self.assertIn("db", names)
+		self.assertIn("template.render", names)
+
+		root = next(span for span in spans if span["name"].startswith("GET"))
+		self.assertEqual(root["parentSpanId"], "b" * 16)
+		self.assertIn({"key": "view", "value": {"stringValue": "thesis-detail"}}, root["attributes"])
+
+	def test_task_propagation(self):
+		with tempfile.NamedTemporaryFile("r") as f, self.settings(TRACE_FILE=f.name):
+			with mock.patch.object(tracing, "q_async_task") as q_async_task, tracing.span("request"):
+				tracing.async_task("submissions.utils.normalize", "Žába")
+				trace_id, _ = tracing.current_context()
+
+			func, context, *args = q_async_task.call_args.args
+			self.assertEqual(func, "acceptor.tracing.run_traced")
+			self.assertEqual(tracing.run_traced(context, *args), "zaba")
+			spans = self.read_spans(f.name)
+
+		task = next(span for span in spans if span["name"] == "task submissions.utils.normalize")
+		self.assertEqual(task["traceId"], trace_id)
+
+	def test_disabled(self):
+		self.assertIsNone(tracing.start_span("nothing"))
+		self.assertNotIn("traceparent", self.client.get("/"))
+
+
+class HistoryCompactionTestCase(TestCase):
+	def setUp(self):
+		super().setUp()
+
+		subject = models.Subject.objects.create(title="Humanitní studia")
+		self.old = Thesis.objects.create(title="Stará práce", subject=subject, year=2000)
+		self.current = Thesis.objects.create(title="Nová práce", subject=subject)
+
+		history = ["author_approved", "supervisor_approved", "author_approved", "supervisor_approved", "approved", "submitted", "approved", "submitted", "defense_ready", "defended"]
+		for thesis in (self.old, self.current):
+			for i, code in enumerate(history):
+				entry = models.LogEntry.objects.create(thesis=thesis, state_id=code)
+				models.LogEntry.objects.filter(pk=entry.pk).update(timestamp=datetime(2000, 1, 1 + i, tzinfo=timezone.utc))
+
+	def test_compact(self):
+		out = io.StringIO()
+		call_command("compacthistory", "--dry-run", stdout=out, stderr=io.StringIO())
+		self.assertIn("3 log entries of 1 theses", out.getvalue())
+		self.assertEqual(models.LogEntry.objects.count(), 20)
+
+		modified = datetime(2000, 2, 1, tzinfo=timezone.utc)
+		Thesis.objects.filter(pk=self.old.pk).update(modified=modified)
+		with self.assertNumQueries(6):  # no resync per removed entry
+			call_command("compacthistory", stdout=io.StringIO(), stderr=io.StringIO())
+		self.old.sync_state()
+		self.assertEqual(Thesis.objects.get(pk=self.old.pk).modified, modified)  # the OAI datestamp is kept
+		codes = list(self.old.log_entries.order_by("timestamp").values_list("state", flat=True))
+		self.assertEqual(codes, ["author_approved", "author_approved", "supervisor_approved", "approved", "submitted", "defense_ready", "defended"])
+		self.assertEqual(self.current.log_entries.count(), 10)
+		self.assertEqual(self.old.archived_log_entries.count(), 3)
+		self.assertEqual(self.old.state.code, "defended")
+		self.assertIn(self.old, Thesis.closed.all())
+
+
+class YearClosingTestCase(TestCase):
+	def setUp(self):
+		super().setUp()
+
+		subject = models.Subject.objects.create(title="Humanitní studia")
+		for i, (code, mark) in enumerate([("defense_ready", 1), ("defense_ready", 5), ("submitted", None), ("approved", None), ("defended", 2)]):
+			thesis = Thesis.objects.create(title=f"Práce {i}", subject=subject, year=2000, mark=mark)
+			thesis.set_state_code(code, None)
+		Thesis.objects.create(title="Letošní práce", subject=subject, mark=1).set_state_code("defense_ready", None)
+
+	def states(self):
+		return dict(Thesis.objects.values_list("title", "current_state"))
+
+	@mock.patch.object(tracing, "async_task")
+	def test_close_year(self, async_task):
+		out = io.StringIO()
+		call_command("closeyear", "2000", "--dry-run", stdout=out, stderr=io.StringIO())
+		self.assertIn("4 theses of 2000 can be closed", out.getvalue())
+		self.assertEqual(self.states()["Práce 0"], "defense_ready")
+
+		with self.settings(PUBLISH_ROOT=tempfile.gettempdir()), self.captureOnCommitCallbacks(execute=True):
+			call_command("closeyear", "2000", "--chunk-size", "2", stdout=io.StringIO(), stderr=io.StringIO())
+		self.assertEqual(self.states(), {
+			"Práce 0": "defended",
+			"Práce 1": "failed",
+			"Práce 2": "unfinished",
+			"Práce 3": "unfinished",
+			"Práce 4": "defended",
+			"Letošní práce": "defense_ready",
+		})
+		self.assertEqual(models.LogEntry.objects.filter(state="unfinished").count(), 2)
+		async_task.assert_called_once_with("submissions.publish.publish_theses", [Thesis.objects.get(title="Práce 0").pk], queue="documents")
+
+		# Resuming a finished run does nothing
+		self.assertEqual(tasks.close_year(2000), 0)
+
+	@mock.patch.object(tracing, "async_task")
+	def test_closed_concurrently(self, async_task):
+		# Theses closed by someone else after they were read are neither counted nor published
+		pks = list(Thesis.objects.filter(year=2000).values_list("pk", flat=True))
+		with self.settings(PUBLISH_ROOT=tempfile.gettempdir()), self.captureOnCommitCallbacks(execute=True), \
+				mock.patch.object(Thesis, "transition_many", return_value=[]):
+			self.assertEqual(sum(rollover.close_chunk(pks).values()), 0)
+		async_task.assert_not_called()
+
+
+class ApiTestCase(TestCase):
+	def setUp(self):
+		super().setUp()
+
+		self.subject = models.Subject.objects.create(title="Humanitní studia")
+		child = models.Subject.objects.create(title="Filosofie", parent=self.subject)
+		keywords = [models.Keyword.objects.create(title=f"slovo {i}") for i in range(3)]
+		for i in range(5):
+			author = models.User.objects.create(username=f"student{i}", first_name="Jan", last_name=f"Student {i}")
+			thesis = Thesis.objects.create(title=f"Práce {i}", subject=child, author=author, year=2000 + i % 2, supervisor_opinion="<p>Dobrá práce</p>")
+			thesis.keywords.set(keywords)
+			thesis.set_state_code("defended", None)
+		Thesis.objects.create(title="Neveřejná práce", subject=child).set_state_code("submitted", None)
+
+	def get(self, url, **params):
+		res = self.client.get(url, params)
+		self.assertEqual(res.status_code, 200)
+		return res.json()
+
+	def test_theses(self):
+		url = reverse("api-thesis-list")
+		titles = []
+		with self.assertNumQueries(2):
+			data = self.get(url, limit=2)
+		while True:
+			titles.extend(thesis["title"] for thesis in data["results"])
+			if not data["next"]:
+				break
+			data = self.client.get(data["next"]).json()
+		self.assertEqual(sorted(titles), [f"Práce {i}" for i in range(5)])
+
+		thesis = self.get(url, limit=1)["results"][0]
+		self.assertEqual(thesis["keywords"], ["slovo 0", "slovo 1", "slovo 2"])
+		self.assertEqual(thesis["supervisor_opinion"], "<p>Dobrá práce</p>")
+		self.assertTrue(thesis["author"].startswith("Jan Student"))
+
+		models.Subject.tree()
+		with self.assertNumQueries(1):
+			data = self.get(url, fields="id,title,year", year=2000, subject=self.subject.pk)
+		self.assertEqual(len(data["results"]), 3)
+		self.assertEqual(set(data["results"][0]), {"id", "title", "year"})
+
+		self.assertEqual(self.client.get(url, {"fields": "title,password"}).status_code, 400)
+		self.assertEqual(self.client.get(url, {"after": "nonsense"}).status_code, 400)
+
+	def test_detail_etag(self):
+		thesis = Thesis.public.first()
+		url = reverse("api-thesis-detail", kwargs={"pk": thesis.pk})
+		res = self.client.get(url, {"fields": "title"})
+		self.assertEqual(res.json(), {"title": thesis.title})
+		self.assertEqual(self.client.get(url, {"fields": "title"}, HTTP_IF_NONE_MATCH=res["ETag"]).status_code, 304)
+
+		private = Thesis.objects.get(title="Neveřejná práce")
+		self.assertEqual(self.client.get(reverse("api-thesis-detail", kwargs={"pk": private.pk})).status_code, 404)
+
+	def test_subjects_keywords(self):
+		subjects = self.get(reverse("api-subject-list"))["results"]
+		self.assertEqual([subject["label"] for subject in subjects], ["Humanitní studia", "Humanitní studia, Filosofie"])
+		self.assertEqual(subjects[1]["parent"], self.subject.pk)
+
+		data = self.get(reverse("api-keyword-list"), limit=2)
+		self.assertEqual([keyword["title"] for keyword in data["results"]], ["slovo 0", "slovo 1"])
+		self.assertEqual(len(self.client.get(data["next"]).json()["results"]), 1)
+
+
+class ChangeFeedTestCase(TestCase):
+	def setUp(self):
+		super().setUp()
+
+		self.supervisor = models.User.objects.create(username="ucitel")
+		self.supervisor.user_permissions.add(Permission.objects.get(codename="supervisor"))
+		self.client.force_login(self.supervisor)
+		subject = models.Subject.objects.create(title="Humanitní studia")
+		self.thesis = Thesis.objects.create(title="Práce", subject=subject)
+		self.thesis.set_state_code("approved", None)
+
+	def events(self, after=None):
+		return [(event["kind"], event.get("state") or event.get("fields")) for event in map(feed.serialize, feed.changes(after))]
+
+	def test_changes(self):
+		cursor = feed.encode_cursor(feed.changes()[-1])
+
+		self.client.post(reverse("thesis-assign", kwargs={"pk": self.thesis.pk, "role": "supervisor"}))
+		self.client.post(reverse("thesis-title", kwargs={"pk": self.thesis.pk}), {"title": "Nový název"})
+		self.client.post(reverse("thesis-title", kwargs={"pk": self.thesis.pk}), {"title": "Nový název"})
+		self.thesis.keywords.add(models.Keyword.objects.create(title="slovo"))
+		self.thesis.transition(["approved"], "submitted", self.supervisor)
+
+		self.assertEqual(self.events(cursor), [
+			("edit", ["supervisor"]),
+			("edit", ["title"]),
+			("edit", ["keywords"]),
+			("state", "submitted"),
+		])
+		self.assertEqual(self.events()[:2], [("created", None), ("state", "approved")])
+
+	def test_late_commit(self):
+		# An event of a long transaction, with an older id and timestamp than the events already read
+		events = feed.changes()
+		cursor = feed.encode_cursor(events[-1])
+		late = events[0]
+		late.delete()
+		models.ChangeEvent.objects.create(pk=late.pk, thesis_id=self.thesis.pk, kind="edit", fields=["title"])
+		models.ChangeEvent.objects.filter(pk=late.pk).update(timestamp=late.timestamp)
+
+		self.assertEqual(self.events(cursor), [("edit", ["title"])])
+		self.assertEqual(feed.changes(feed.encode_cursor(feed.changes(cursor)[-1])), [])
+
+	def test_endpoint(self):
+		url = reverse("api-change-feed")
+		self.assertEqual(self.client.get(url).status_code, 403)
+
+		self.supervisor.user_permissions.add(Permission.objects.get(codename="view_changeevent"))
+		data = self.client.get(url, {"limit": 1}).json()
+		self.assertEqual(data["results"][0]["kind"], "created")
+		data = self.client.get(url, {"after": data["cursor"]}).json()
+		self.assertEqual([event["state"] for event in data["results"]], ["approved"])
+		self.assertEqual(self.client.get(url, {"after": "nonsense"}).status_code, 400)
+
+		out = io.StringIO()
+		call_command("changefeed", "--after", data["cursor"], stdout=out, stderr=io.StringIO())
+		self.assertEqual(out.getvalue(), "")
+
+
+@override_settings(OAI_PAGE_SIZE=2)
+class OAITestCase(TestCase):
+	NS = {"oai": "http://www.openarchives.org/OAI/2.0/", "dc": "http://purl.org/dc/elements/1.1/"}
+
+	def setUp(self):
+		super().setUp()
+
+		subject = models.Subject.objects.create(title="Humanitní studia")
+		keyword = models.Keyword.objects.create(title="filosofie")
+		for i in range(5):
+			author = models.User.objects.create(username=f"student{i}", first_name="Jan", last_name=f"Student {i}")
+			thesis = Thesis.objects.create(title=f"Práce {i} & spol.", subject=subject, author=author, abstract="<p>Abstrakt</p>")
+			thesis.keywords.add(keyword)
+			thesis.set_state_code("defended", None)
+		Thesis.objects.create(title="Neveřejná práce", subject=subject).set_state_code("submitted", None)
+		Thesis.objects.filter(title="Práce 0 & spol.").update(modified=datetime(2000, 1, 1, tzinfo=timezone.utc))
+
+	def get(self, **params):
+		res = self.client.get(reverse("oai"), params)
+		self.assertEqual(res.status_code, 200)
+		return ElementTree.fromstring(res.content)
+
+	def error(self, **params):
+		error = self.get(**params).find("oai:error", self.NS)
+		return error.get("code") if error is not None else None
+
+	def test_harvest(self):
+		identifiers = []
+		with self.assertNumQueries(3):
+			root = self.get(verb="ListRecords", metadataPrefix="oai_dc")
+		while True:
+			records = root.findall("oai:ListRecords/oai:record", self.NS)
+			identifiers.extend(record.find("oai:header/oai:identifier", self.NS).text for record in records)
+			token = root.find("oai:ListRecords/oai:resumptionToken", self.NS)
+			if token is None or not token.text:
+				break
+			root = self.get(verb="ListRecords", resumptionToken=token.text)
+		self.assertEqual(len(identifiers), 5)
+		self.assertEqual(len(set(identifiers)), 5)
+
+		record = self.get(verb="GetRecord", metadataPrefix="oai_dc", identifier=identifiers[0]).find("oai:GetRecord/oai:record", self.NS)
+		self.assertEqual(record.find(".//dc:title", self.NS).text, "Práce 0 & spol.")
+		self.assertEqual(record.find(".//dc:description", self.NS).text, "Abstrakt")
+		self.assertEqual([e.text for e in record.findall(".//dc:subject", self.NS)], ["filosofie", "Humanitní studia"])
+		self.assertEqual(record.find(".//oai:datestamp", self.NS).text, "2000-01-01T00:00:00Z")
+
+		headers = self.get(verb="ListIdentifiers", metadataPrefix="oai_dc", **{"from": "2001-01-01"}).findall("oai:ListIdentifiers/oai:header", self.NS)
+		self.assertEqual(len(headers), 2)
+		self.assertNotIn(identifiers[0], [header.find("oai:identifier", self.NS).text for header in headers])
+		self.assertEqual(self.error(verb="ListRecords", metadataPrefix="oai_dc", until="1999-12-31"), "noRecordsMatch")
+
+		# The bounds are inclusive for the whole second
+		Thesis.objects.filter(title="Práce 0 & spol.").update(modified=datetime(2000, 1, 1, 0, 0, 0, 500000, tzinfo=timezone.utc))
+		headers = self.get(verb="ListIdentifiers", metadataPrefix="oai_dc", until="2000-01-01T00:00:00Z").findall("oai:ListIdentifiers/oai:header", self.NS)
+		self.assertEqual([header.find("oai:identifier", self.NS).text for header in headers], [identifiers[0]])
+
+	def test_errors(self):
+		self.assertEqual(self.get(verb="Identify").find("oai:Identify/oai:earliestDatestamp", self.NS).text, "2000-01-01T00:00:00Z")
+		self.assertEqual(self.error(verb="Nonsense"), "badVerb")
+		self.assertEqual(self.error(verb="ListRecords"), "badArgument")
+		self.assertEqual(self.error(verb="ListRecords", metadataPrefix="marc"), "cannotDisseminateFormat")
+		self.assertEqual(self.error(verb="ListRecords", resumptionToken="nonsense"), "badResumptionToken")
+		self.assertEqual(self.error(verb="ListSets"), "noSetHierarchy")
+		private = Thesis.objects.get(title="Neveřejná práce")
+		self.assertEqual(self.error(verb="GetRecord", metadataPrefix="oai_dc", identifier=f"oai:testserver:{private.pk}"), "idDoesNotExist")
+
+
+class NotificationTestCase(TestCase):
+	def setUp(self):
+		super().setUp()
+
+		self.author = models.User.objects.create(username="student", email="student@gjk.cz")
+		self.supervisor = models.User.objects.create(username="ucitel", email="ucitel@gjk.cz")
+		self.opponent = models.User.objects.create(username="oponent", email="oponent@gjk.cz")
+		subject = models.Subject.objects.create(title="Humanitní studia")
+		self.theses = []
+		for i in range(3):
+			thesis = Thesis.objects.create(title=f"Práce {i}", subject=subject, author=self.author, supervisor=self.supervisor, opponent=self.opponent)
+			thesis.set_state_code("approved", None)
+			self.theses.append(thesis)
+		self.assertEqual(models.Notification.objects.count(), 6)
+		models.Notification.objects.all().delete()
+
+	def test_digest(self):
+		for thesis in self.theses:
+			thesis.submit(self.author)
+		self.theses[0].supervisor_opinion = "<p>Dobrá práce</p>"
+		self.theses[0].save()
+		self.theses[0].supervisor_opinion = "<p>Velmi dobrá práce</p>"
+		self.theses[0].save()
+
+		self.assertEqual(models.Notification.objects.filter(recipient=self.supervisor).count(), 3)
+		self.assertEqual(models.Notification.objects.filter(recipient=self.author).count(), 1)
+		self.assertEqual(tasks.send_digests(), 3)
+
+		from django.core import mail
+		self.assertEqual(len(mail.outbox), 3)
+		digest = next(message for message in mail.outbox if message.to == ["oponent@gjk.cz"])
+		self.assertEqual(digest.body.count("stav byl změněn na Odevzdáno"), 3)
+		self.assertIn("Práce 0: posudek vedoucího byl přidán", digest.body)
+		self.assertFalse(models.Notification.objects.exists())
+		self.assertEqual(tasks.send_digests(), 0)
+
+	def test_rollback(self):
+		with mock.patch.object(tasks, "send_mail", side_effect=OSError), self.assertLogs("submissions.tasks"):
+			self.theses[0].submit(self.author)
+			self.assertEqual(tasks.send_digests(), 0)
+		self.assertEqual(models.Notification.objects.count(), 2)
+
+	def test_failed_recipient(self):
+		from django.core import mail
+		from smtplib import SMTPRecipientsRefused
+
+		send_mail = tasks.send_mail
+		def refuse_supervisor(subject, message, sender, recipients, **kwargs):
+			if recipients == [self.supervisor.email]:
+				raise SMTPRecipientsRefused({self.supervisor.email: (550, b"No such user")})
+			return send_mail(subject, message, sender, recipients, **kwargs)
+
+		self.theses[0].submit(self.author)
+		self.theses[0].supervisor_opinion = "<p>Dobrá práce</p>"
+		self.theses[0].save()
+		with mock.patch.object(tasks, "send_mail", side_effect=refuse_supervisor), self.assertLogs("submissions.tasks"):
+			self.assertEqual(tasks.send_digests(), 2)
+		self.assertEqual(sorted(message.to[0] for message in mail.outbox), ["oponent@gjk.cz", "student@gjk.cz"])
+		self.assertEqual(set(models.Notification.objects.values_list("recipient", flat=True)), {self.supervisor.pk})
+
+
+class TaskQueueTestCase(TestCase):
+	def test_routing(self):
+		from django_q.models import OrmQ
+
+		tracing.async_task("math.floor", 1.5, queue="email")
+		tracing.async_task("math.floor", 2.5)
+		self.assertEqual(sorted(OrmQ.objects.values_list("key", flat=True)), ["default", "email"])
+		with self.assertRaises(ValueError):
+			tracing.async_task("math.floor", 1.5, queue="nonsense")
+
+	def test_schedules(self):
+		from django_q.models import Schedule
+
+		Schedule.objects.create(func="submissions.tasks.notifications", schedule_type=Schedule.HOURLY)
+		for _ in range(2):
+			call_command("setschedule", stdout=io.StringIO())
+		self.assertEqual(dict(Schedule.objects.values_list("func", "cluster")), {
+			"submissions.tasks.notifications": "maintenance",
+			"submissions.tasks.send_digests": "maintenance",
+			"submissions.tasks.compact_history": "maintenance",
+		})
+		self.assertEqual(Schedule.objects.get(func="submissions.tasks.notifications").schedule_type, Schedule.DAILY)
+
+
+class ExtractionTestCase(TestCase):
+	def setUp(self):
+		super().setUp()
+
+		self.media = tempfile.TemporaryDirectory()
+		self.addCleanup(self.media.cleanup)
+		self.enterContext(self.settings(MEDIA_ROOT=self.media.name))
+
+		subject = models.Subject.objects.create(title="Humanitní studia")
+		self.thesis = Thesis.objects.create(title="Práce", subject=subject, year=2020)
+		self.thesis.set_state_code("defended", None)
+		with mock.patch.object(tracing, "async_task") as async_task, self.captureOnCommitCallbacks(execute=True):
+			self.file = models.File.objects.create(thesis=self.thesis, upload=SimpleUploadedFile("prace.pdf", b"%PDF-1.4 obsah"))
+		async_task.assert_called_once_with("submissions.extraction.extract_text", self.file.pk, queue="documents")
+
+	def pdftotext(self, stdout=b"", side_effect=None):
+		return mock.patch.object(extraction.subprocess, "run", return_value=mock.Mock(stdout=stdout), side_effect=side_effect)
+
+	def test_extract(self):
+		with self.pdftotext("Šťastná\n  ŽÁBA\f".encode()) as run:
+			self.assertEqual(extraction.extract_text(self.file.pk), models.FileText.EXTRACTED)
+			self.assertEqual(extraction.extract_text(self.file.pk), models.FileText.EXTRACTED)
+		run.assert_called_once()  # the file has not changed
+		self.assertEqual(self.file.text.text, "stastna zaba")
+
+		form = forms.SearchForm(data={"text": "Šťastná žába"})
+		self.assertTrue(form.is_valid())
+		self.assertEqual(list(form.get_queryset()), [self.thesis])
+		form = forms.SearchForm(data={"text": "žába šťastná"})
+		self.assertTrue(form.is_valid())
+		self.assertEqual(list(form.get_queryset()), [])
+
+	def test_limits(self):
+		with self.settings(EXTRACTION_MAX_SIZE=5), self.pdftotext() as run, mock.patch.object(extraction, "file_digest") as file_digest:
+			self.assertEqual(extraction.extract_text(self.file.pk), models.FileText.TOO_LARGE)
+		run.assert_not_called()
+		file_digest.assert_not_called()  # an oversized file is not read
+
+		self.file.upload.save("prace.pdf", SimpleUploadedFile("prace.pdf", b"%PDF-1.4 jiny obsah"))
+		with self.pdftotext(side_effect=extraction.subprocess.TimeoutExpired("pdftotext", 1)):
+			self.assertEqual(extraction.extract_text(self.file.pk), models.FileText.TIMEOUT)
+		self.assertEqual(models.FileText.objects.get().text, "")
+
+
+class SimilarityTestCase(TestCase):
+	def setUp(self):
+		super().setUp()
+
+		self.media = tempfile.TemporaryDirectory()
+		self.addCleanup(self.media.cleanup)
+		self.enterContext(self.settings(MEDIA_ROOT=self.media.name))
+
+		words = [f"slovo{i}" for i in range(400)]
+		subject = models.Subject.objects.create(title="Humanitní studia")
+		self.original = self.thesis("Původní práce", 2020, " ".join(words), subject)
+		self.other = self.thesis("Jiná práce", 2020, " ".join(reversed(words)), subject)
+		self.copy = self.thesis("Opsaná práce", 2021, " ".join(words[:380] + ["jine"] * 20), subject)
+		self.copy.set_state_code("submitted", None)
+
+	def thesis(self, title, year, text, subject):
+		thesis = Thesis.objects.create(title=title, subject=subject, year=year)
+		thesis.set_state_code("defended", None)
+		file = models.File.objects.create(thesis=thesis, upload=SimpleUploadedFile("prace.pdf", b"%PDF-1.4"))
+		models.FileText.objects.create(file=file, digest="", status=models.FileText.EXTRACTED, text=text)
+		return thesis
+
+	def test_similar(self):
+		call_command("indexsimilarity", processes=2, chunk_size=2, stdout=io.StringIO())
+		self.assertEqual(models.SignatureBand.objects.count(), 3 * minhash.BANDS)
+
+		with self.assertNumQueries(3):
+			similar = similarity.similar_theses(self.copy)
+		self.assertEqual([thesis for thesis, _ in similar], [self.original])
+		self.assertGreater(similar[0][1], 0.7)
+		self.assertEqual(similarity.similar_theses(self.original), [])  # only the past years
+
+		supervisor = models.User.objects.create(username="ucitel")
+		Thesis.objects.filter(pk=self.copy.pk).update(supervisor=supervisor)
+		self.client.force_login(supervisor)
+		self.assertContains(self.client.get(reverse("thesis-detail", kwargs={"pk": self.copy.pk})), "Původní práce")
+
+	def test_reindex(self):
+		similarity.index_thesis(self.copy.pk)
+		with mock.patch.object(minhash, "signature") as signature:
+			similarity.index_thesis(self.copy.pk)
+		signature.assert_not_called()  # the text has not changed
+
+		with mock.patch.object(tracing, "async_task") as async_task, self.captureOnCommitCallbacks(execute=True):
+			models.File.objects.filter(thesis=self.copy).delete()
+		async_task.assert_any_call("submissions.similarity.index_thesis", self.copy.pk, queue="documents")
+		similarity.index_thesis(self.copy.pk)
+		self.assertFalse(models.Signature.objects.filter(pk=self.copy.pk).exists())
+
+
+class PublishTestCase(TestCase):
+	def setUp(self):
+		super().setUp()
+
+		self.root = tempfile.TemporaryDirectory()
+		self.addCleanup(self.root.cleanup)
+		self.enterContext(self.settings(PUBLISH_ROOT=self.root.name))
+		self.async_task = self.enterContext(mock.patch.object(tracing, "async_task"))
+
+		subject = models.Subject.objects.create(title="Humanitní studia")
+		self.thesis = Thesis.objects.create(title="Veřejná práce", subject=subject, year=2000, supervisor_opinion="<p>Dobrá práce</p>")
+		self.thesis.set_state_code("defended", None)
+
+	def read(self, path):
+		return publish.file_of(path).read_text()
+
+	def test_publish_all(self):
+		call_command("publisharchive", stdout=io.StringIO())
+
+		self.assertIn("Veřejná práce", self.read(self.thesis.get_absolute_url()))
+		self.assertIn("Nejste přihlášeni", self.read(self.thesis.get_absolute_url()))
+		self.assertIn("Dobrá práce", self.read(f"/thesis/{self.thesis.pk}/opinion/supervisor/"))
+		self.assertFalse(publish.file_of(f"/thesis/{self.thesis.pk}/opinion/opponent/").exists())
+		self.assertIn("Veřejná práce", self.read("/archive/2000/"))
+		self.assertIn("/archive/2000/", self.read("/archive/"))
+
+	def test_signals(self):
+		with self.captureOnCommitCallbacks(execute=True):
+			self.thesis.title = "Upravená práce"
+			self.thesis.save()
+		self.async_task.assert_called_with("submissions.publish.publish_thesis", self.thesis.pk, 2000, queue="documents")
+		publish.publish_thesis(self.thesis.pk)
+		self.assertIn("Upravená práce", self.read(self.thesis.get_absolute_url()))
+
+		# Copies of theses which are not public anymore are removed right away
+		with self.captureOnCommitCallbacks(execute=True):
+			self.thesis.set_state_code("defended_nonpublic", None)
+		self.assertFalse(publish.file_of(self.thesis.get_absolute_url()).exists())
+		publish.publish_thesis(self.thesis.pk)
+		self.assertFalse(publish.file_of("/archive/2000/").exists())
+
+
+class ThesisAdminTestCase(TestCase):
+	def setUp(self):
+		super().setUp()
+
+		self.admin = models.User.objects.create(username="admin", is_staff=True, is_superuser=True)
+		self.client.force_login(self.admin)
+		subject = models.Subject.objects.create(title="Humanitní studia")
+		for i in range(10):
+			thesis = Thesis.objects.create(title=f"Práce {i}", subject=subject, author=self.admin, year=2000 + i % 2)
+			thesis.set_state_code("approved", None)
+		self.thesis = thesis
+		for code in ["submitted", "approved"] * 15:
+			thesis.set_state_code(code, None)
+
+	def test_changelist(self):
+		url = reverse("admin:submissions_thesis_changelist")
+		with self.assertNumQueries(7):
+			res = self.client.get(url)
+		self.assertContains(res, "<td class=\"field-current_state nowrap\">Zadání schváleno</td>", count=10)
+
+		self.assertEqual(len(self.client.get(url, {"q": "prace 3"}).context["cl"].result_list), 1)
+		self.assertEqual(len(self.client.get(url, {"q": "admin"}).context["cl"].result_list), 10)
+		self.assertEqual(len(self.client.get(url, {"year": 2000, "current_state__code__exact": "approved"}).context["cl"].result_list), 5)
+		self.assertEqual(len(self.client.get(url, {"current_state__code__exact": "submitted"}).context["cl"].result_list), 0)
+
+	def test_change_form(self):
+		models.User.objects.create(username="nevybrany")
+		res = self.client.get(reverse("admin:submissions_thesis_change", args=[self.thesis.pk]))
+		self.assertEqual(len(res.context["inline_admin_formsets"][1].formset.forms), 20)
+		self.assertContains(res, "Všechny záznamy (31)")
+		self.assertNotContains(res, "nevybrany")  # users are not rendered, they are autocompleted
+
+	def test_autocomplete(self):
+		models.User.objects.create(username="novak", last_name="Dvořák")
+		models.User.objects.create(username="dvorakova", last_name="Nováková")
+		url = reverse("admin:autocomplete")
+
+		def search(field_name, term):
+			res = self.client.get(url, {"app_label": "submissions", "model_name": "thesis", "field_name": field_name, "term": term})
+			return sorted(result["text"] for result in res.json()["results"])
+		self.assertEqual(search("author", "nov"), ["dvorakova", "novak"])
+		self.assertEqual(search("supervisor", "DVO"), ["dvorakova", "novak"])
+		self.assertEqual(search("opponent", "vak"), [])  # not a prefix
+		self.assertEqual(search("subject", "human"), ["Humanitní studia"])
+		self.assertEqual(search("subject", "studia"), [])
+
+
+class SubjectTreeTestCase(TestCase):
+	def setUp(self):
+		super().setUp()
+
+		self.root = models.Subject.objects.create(title="Humanitní studia")
+		self.child = models.Subject.objects.create(title="Filosofie", parent=self.root)
+		models.Subject.objects.create(title="Dějepis", parent=self.root)
+		models.Subject.objects.create(title="Matematika")
+
+	def results(self, **params):
+		return self.client.get(reverse("subjects"), params).json()["results"]
+
+	def test_tree(self):
+		models.Subject.tree()
+		with self.assertNumQueries(0):
+			roots = self.results()
+		self.assertEqual([(s["title"], s["children"]) for s in roots], [("Humanitní studia", True), ("Matematika", False)])
+		self.assertEqual([s["label"] for s in self.results(parent=self.root.pk)], ["Humanitní studia, Dějepis", "Humanitní studia, Filosofie"])
+		self.assertEqual([s["id"] for s in self.results(q="filo")], [self.child.pk])
+		self.assertEqual(self.client.get(reverse("subjects"), {"parent": 999}).status_code, 404)
+
+		# The cached tree is updated when a subject changes
+		self.child.title = "Filozofie"
+		self.child.save()
+		self.assertEqual(self.results(q="filoz")[0]["label"], "Humanitní studia, Filozofie")
+
+	def test_form_rendering(self):
+		models.Subject.tree()
+		with CaptureQueriesContext(connection) as queries:
+			html = str(forms.SearchForm(initial={"subject": self.child.pk}))
+		self.assertFalse([q for q in queries if "submissions_subject" in q["sql"]])
+		self.assertIn("Humanitní studia, Filosofie", html)
+		self.assertNotIn("Matematika", html)
+
+
+class TransitionRaceTestCase(TransactionTestCase):
+	def setUp(self):
+		super().setUp()
+
+		# The states created by the migrations do not survive the flushes of transaction test cases
+		for code, is_approved, is_submitted in [("author_approved", False, False), ("approved", True, False), ("submitted", True, True)]:
+			models.State.objects.get_or_create(code=code, defaults={"is_approved": is_approved, "is_submitted": is_submitted})
+
+		self.author = models.User.objects.create(username="adam")
+		self.supervisor = models.User.objects.create(username="john")
+		subject = models.Subject.objects.create(title="Humanitní studia")
+		self.thesis = Thesis.objects.create(title="Práce", subject=subject, author=self.author, supervisor=self.supervisor)
+
+	def race(self, transition, count=8):
+		"""Run `transition(thesis)` from `count` threads at once, each with its own copy of the thesis"""
+		copies = [Thesis.objects.get(pk=self.thesis.pk) for _ in range(count)]
+		barrier = threading.Barrier(count)
+
+		def run(thesis):
+			barrier.wait()
+			try:
+				while True:
+					try:
+						return transition(thesis)
+					except db.OperationalError:
+						time.sleep(0.01)  # the in-memory SQLite test database does not wait for locks
+			finally:
+				db.connections.close_all()
+
+		with ThreadPoolExecutor(count) as pool:
+			return list(pool.map(run, copies))
+
+	def test_approve(self):
+		self.thesis.set_state_code("author_approved", self.author)
+		results = self.race(lambda thesis: thesis.approve(self.supervisor))
+
+		self.assertEqual(results.count(True), 1)
+		self.assertEqual(self.thesis.log_entries.filter(state="approved").count(), 1)
+		self.assertEqual(Thesis.objects.get(pk=self.thesis.pk).state.code, "approved")
+
+	def test_submit_and_cancel(self):
+		self.thesis.set_state_code("approved", self.author)
+		results = self.race(lambda thesis: thesis.submit(self.author))
+		self.assertEqual(results.count(True), 1)
+
+		stale = Thesis.objects.get(pk=self.thesis.pk)
+		self.assertTrue(Thesis.objects.get(pk=self.thesis.pk).cancel_submit(self.author))
+		self.assertFalse(stale.cancel_submit(self.author))
+		self.assertEqual(list(self.thesis.log_entries.order_by("timestamp").values_list("state", flat=True)), ["approved", "submitted", "approved"])
+
+
+class StateMachineTestCase(TestCase):
+	def setUp(self):
+		super().setUp()
+
+		self.author = models.User.objects.create(username="adam")
+		self.supervisor = models.User.objects.create(username="john")
+		subject = models.Subject.objects.create(title="Humanitní studia")
+		self.thesis = Thesis.objects.create(title="Práce", subject=subject, author=self.author, supervisor=self.supervisor)
+		self.thesis.set_state_code("author_approved", self.author)
+
+	def test_table(self):
+		self.assertLessEqual(states.states_used(), set(models.State.objects.values_list("code", flat=True)))
+		self.assertEqual(states.targets("approve", {"author", "supervisor"}), {"approved": ["supervisor_approved", "author_approved"]})
+
+	def test_actions(self):
+		models.State.registry()
+		with self.assertNumQueries(0):
+			self.assertEqual(self.thesis.available_actions(self.supervisor), {"approve", "edit_assignment", "complete_opinions"})
+			self.assertEqual(self.thesis.available_actions(self.author), set())
+			self.assertFalse(self.thesis.state.is_approved)
+
+		self.assertFalse(self.thesis.approve(self.author))
+		self.assertTrue(self.thesis.approve(self.supervisor))
+		self.assertEqual(self.thesis.available_actions(self.author), {"submit"})
+
+	def test_registry_invalidation(self):
+		self.addCleanup(models.invalidate_state_registry, models.State)  # the edit is rolled back
+		state = models.State.get("approved")
+		state.name = "Schváleno"
+		state.save()
+		self.assertEqual(models.State.get("approved").name, "Schváleno")
+		with self.assertRaises(models.State.DoesNotExist):
+			models.State.get("unknown")
+
+
+class BulkEvaluationTestCase(TestCase):
+	def setUp(self):
+		super().setUp()
+
+		self.user = models.User.objects.create(username="admin", is_superuser=True)
+		self.client.force_login(self.user)
+		self.subject = models.Subject.objects.create(title="Humanitní studia")
+		child = models.Subject.objects.create(title="Filosofie", parent=self.subject)
+		for i in range(30):
+			author = models.User.objects.create(username=f"student{i}", last_name=f"Student {i:02}")
+			thesis = Thesis.objects.create(title=f"Práce {i}", subject=child, author=author)
+			thesis.set_state_code("submitted" if i else "approved", None)
+		self.url = reverse("thesis-evaluation-bulk", kwargs={"subject": self.subject.pk})
+
+	def data(self, formset, state):
+		data = {
+			"form-TOTAL_FORMS": len(formset.forms),
+			"form-INITIAL_FORMS": len(formset.forms),
+		}
+		for i, form in enumerate(formset.forms):
+			data[f"form-{i}-id"] = form.instance.pk
+			data[f"form-{i}-mark"] = 1 + i % 5
+			data[f"form-{i}-state"] = state
+		return data
+
+	def test_evaluation(self):
+		formset = self.client.get(self.url).context["formset"]
+		self.assertEqual(len(formset.forms), 29)
+
+		with self.assertNumQueries(14):
+			res = self.client.post(self.url, self.data(formset, "defended"))
+		self.assertRedirects(res, reverse("thesis-list", kwargs={"subject": self.subject.pk}))
+
+		self.assertEqual(Thesis.closed.count(), 29)
+		self.assertEqual(models.LogEntry.objects.filter(state="defended").count(), 29)
+		self.assertEqual(Thesis.objects.get(title="Práce 1").mark, 1)
+		self.assertEqual(Thesis.objects.get(title="Práce 0").state.code, "approved")
+
+	def test_conflict(self):
+		queryset = self.client.get(self.url).context["view"].get_queryset()
+		formset = forms.BulkEvaluationFormSet(self.data(forms.BulkEvaluationFormSet(queryset=queryset), "defended"), queryset=queryset)
+		self.assertTrue(formset.is_valid())
+		Thesis.objects.get(title="Práce 5").set_state_code("failed", None)
+
+		with self.assertRaises(ValidationError):
+			formset.save(self.user)
+		self.assertEqual(Thesis.closed.count(), 1)
+		self.assertFalse(Thesis.objects.filter(mark__isnull=False).exists())
+
+	def test_closed_before_post(self):
+		data = self.data(self.client.get(self.url).context["formset"], "defended")
+		Thesis.objects.get(title="Práce 5").set_state_code("failed", None)
+
+		res = self.client.post(self.url, data)
+		self.assertContains(res, "Některé práce byly mezitím uzavřeny")
+		self.assertEqual(Thesis.closed.count(), 1)
+		self.assertFalse(Thesis.objects.filter(mark__isnull=False).exists())
+
+	def test_forged(self):
+		data = self.data(self.client.get(self.url).context["formset"], "defended")
+		forged = [
+			{**data, "form-TOTAL_FORMS": 30, "form-29-mark": 1, "form-29-state": "defended"},
+			{**data, "form-TOTAL_FORMS": 30, "form-INITIAL_FORMS": 30, "form-29-mark": 1},
+			{**data, "form-1-id": data["form-0-id"]},
+			{key: value for key, value in data.items() if key != "form-1-id"},
+		]
+		for forged_data in forged:
+			self.assertContains(self.client.post(self.url, forged_data), "Formulář neodpovídá pracím na stránce")
+		self.assertEqual(Thesis.closed.count(), 0)
+		self.assertFalse(Thesis.objects.filter(mark__isnull=False).exists())
+
+	def test_permissions(self):
+		self.client.force_login(models.User.objects.get(username="student1"))
+		self.assertEqual(self.client.get(self.url).status_code, 403)
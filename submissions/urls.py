@@ -1,5 +1,5 @@
 from django.urls import path
-from . import forms, views, models
+from . import api, forms, oai, views, models
 
 
 urlpatterns = [
@@ -14,9 +14,11 @@ urlpatterns = [
     path('theses/', views.CurrentThesisList.as_view(), name="thesis-list"),
     path('theses/my-list/', views.MyThesisList.as_view(), name="thesis-me"),
     path('theses/subject/<int:subject>/', views.CurrentThesisList.as_view(), name="thesis-list"),
+    path('theses/subject/<int:subject>/evaluation/', views.BulkEvaluation.as_view(), name="thesis-evaluation-bulk"),
 
     # Thesis create
     path('thesis/create/', views.ThesisCreate.as_view(), name="thesis-create"),
+    path('thesis/import/', views.ThesisImport.as_view(), name="thesis-import"),
 
     # Thesis detail
     path(
@@ -132,7 +134,23 @@ urlpatterns = [
     ),
 
     # Archive
-    path('archive/search/', views.ArchiveSearch.as_view(), name="archive-search")
+    path('archive/', views.ArchiveIndex.as_view(), name="archive"),
+    path('archive/<int:year>/', views.ArchiveYear.as_view(), name="archive-year"),
+    path('archive/search/', views.ArchiveSearch.as_view(), name="archive-search"),
+
+    # Autocomplete
+    path('autocomplete/<str:kind>/', views.autocomplete, name="autocomplete"),
+    path('subjects/', views.subjects, name="subjects"),
+
+    # API
+    path('api/v1/theses/', api.thesis_list, name="api-thesis-list"),
+    path('api/v1/theses/<uuid:pk>/', api.thesis_detail, name="api-thesis-detail"),
+    path('api/v1/subjects/', api.subject_list, name="api-subject-list"),
+    path('api/v1/keywords/', api.keyword_list, name="api-keyword-list"),
+    path('api/v1/changes/', api.change_feed, name="api-change-feed"),
+
+    # OAI-PMH
+    path('oai/', oai.oai, name="oai"),
 ]
 
 
@@ -1,7 +1,11 @@
+from django.db import connection
+from django.db.models import Q
 from django.views.generic.list import ListView
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 
+import unicodedata
+
 
 @method_decorator(csrf_exempt, name="dispatch")
 class SearchView(ListView):
@@ -51,3 +55,44 @@ def split_person_name(name):
 	"""
 	parts = name.split(" ")
 	return " ".join(parts[:-1]), parts[-1]
+
+
+def normalize(text):
+	"""
+		A helper function. Return a case and diacritics insensitive form of `text`.
+		Example.
+			>>> normalize("Šťastná Žába")
+			"stastna zaba"
+	"""
+	decomposed = unicodedata.normalize("NFKD", text)
+	return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def prefix_filter(field, prefix):
+	"""
+		A helper function. Return a `Q` object matching the values of `field`
+		starting with `prefix`, which can be answered using an index.
+
+		On PostgreSQL this is a `LIKE 'prefix%'` backed by a `text_pattern_ops`
+		index, elsewhere (SQLite does not use indices for `LIKE ... ESCAPE`)
+		it is an equivalent range condition.
+	"""
+	if connection.vendor == "postgresql" or not prefix:
+		return Q(**{f"{field}__startswith": prefix})
+	upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+	return Q(**{f"{field}__gte": prefix, f"{field}__lt": upper})
+
+
+def percentile(values, p):
+	"""
+		A helper function. Return the `p`-th percentile (0-100) of `values`
+		using the nearest-rank method, or None for no values.
+		Example.
+			>>> percentile([4, 1, 3, 2], 50)
+			2
+	"""
+	if not values:
+		return None
+	values = sorted(values)
+	rank = max(0, -(-len(values) * p // 100) - 1)
+	return values[int(rank)]
@@ -3,19 +3,27 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.views.generic.list import ListView
 from django.views.generic.detail import DetailView
 from django.views.generic.base import TemplateView
-from django.views.generic.edit import UpdateView, CreateView
+from django.views.generic.edit import UpdateView, CreateView, FormView
 
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_POST, require_GET
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 
-from django.core.exceptions import PermissionDenied
-from django.http import Http404
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.http import Http404, JsonResponse
 
-from .utils import SearchView
+from acceptor.metrics import record_cache
+
+from .utils import SearchView, normalize, prefix_filter
+from .imports import ThesisImporter, read_rows
 from .models import Thesis
 from . import models
 from . import forms
+from . import similarity
+
+import hashlib
 
 
 class IndexView(TemplateView):
@@ -68,11 +76,19 @@ class ThesisDetail(UserPassesTestMixin, DetailView):
 			return True
 		return (
 			self.request.user.has_perm("submissions.view_thesis") or 
-			self.request.user == self.object.author or
-			self.request.user == self.object.supervisor or
-			self.request.user == self.object.opponent
+			bool(self.object.roles(self.request.user))
 		)
 
+	def get_context_data(self, **kwargs):
+		ctx = super().get_context_data(**kwargs)
+		ctx["actions"] = self.object.available_actions(self.request.user)
+		if self.object.state.is_submitted and (
+			self.request.user.has_perm("submissions.view_thesis") or
+			self.object.roles(self.request.user) & {"supervisor", "opponent"}
+		):
+			ctx["similar"] = similarity.similar_theses(self.object)
+		return ctx
+
 
 class OpinionDetail(ThesisDetail):
 	"""A detail view for a supervisor/opponent opinion"""
@@ -114,13 +130,37 @@ class ThesisCreate(UserPassesTestMixin, CreateView):
 		# In here we also set the initial state of the thesis
 		if self.request.user.has_perm("submissions.supervisor"):
 			form.instance.supervisor = self.request.user
-			form.instance.save()
-			form.instance.set_state_code("supervisor_approved", self.request.user)
+			state_code = "supervisor_approved"
 		else:
 			form.instance.author = self.request.user
-			form.instance.save()
-			form.instance.set_state_code("author_approved", self.request.user)
-		return super().form_valid(form)
+			state_code = "author_approved"
+		res = super().form_valid(form)
+		self.object.set_state_code(state_code, self.request.user)
+		return res
+
+
+class ThesisImport(UserPassesTestMixin, FormView):
+	"""Bulk import of thesis topics from a CSV or JSON file"""
+	form_class = forms.ThesisImportForm
+	template_name = "submissions/thesis_import.html"
+
+	def test_func(self):
+		return self.request.user.is_staff and self.request.user.has_perm("submissions.add_thesis")
+
+	def form_valid(self, form):
+		upload = form.cleaned_data["file"]
+		try:
+			rows = read_rows(upload, upload.name.lower())
+		except ValidationError as e:
+			form.add_error("file", e)
+			return self.form_invalid(form)
+
+		importer = ThesisImporter(rows, self.request.user)
+		if not importer.is_valid():
+			return self.render_to_response(self.get_context_data(form=form, errors=importer.errors))
+
+		theses = importer.save()
+		return self.render_to_response(self.get_context_data(form=self.form_class(), created=len(theses)))
 
 
 class ThesisUpdate(UserPassesTestMixin, UpdateView):
@@ -228,6 +268,45 @@ class ThesisEvaluation(UserPassesTestMixin, UpdateView):
 		return res
 
 
+class BulkEvaluation(UserPassesTestMixin, TemplateView):
+	"""Marks and closing states of all submitted theses of a subject and year on a single page"""
+	template_name = "submissions/thesis_evaluation_bulk.html"
+
+	def test_func(self):
+		return self.request.user.has_perm("submissions.change_thesis")
+
+	def setup(self, request, *args, **kwargs):
+		super().setup(request, *args, **kwargs)
+
+		self.subject = get_object_or_404(models.Subject, pk=self.kwargs["subject"])
+		year = self.request.GET.get("year", "")
+		self.year = int(year) if year.isdigit() else models.current_year()
+
+	def get_queryset(self):
+		submitted = [code for code, state in models.State.registry().items() if state.is_submitted and not state.is_closed]
+		return (Thesis.objects
+			.filter(subject__in=self.subject.subtree(), year=self.year, current_state__in=submitted)
+			.select_related("author")
+			.order_by("author__last_name", "author__first_name", "title"))
+
+	def get_context_data(self, **kwargs):
+		ctx = super().get_context_data(**kwargs)
+		ctx["subject"] = self.subject
+		ctx["year"] = self.year
+		ctx.setdefault("formset", forms.BulkEvaluationFormSet(queryset=self.get_queryset()))
+		return ctx
+
+	def post(self, request, *args, **kwargs):
+		formset = forms.BulkEvaluationFormSet(request.POST, queryset=self.get_queryset())
+		if formset.is_valid():
+			try:
+				formset.save(request.user)
+			except ValidationError as e:
+				return self.render_to_response(self.get_context_data(formset=formset, error=e.message))
+			return redirect("thesis-list", subject=self.subject.pk)
+		return self.render_to_response(self.get_context_data(formset=formset))
+
+
 class ConsultationCreate(UserPassesTestMixin, ThesisRelatedObjectCreate):
 	model = models.Consultation
 	form_class = forms.ConsultationForm
@@ -249,6 +328,112 @@ class ArchiveSearch(SearchView):
 	form_class = forms.SearchForm
 
 
+class ArchiveIndex(TemplateView):
+	"""A list of the years with public theses"""
+	template_name = "submissions/thesis_archive.html"
+
+	def get_context_data(self, **kwargs):
+		ctx = super().get_context_data()
+		ctx["years"] = Thesis.public_years()
+		return ctx
+
+
+class ArchiveYear(ListView):
+	"""A list of the public theses of one year"""
+	model = Thesis
+	template_name_suffix = "_archive_year"
+	allow_empty = False
+
+	def get_queryset(self):
+		return (Thesis.public
+			.filter(year=self.kwargs["year"])
+			.select_related("author", "subject")
+			.order_by("title"))
+
+	def get_context_data(self, **kwargs):
+		ctx = super().get_context_data()
+		ctx["year"] = self.kwargs["year"]
+		return ctx
+
+
+AUTOCOMPLETE_LIMIT = 10
+
+
+def autocomplete_keywords(prefix):
+	return list(models.Keyword.objects
+		.filter(prefix_filter("normalized", prefix))
+		.order_by("normalized")
+		.values_list("title", flat=True)
+		.distinct()[:AUTOCOMPLETE_LIMIT])
+
+
+def autocomplete_titles(prefix):
+	return list(Thesis.public
+		.filter(prefix_filter("normalized_title", prefix))
+		.order_by("normalized_title")
+		.values_list("title", flat=True)
+		.distinct()[:AUTOCOMPLETE_LIMIT])
+
+
+AUTOCOMPLETE_SOURCES = {
+	"keywords": autocomplete_keywords,
+	"titles": autocomplete_titles,
+}
+
+
+@require_GET
+def autocomplete(request, kind):
+	"""Return up to `AUTOCOMPLETE_LIMIT` keywords or public thesis titles starting with `q` as JSON"""
+	if kind not in AUTOCOMPLETE_SOURCES:
+		raise Http404
+
+	prefix = normalize(request.GET.get("q", "").strip())[:255]
+	if not prefix:
+		return JsonResponse({"results": []})
+
+	key = f"autocomplete:{kind}:{hashlib.md5(prefix.encode()).hexdigest()}"
+	results = cache.get(key)
+	record_cache("autocomplete", results is not None)
+	if results is None:
+		results = AUTOCOMPLETE_SOURCES[kind](prefix)
+		cache.set(key, results, settings.AUTOCOMPLETE_CACHE_TIMEOUT)
+
+	return JsonResponse({"results": results})
+
+
+SUBJECT_SEARCH_LIMIT = 20
+
+
+@require_GET
+def subjects(request):
+	"""
+		Return the children of the subject `parent` (the root subjects by default),
+		or with `q` the subjects whose label contains it, as JSON.
+		Served from the cached subject tree without touching the database.
+	"""
+	tree = models.Subject.tree()
+
+	def item(pk):
+		return {"id": pk, "title": tree["titles"][pk], "label": tree["labels"][pk], "children": pk in tree["children"]}
+
+	query = normalize(request.GET.get("q", "").strip())
+	if query:
+		pks = sorted(
+			(pk for pk, label in tree["normalized"].items() if query in label),
+			key=tree["labels"].get,
+		)[:SUBJECT_SEARCH_LIMIT]
+		return JsonResponse({"results": [item(pk) for pk in pks]})
+
+	parent = request.GET.get("parent")
+	if parent:
+		if not parent.isdigit() or int(parent) not in tree["labels"]:
+			raise Http404
+		parent = int(parent)
+	else:
+		parent = None
+	return JsonResponse({"results": [item(pk) for pk in tree["children"].get(parent, [])]})
+
+
 @login_required
 @require_POST
 def attachment_delete(request, thesis_pk, pk):